@@ -3,14 +3,30 @@ import click
 import re
 import os
 
-from utils.converters import MDSimple, MDQuote, MDList, MDCode, MDCleaner, MDReference, MDHeader
-from utils.errors_warnings import InputException, Warnings
+from utils.pipeline import convert_markdown
+from utils.errors_warnings import ConversionError, InputException, Warnings
+from utils.reader import read_markdown
+from utils.split import convert_split, stage_sections
+from utils.parallel import convert_parallel
 
 
-@click.command("md2tex")
+class Md2texCommand(click.Command):
+    """
+    a command that displays the conversion errors (see `ConversionError`) and exits with code 1
+    """
+    def invoke(self, ctx):
+        try:
+            return super().invoke(ctx)
+        except ConversionError as e:
+            click.echo(e.message, err=True)
+            ctx.exit(1)
+
+
+@click.command("md2tex", cls=Md2texCommand)
 @click.argument("inpath")
 @click.option("-o", "--output-path", "outpath", default=None,
-              help="optional. a custom output path. defaults to `output/{input_file_name}.md`.")
+              help="optional. a custom output path, or `-` for the standard output. defaults to "
+                   + "`output/{input_file_name}.md`, or to the standard output if the input is `-`.")
 @click.option("-c", "--complete-tex-file", "tex", is_flag=True, default=False,
               help="optional. if provided, a complete TeX file will be created from a template (with "
               + "preamble and tables of content). if not provided, only the contents of the markdown "
@@ -32,6 +48,15 @@ from utils.errors_warnings import InputException, Warnings
 @click.option("-d", "--document-class", "document_class", default="article",
               help="optional. sets the class of the TeX document. possible values "
                    + "are: `book`|`article`. defaults to `article`")
+@click.option("-s", "--split", "split", type=int, default=None,
+              help="optional. if provided, the document is cut before every header of this level "
+                   + "(1 for `#`) or above: every section is converted in parallel and written to "
+                   + "`md2x-sections/` next to the output file, which `\\input`s them in order. "
+                   + "defaults to `None`: a single TeX file is written.")
+@click.option("-p", "--parallel", "parallel", is_flag=True, default=False,
+              help="optional. if provided, the top-level blocks of a large document (1 MB and more) are "
+                   + "converted in parallel; the output is the same as with a sequential conversion. "
+                   + "defaults to `False`.")
 def md2tex(
         inpath: str,
         outpath=None,
@@ -39,7 +64,9 @@ def md2tex(
         template="utils/template.tex",
         french_quote=False,
         unnumbered=False,
-        document_class="article"
+        document_class="article",
+        split=None,
+        parallel=False
 ):
     """
     convert a Markdown file to a TeX file.
@@ -47,8 +74,8 @@ def md2tex(
     \b
     parameters (see options if you are in `--help` mode):
     -----------------------------------------------------
-    :param inpath: the path to the *.md file to convert to tex
-    :param outpath: the path to save the file to
+    :param inpath: the path to the *.md file to convert to tex, or `-` to read the standard input
+    :param outpath: the path to save the file to, or `-` to write to the standard output
     :param tex: a flag indicating wether to create a full tex file,
                 with preamble and table of contents
     :param template: a custom TeX template to use for the conversion, in order
@@ -63,52 +90,50 @@ def md2tex(
                      the headers are numbered by default.
     :param make_out_dirs: wether or not to create non-existant output directories
     :param document_class: the document class of the tex document. defaults to `article`
+    :param split: the header level at which to cut the document into section files.
+                  defaults to None: the document is written to a single file
+    :param parallel: whether to convert the blocks of a large document in parallel
     :return: data, a string representation of the .md file converted to .tex
     """
     # ==================== PROCESS THE ARGUMENTS ==================== #
-    if not re.search(r"\.md$", inpath):
+    if inpath != "-" and not re.search(r"\.md$", inpath):
         raise InputException("not_md", inpath)
-    if not os.path.isfile(inpath):
+    if inpath != "-" and not os.path.isfile(inpath):
         raise InputException("not_inpath", inpath)
-    if outpath is None:
+    if outpath is None and inpath == "-":
+        outpath = "-"  # a filter: standard input to standard output
+    if outpath == "-":
+        if split:
+            raise InputException("split_stdout", outpath)
+    elif outpath is None:
         outpath = "output/" + re.sub(r'\..+?$', '.tex', basename(inpath))  # build default outpath
     elif "/" in outpath and "\\" in outpath:
         raise InputException("outpath_slashes", outpath)  # gnu-linux escapes backslashes so this shouldn't be called
     elif os.path.isdir(outpath):  # if the output path is a dir and not a file, save the file to that dir
         outpath = f"{outpath}/{basename(inpath)}"
-    if not re.search(r"\.tex$", outpath):
+    if outpath != "-" and not re.search(r"\.tex$", outpath):
         # add a .tex extension if it doesn't exist or if a different extension was
         # provided by the user
         Warnings("outpath_extension", outpath)
         outpath = re.sub(r"$", ".tex", outpath)
     if not re.search("^(book|article)$", document_class):
-        InputException("document_class", document_class)
+        raise InputException("document_class", document_class)
 
     # build output directory
-    if not os.path.exists("./output"):
+    if outpath != "-" and not os.path.exists("./output"):
         os.makedirs("./output")
 
     # open file and read contents
-    with open(inpath, mode="r") as fh:
-        data = fh.read()
+    data = read_markdown(inpath)
 
     # ==================== CONVERT THE FILE ==================== #
-    # complex replacements
-    data = MDCode.block_code(data)  # the contents of code blocks must be interpreted verbatim;
-    #                                 this function comes first so that they won't be changed
-    #                                 by `prepare_markdown()`
-    data, codedict = MDCleaner.prepare_markdown(data)  # escape special chars + remove code envs from the pipeline
-    data = MDQuote.inline_quote(data, french_quote)
-    data = MDQuote.block_quote(data)
-    data = MDList.unordered_l(data)
-    data = MDList.ordered_l(data)
-    data = MDReference.footnote(data)
-    data = MDHeader.convert(data, unnumbered, document_class)
-
-    # "simple" replacements. simple_sub contains regexes as keys
-    # and values, facilitating the regex replacement
-    data = MDSimple.convert(data)
-    data = MDCleaner.clean_tex(data, codedict)  # clean the tex file + reinject the escaped code blocks
+    if split:
+        data, sections = convert_split(data, split, french_quote, unnumbered, document_class)
+        stage_sections(os.path.dirname(os.path.abspath(outpath)), sections)
+    elif parallel:
+        data = convert_parallel(data, french_quote, unnumbered, document_class)
+    else:
+        data = convert_markdown(data, french_quote, unnumbered, document_class)
 
     # ==================== BUILD + WRITE OUTPUT TO FILE ==================== #
     if tex is True:  # create full tex file.
@@ -122,6 +147,9 @@ def md2tex(
                     data = data.replace("@@DOCUMENTCLASSTOKEN@@", document_class)
         except FileNotFoundError:
             raise InputException("not_template", template)
+    if outpath == "-":
+        click.echo(data, nl=False)
+        return data
     try:
         with open(outpath, mode="w") as fh:
             fh.write(data)
@@ -12,13 +12,30 @@ import subprocess
 import shutil
 from pathlib import Path
 from typing import Optional, Dict, List
+import functools
 import json
 import tempfile
 import sys
+import time
 
-from utils.converters import MDSimple, MDQuote, MDList, MDCode, MDCleaner, MDReference, MDHeader
-from utils.arxiv_converters import ArxivEnhancedConverter
-from utils.errors_warnings import InputException, Warnings
+from utils.pipeline import Features, convert_markdown
+from utils.converters import MDHeader
+from utils.arxiv_converters import ArxivEnhancedConverter, ArxivTableInclude, ArxivCitation
+from utils.bibtex import BibIndex, BblWriter
+from utils.errors_warnings import ConversionError, InputException, Warnings
+from utils.reader import MarkdownReader, read_markdown
+from utils.project import BookProject
+from utils.build import BuildProject
+from utils.batch import job_limit, job_priorities, run_batch
+from utils.split import convert_split, remove_stale_sections
+from utils.parallel import convert_parallel
+from utils.images import ImageOptimizer
+from utils.watch import RebuildScheduler
+from utils.preview import changed_sections, load_snapshot, preview_path, save_snapshot
+from utils.latex import compile_latex, latex_command, latex_engine, preview_source
+from utils.docx import write_docx
+from utils.helpers import write_if_changed, copy_if_changed
+from utils.metrics import Metrics, run_process
 
 
 class UniversalConverter:
@@ -35,26 +52,72 @@ class UniversalConverter:
             'rst': 'reStructuredText',
             'arxiv': 'ArXiv-ready LaTeX package'
         }
+        # files generated during the last conversion (e.g., CSV tables) that must be
+        # copied next to the .tex file: {path relative to the .tex file: source path}
+        self.generated_files = {}
+        # the section files of a `--split` conversion, a part of generated_files
+        self.sections = {}
+        # diagnostics of the last LaTeX compilation: [{level, file, line, message}]
+        self.diagnostics = []
+        # feature bitmap and stage timings of the last conversion, with the `profile` option
+        self.features = 0
+        self.profile = []
     
     def convert_to_tex(self, content: str, options: Dict) -> str:
         """Convert markdown to LaTeX"""
-        # Use existing md2tex converters
-        data = MDCode.block_code(content)
-        data, codedict = MDCleaner.prepare_markdown(data)
-        data = MDQuote.inline_quote(data, options.get('french_quote', False))
-        data = MDQuote.block_quote(data)
-        data = MDList.unordered_l(data)
-        data = MDList.ordered_l(data)
-        data = MDReference.footnote(data)
-        data = MDHeader.convert(data, options.get('unnumbered', False), 
-                               options.get('document_class', 'article'))
-        data = MDSimple.convert(data)
-        data = MDCleaner.clean_tex(data, codedict)
+        self.generated_files = {}
+        self.sections = {}
+        self.profile = []
+        includes = {}
+        if options.get('optimize_images'):
+            # Point the document at downscaled, metadata-free copies of its images
+            content, images = ImageOptimizer.rewrite(content, options.get('base_dir', '.'),
+                                                     options.get('image_dpi', 300), jobs=options.get('jobs'))
+            self.generated_files.update(images)
+        if options.get('split') and not options.get('arxiv_mode', False):
+            # Convert the sections in parallel; the body `\input`s them
+            data, self.sections = convert_split(content, options['split'], options.get('french_quote', False),
+                                                options.get('unnumbered', False),
+                                                options.get('document_class', 'article'), options.get('jobs'))
+            self.generated_files.update(self.sections)
+            return data
+        if options.get('split'):
+            Warnings('split_arxiv', str(options['split']))
+        arxiv_mode = options.get('arxiv_mode', False)
+        if arxiv_mode:
+            # Render `!table[...](file.csv)` includes before the core pipeline escapes them
+            content, includes = ArxivTableInclude.expand(content, options.get('base_dir', '.'))
+            self.generated_files.update(includes.values())
+            # Read the title, authors, abstract and bibliography from the markdown
+            arxiv_result, content = self.arxiv_converter.front_matter(
+                content, options.get('metadata'), options.get('french_quote', False),
+                options.get('unnumbered', False), options.get('document_class', 'article'),
+                bool(options.get('bibliography')))
+
+        # Pre-scan the constructs of the document: the stages it doesn't use are skipped
+        profile = self.profile if options.get('profile') else None
+        start = time.perf_counter()
+        self.features = Features.scan(content)
+        if profile is not None:
+            profile.append({'stage': 'Features.scan', 'seconds': time.perf_counter() - start, 'skipped': None})
         
-        # Apply ArXiv enhancements if needed
-        if options.get('arxiv_mode', False):
-            arxiv_result = self.arxiv_converter.convert_for_arxiv(data, options.get('metadata'))
-            
+        # Use existing md2tex converters, with the ArXiv stages in ArXiv mode; large
+        # documents can be converted block by block
+        if options.get('parallel'):
+            start = time.perf_counter()
+            data = convert_parallel(content, options.get('french_quote', False), options.get('unnumbered', False),
+                                    options.get('document_class', 'article'), options.get('jobs'),
+                                    arxiv=arxiv_mode, longtable_threshold=options.get('longtable_threshold'))
+            if profile is not None:  # the stages run in the workers: only their total is known
+                profile.append({'stage': 'convert_parallel', 'seconds': time.perf_counter() - start,
+                                'skipped': None})
+        else:
+            data = convert_markdown(content, options.get('french_quote', False),
+                                    options.get('unnumbered', False),
+                                    options.get('document_class', 'article'), self.features, profile,
+                                    arxiv_mode, options.get('longtable_threshold'))
+        
+        if arxiv_mode:
             # Use ArXiv template
             template_path = options.get('template')
             if not template_path:
@@ -67,86 +130,184 @@ class UniversalConverter:
                 template = f.read()
             
             # Replace tokens
-            tex_content = template.replace('@@BODYTOKEN@@', arxiv_result['body'])
+            tex_content = template.replace('@@BODYTOKEN@@', data)
             tex_content = tex_content.replace('@@TITLEBLOCK@@', arxiv_result['title_block'])
             tex_content = tex_content.replace('@@ABSTRACT@@', arxiv_result['abstract'])
-            tex_content = tex_content.replace('@@BIBLIOGRAPHY@@', arxiv_result['bibliography'])
+            bibliography = arxiv_result['bibliography']
+            if not bibliography and options.get('bibliography'):
+                bibliography = '\\bibliography{references}'
+            tex_content = tex_content.replace('@@BIBLIOGRAPHY@@', bibliography)
             tex_content = tex_content.replace('@@DOCUMENTCLASSTOKEN@@', 
                                             options.get('document_class', 'article'))
+            tex_content = ArxivTableInclude.inject(tex_content, includes)
             
             return tex_content
         
         return data
     
-    def convert_to_pdf(self, content: str, options: Dict, output_path: str) -> bool:
-        """Convert markdown to PDF via LaTeX"""
+    def stage_generated_files(self, dest_dir: str):
+        """Copy the files generated by the last conversion next to its .tex file"""
+        for relpath, source in self.generated_files.items():
+            target = os.path.join(dest_dir, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            copy_if_changed(source, target)
+        if self.sections:
+            remove_stale_sections(dest_dir, self.sections)
+    
+    def convert(self, content, output_format: str, output_path: str, options: Dict) -> bool:
+        """Convert markdown to any supported format and write it to output_path
+        
+        Text outputs are only rewritten when their content changes. An output_path of `-`
+        writes to the standard output. content is a string, or for DOCX a MarkdownReader
+        (see `read_input()`).
+        """
+        if output_path == '-':
+            return self.convert_to_stdout(content, output_format, options)
+        success = False
+        try:
+            success = self.convert_to_file(content, output_format, output_path, options)
+        finally:
+            if Metrics.enabled():
+                written = f"{output_path}.tar.gz" if output_format == 'arxiv' else output_path
+                size = os.path.getsize(content.path) if isinstance(content, MarkdownReader) else len(
+                    content.encode('utf-8'))
+                Metrics.document(output_format, success, size,
+                                 os.path.getsize(written) if success and os.path.isfile(written) else 0)
+        return success
+    
+    def convert_to_file(self, content: str, output_format: str, output_path: str, options: Dict) -> bool:
+        """Convert markdown to any supported format and write it to output_path"""
+        if output_format == 'tex':
+            tex_content = self.convert_to_tex(content, options)
+            write_if_changed(output_path, tex_content)
+            self.stage_generated_files(os.path.dirname(os.path.abspath(output_path)))
+            return True
+        elif output_format == 'pdf':
+            return self.convert_to_pdf(content, options, output_path)
+        elif output_format == 'html':
+            html_content = self.convert_to_html(content, options)
+            write_if_changed(output_path, html_content)
+            return True
+        elif output_format == 'docx':
+            return self.convert_to_docx(content, options, output_path)
+        elif output_format == 'arxiv':
+            return self.convert_to_arxiv(content, options, output_path)
+        click.echo(f"Format {output_format} not yet implemented", err=True)
+        return False
+    
+    def convert_to_stdout(self, content: str, output_format: str, options: Dict) -> bool:
+        """Convert markdown and write the result to the standard output
+        
+        Binary formats are built in a temporary directory and streamed; the files that
+        a TeX output includes (tables, images) are written to the current directory.
+        """
+        if options.get('split'):
+            raise InputException('split_stdout', '-')
+        if output_format in ('tex', 'html'):
+            if output_format == 'tex':
+                output = self.convert_to_tex(content, options)
+                self.stage_generated_files(os.getcwd())
+            else:
+                output = self.convert_to_html(content, options)
+            click.echo(output, nl=False)
+            if Metrics.enabled():
+                Metrics.document(output_format, True, len(content.encode('utf-8')), len(output.encode('utf-8')))
+            return True
+        if output_format in ('pdf', 'docx'):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                output = os.path.join(tmpdir, f"document.{output_format}")
+                if not self.convert(content, output_format, output, options):
+                    return False
+                with open(output, 'rb') as f:
+                    shutil.copyfileobj(f, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+            return True
+        click.echo(f"Format {output_format} can't be written to the standard output", err=True)
+        return False
+    
+    def complete_tex(self, tex_content: str, options: Dict) -> str:
+        """Wrap a TeX body in the LaTeX template, unless it is already a complete document"""
+        if '\\documentclass' in tex_content:
+            return tex_content
+        template_path = options.get('template')
+        if not template_path:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            template_path = os.path.join(script_dir, 'utils', 'template.tex')
+        with open(template_path, 'r') as f:
+            template = f.read()
+        return template.replace('@@BODYTOKEN@@', tex_content).replace(
+            '@@DOCUMENTCLASSTOKEN@@', options.get('document_class', 'article'))
+    
+    def prepare_pdf(self, content: str, options: Dict, tmpdir: str) -> str:
+        """Write document.tex and the files it needs to a compilation directory
+        
+        Returns the TeX document.
+        """
         # First convert to TeX
-        tex_content = self.convert_to_tex(content, options)
+        tex_content = self.complete_tex(self.convert_to_tex(content, options), options)
+        if options.get('preview'):
+            tex_content = preview_source(tex_content)
+        tex_file = os.path.join(tmpdir, 'document.tex')
         
+        # Write TeX content
+        with open(tex_file, 'w') as f:
+            f.write(tex_content)
+        self.stage_generated_files(tmpdir)
+        
+        # Give bibtex only the cited entries of the bibliography
+        if options.get('bibliography'):
+            BibIndex(options['bibliography']).prune(ArxivCitation.cited_keys(tex_content),
+                                                    os.path.join(tmpdir, 'references.bib'))
+        
+        # Copy any required files (images, bibliography, etc.)
+        if options.get('resources_dir'):
+            for file in Path(options['resources_dir']).glob('*'):
+                shutil.copy(file, tmpdir)
+        return tex_content
+    
+    def convert_to_pdf(self, content: str, options: Dict, output_path: str) -> bool:
+        """Convert markdown to PDF via LaTeX"""
         # Create temporary directory for LaTeX compilation
         with tempfile.TemporaryDirectory() as tmpdir:
-            tex_file = os.path.join(tmpdir, 'document.tex')
-            
-            # Write TeX content
-            with open(tex_file, 'w') as f:
-                f.write(tex_content)
-            
-            # Copy any required files (images, bibliography, etc.)
-            if options.get('resources_dir'):
-                for file in Path(options['resources_dir']).glob('*'):
-                    shutil.copy(file, tmpdir)
+            tex_content = self.prepare_pdf(content, options, tmpdir)
             
             # Compile LaTeX to PDF
             try:
-                # Run pdflatex multiple times for references
-                for _ in range(3):
-                    result = subprocess.run(
-                        ['pdflatex', '-interaction=nonstopmode', 'document.tex'],
-                        cwd=tmpdir,
-                        capture_output=True,
-                        text=False,
-                        encoding=None
-                    )
-                    if result.returncode != 0:
-                        click.echo(f"pdflatex error: {result.stderr}", err=True)
-                        # Save log file for debugging
-                        log_file = os.path.join(tmpdir, 'document.log')
-                        if os.path.exists(log_file):
-                            with open(log_file, 'r', encoding='latin-1') as f:
-                                click.echo("LaTeX log:", err=True)
-                                click.echo(f.read()[-2000:], err=True)  # Last 2000 chars of log
-                
-                # Run bibtex if bibliography exists
-                if '\\bibliography' in tex_content or '\\addbibresource' in tex_content:
-                    subprocess.run(['bibtex', 'document'], cwd=tmpdir, capture_output=True, text=False, encoding=None)
-                    # Run pdflatex again after bibtex
-                    for _ in range(2):
-                        subprocess.run(
-                            ['pdflatex', '-interaction=nonstopmode', 'document.tex'],
-                            cwd=tmpdir,
-                            capture_output=True,
-                            text=False,
-                            encoding=None
-                        )
+                # Run pdflatex several times for references; only the last pass writes the PDF.
+                # The output is parsed while pdflatex runs: a fatal error stops the build, other
+                # errors are reported and the PDF is still written
+                self.diagnostics = compile_latex(tex_content, tmpdir, options)
+                if options.get('diagnostics'):
+                    write_if_changed(options['diagnostics'], json.dumps(self.diagnostics, indent=2) + "\n")
+                errors = [d for d in self.diagnostics if d['level'] == 'error']
+                for d in errors:
+                    location = ":".join(str(x) for x in (d['file'], d['line'], d.get('column')) if x is not None)
+                    click.echo(f"LaTeX error: {location + ': ' if location else ''}{d['message']}", err=True)
+                if options.get('verbose'):
+                    for d in self.diagnostics:
+                        if d['level'] != 'error':
+                            click.echo(f"LaTeX {d['level']}: {d['message']}", err=True)
                 
                 # Copy PDF to output location
                 pdf_file = os.path.join(tmpdir, 'document.pdf')
                 if os.path.exists(pdf_file):
-                    shutil.copy(pdf_file, output_path)
+                    copy_if_changed(pdf_file, output_path)
                     return True
                 else:
-                    click.echo("Error: PDF generation failed", err=True)
+                    if not errors:
+                        click.echo("Error: PDF generation failed", err=True)
                     return False
                     
             except FileNotFoundError:
-                click.echo("Error: pdflatex not found. Please install a LaTeX distribution.", err=True)
+                click.echo(f"Error: {latex_engine(tex_content)} not found. Please install a LaTeX distribution.",
+                           err=True)
                 return False
     
     def convert_to_html(self, content: str, options: Dict) -> str:
         """Convert markdown to HTML using pandoc"""
         try:
             # Use pandoc for high-quality HTML conversion
-            result = subprocess.run(
+            result = run_process(
                 ['pandoc', '-f', 'markdown', '-t', 'html5', '--standalone',
                  '--mathjax', '--highlight-style=pygments'],
                 input=content,
@@ -183,23 +344,35 @@ class UniversalConverter:
             click.echo(f"Error in pandoc conversion: {e.stderr}", err=True)
             return ""
     
-    def convert_to_docx(self, content: str, options: Dict, output_path: str) -> bool:
-        """Convert markdown to DOCX using pandoc"""
-        try:
-            result = subprocess.run(
-                ['pandoc', '-f', 'markdown', '-t', 'docx', '-o', output_path],
-                input=content,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            return True
-        except FileNotFoundError:
-            click.echo("Error: pandoc not found. Please install pandoc for DOCX conversion.", err=True)
+    def convert_to_docx(self, content, options: Dict, output_path: str) -> bool:
+        """Convert markdown to DOCX, in process
+
+        The document is streamed into the DOCX package as its blocks are recognized;
+        images are embedded from the directory of the markdown file. With a MarkdownReader
+        as content, the file is read block by block instead of as a whole.
+        """
+        write_docx(content, output_path, options.get('french_quote', False), options.get('base_dir', '.'))
+        return True
+    
+    def write_bbl(self, tex_content: str, bib_path: str, bbl_path: str) -> bool:
+        """Write the .bbl file of a document without running LaTeX/bibtex
+        
+        Returns False if the built-in writer can't write the .bbl of bibtex (an
+        unsupported bibliography style, or cited entries with a crossref), in which
+        case nothing is written.
+        """
+        style = re.search(r'\\bibliographystyle\{([^}]*)\}', tex_content)
+        style = style.group(1).strip() if style else 'plain'
+        if style not in BblWriter.styles:
             return False
-        except subprocess.CalledProcessError as e:
-            click.echo(f"Error in DOCX conversion: {e.stderr}", err=True)
+        
+        keys = ArxivCitation.cited_keys(tex_content)
+        entries, preambles = BibIndex(bib_path).parse(keys)
+        if not BblWriter.can_render(entries, keys, style):
             return False
+        bbl = BblWriter.render(entries, keys, style, preambles)
+        write_if_changed(bbl_path, bbl)
+        return True
     
     def convert_to_arxiv(self, content: str, options: Dict, output_dir: str) -> bool:
         """Create ArXiv-ready submission package"""
@@ -214,39 +387,58 @@ class UniversalConverter:
         
         # Write main.tex
         tex_file = os.path.join(output_dir, 'main.tex')
-        with open(tex_file, 'w') as f:
-            f.write(tex_content)
+        write_if_changed(tex_file, tex_content)
+        self.stage_generated_files(output_dir)
         
-        # Create bibliography file if needed
+        # Create bibliography file if needed, restricted to the cited entries
         if options.get('bibliography'):
             bib_file = os.path.join(output_dir, 'references.bib')
-            shutil.copy(options['bibliography'], bib_file)
+            BibIndex(options['bibliography']).prune(ArxivCitation.cited_keys(tex_content), bib_file)
         
-        # Copy figures if any
+        # Copy figures if any, optimized when they keep their format
         if options.get('figures_dir'):
-            for fig in Path(options['figures_dir']).glob('*'):
-                if fig.suffix in ['.png', '.jpg', '.pdf', '.eps']:
-                    shutil.copy(fig, output_dir)
+            figures = [fig for fig in Path(options['figures_dir']).glob('*')
+                       if fig.suffix in ['.png', '.jpg', '.pdf', '.eps']]
+            optimized = {}
+            if options.get('optimize_images'):
+                optimized = ImageOptimizer.optimize_all([str(fig) for fig in figures],
+                                                        options.get('image_dpi', 300), jobs=options.get('jobs'))
+            for fig in figures:
+                source = optimized.get(str(fig), str(fig))
+                if Path(source).suffix != fig.suffix:
+                    source = str(fig)
+                copy_if_changed(source, os.path.join(output_dir, fig.name))
         
-        # Try to compile to generate .bbl file
-        try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                # Copy files to temp dir
-                for file in Path(output_dir).glob('*'):
-                    shutil.copy(file, tmpdir)
+        # Write main.bbl directly from the .bib file when the bibliography style is
+        # supported; otherwise fall back to a pdflatex + bibtex round-trip
+        bbl_written = False
+        if options.get('bibliography'):
+            bbl_written = self.write_bbl(tex_content, options['bibliography'],
+                                         os.path.join(output_dir, 'main.bbl'))
+        
+        if not bbl_written:
+            try:
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    # Copy files to temp dir
+                    for file in Path(output_dir).glob('*'):
+                        if file.is_dir():
+                            shutil.copytree(file, os.path.join(tmpdir, file.name))
+                        else:
+                            shutil.copy(file, tmpdir)
                 
-                # Compile
-                subprocess.run(['pdflatex', 'main.tex'], cwd=tmpdir, capture_output=True, check=True)
-                if os.path.exists(os.path.join(tmpdir, 'references.bib')):
-                    subprocess.run(['bibtex', 'main'], cwd=tmpdir, capture_output=True)
-                    subprocess.run(['pdflatex', 'main.tex'], cwd=tmpdir, capture_output=True)
+                    # Compile
+                    latex = latex_command(tex_content, tmpdir, options)
+                    run_process(latex + ['main.tex'], cwd=tmpdir, capture_output=True, check=True)
+                    if os.path.exists(os.path.join(tmpdir, 'references.bib')):
+                        run_process(['bibtex', 'main'], cwd=tmpdir, capture_output=True)
+                        run_process(latex + ['main.tex'], cwd=tmpdir, capture_output=True)
                 
-                # Copy .bbl file back
-                bbl_file = os.path.join(tmpdir, 'main.bbl')
-                if os.path.exists(bbl_file):
-                    shutil.copy(bbl_file, output_dir)
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            click.echo("Note: pdflatex not available, skipping .bbl generation", err=False)
+                    # Copy .bbl file back
+                    bbl_file = os.path.join(tmpdir, 'main.bbl')
+                    if os.path.exists(bbl_file):
+                        shutil.copy(bbl_file, output_dir)
+            except (FileNotFoundError, subprocess.CalledProcessError):
+                click.echo("Note: pdflatex not available, skipping .bbl generation", err=False)
         
         # Remove .bib file (ArXiv uses .bbl)
         bib_path = os.path.join(output_dir, 'references.bib')
@@ -262,14 +454,262 @@ class UniversalConverter:
         return True
 
 
-@click.command()
-@click.argument('input_file', type=click.Path(exists=True))
+def make_options(input_file: str, template: Optional[str] = None, arxiv: bool = False,
+                 french_quotes: bool = False, unnumbered: bool = False,
+                 document_class: str = 'article', bibliography: Optional[str] = None,
+                 figures: Optional[str] = None, metadata: Optional[str] = None,
+                 longtable_threshold: Optional[int] = None, preamble_cache: bool = False,
+                 preview: bool = False, diagnostics: Optional[str] = None,
+                 split: Optional[int] = None, jobs: Optional[int] = None,
+                 optimize_images: bool = False, image_dpi: int = 300,
+                 profile: bool = False, parallel: bool = False, verbose: bool = False) -> Dict:
+    """Build the conversion options of UniversalConverter from md2x arguments"""
+    # Load metadata if provided
+    metadata_dict = {}
+    if metadata:
+        with open(metadata, 'r') as f:
+            metadata_dict = json.load(f)
+    
+    return {
+        'french_quote': french_quotes,
+        'unnumbered': unnumbered,
+        'document_class': document_class,
+        'arxiv_mode': arxiv,
+        'bibliography': bibliography,
+        'figures_dir': figures,
+        'metadata': metadata_dict,
+        'template': template,
+        'base_dir': os.path.dirname(os.path.abspath(input_file)),
+        'longtable_threshold': longtable_threshold,
+        'preamble_cache': preamble_cache,
+        'preview': preview,
+        'diagnostics': diagnostics,
+        'split': split,
+        'jobs': jobs,
+        'optimize_images': optimize_images,
+        'image_dpi': image_dpi,
+        'profile': profile,
+        'parallel': parallel,
+        'verbose': verbose
+    }
+
+
+def print_profile(converter: UniversalConverter):
+    """Print the stage timings of the last conversion of a converter"""
+    if not converter.profile:
+        click.echo("Profile: no stage timings (the sections of --split are converted in worker processes)",
+                   err=True)
+        return
+    click.echo(f"Profile (features: {Features.describe(converter.features)}):", err=True)
+    total = 0.0
+    for entry in converter.profile:
+        total += entry['seconds']
+        timing = f"skipped (no {entry['skipped']})" if entry['skipped'] else f"{entry['seconds'] * 1000:9.2f} ms"
+        click.echo(f"  {entry['stage']:34} {timing}", err=True)
+    click.echo(f"  {'total':34} {total * 1000:9.2f} ms", err=True)
+
+
+def default_output_path(input_file: str, output_format: str) -> str:
+    """Output path used when none is given: next to the current directory, named after the input"""
+    base_name = Path(input_file).stem
+    if output_format == 'arxiv':
+        return f"{base_name}_arxiv"
+    elif output_format in ['tex', 'pdf', 'html', 'docx']:
+        return f"{base_name}.{output_format}"
+    return f"{base_name}_output"
+
+
+def read_input(input_file: str, output_format: str):
+    """Read the input of a conversion
+    
+    DOCX output is streamed from the file block by block (`MarkdownReader.blocks()`):
+    a reader is returned instead of the whole document.
+    """
+    if output_format == 'docx' and input_file != '-':
+        return MarkdownReader(input_file)
+    return read_markdown(input_file)
+
+
+def _build_target(target: Dict) -> bool:
+    """Build one output of an `md2x build` project; module-level so that it runs in worker processes"""
+    try:
+        options = make_options(target['input'], **target['options'])
+        content = read_input(target['input'], target['format'])
+        return UniversalConverter().convert(content, target['format'], target['output'], options)
+    except Exception as e:
+        click.echo(f"Error building {target['output']}: {e}", err=True)
+        return False
+
+
+def _watch_build(input_file: str, output_format: str, output_path: str, options: Dict):
+    """Rebuild the output of `--watch`; module-level so that it runs in a child process"""
+    click.echo("\nFile changed, reconverting...")
+    try:
+        content = read_input(input_file, output_format)
+        success = UniversalConverter().convert(content, output_format, output_path, options)
+    except ConversionError as e:  # keep watching: the next save may fix the document
+        click.echo(e.message, err=True)
+        success = False
+    except Exception as e:
+        click.echo(f"Error: {e or type(e).__name__}", err=True)
+        success = False
+    if success:
+        click.echo(f"✓ Conversion successful: {output_path}")
+    else:
+        click.echo("✗ Conversion failed", err=True)
+
+
+def _watch_preview(input_file: str, output_path: str, options: Dict):
+    """Compile the sections changed since the last preview; module-level so that it runs in a child process"""
+    content = read_markdown(input_file)
+    previous = load_snapshot(input_file)
+    sections = changed_sections(previous, content) if previous is not None else []
+    if not sections:
+        save_snapshot(input_file, content)
+        return
+    started = time.perf_counter()
+    # A single pass from the cached preamble format, with the frames of the images
+    preview_options = dict(options, arxiv_mode=False, preview=True, preamble_cache=True,
+                           split=None, diagnostics=None)
+    path = preview_path(output_path)
+    try:
+        success = UniversalConverter().convert_to_pdf("\n\n".join(md for _, md in sections), preview_options, path)
+    except ConversionError as e:
+        click.echo(e.message, err=True)
+        success = False
+    except Exception as e:
+        click.echo(f"Error: {e or type(e).__name__}", err=True)
+        success = False
+    if success:
+        save_snapshot(input_file, content)
+        click.echo(f"✓ Preview of {', '.join(name for name, _ in sections)}: {path} "
+                   f"({time.perf_counter() - started:.1f}s)")
+    else:
+        click.echo("✗ Preview failed", err=True)
+
+
+# The options of an `md2x stream` record: `make_options()` parameters, `metadata` (an object)
+# and `complete` (wrap the TeX body in the template)
+STREAM_OPTIONS = ('template', 'arxiv', 'french_quotes', 'unnumbered', 'document_class',
+                  'longtable_threshold', 'metadata', 'complete', 'profile')
+
+
+def _stream_record(converter: UniversalConverter, line: str) -> Dict:
+    """Convert the document of an NDJSON record: `{id, markdown, options}` -> `{id, tex|error, timings}`
+    
+    Errors are returned as records: a bad document never stops the stream.
+    """
+    start = time.perf_counter()
+    parsed = None
+    result = {'id': None}
+    try:
+        record = json.loads(line)
+        if not isinstance(record, dict) or not isinstance(record.get('markdown'), str):
+            raise ValueError("expected an object with a `markdown` string")
+        result['id'] = record.get('id')
+        record_options = dict(record.get('options') or {})
+        unknown = sorted(set(record_options) - set(STREAM_OPTIONS))
+        if unknown:
+            raise ValueError(f"unknown options: {', '.join(unknown)}")
+        metadata = record_options.pop('metadata', None) or {}
+        complete = record_options.pop('complete', False)
+        options = make_options('-', **record_options)
+        options['metadata'] = metadata
+        parsed = time.perf_counter()
+        tex = converter.convert_to_tex(record['markdown'], options)
+        result['tex'] = converter.complete_tex(tex, options) if complete else tex
+    except ConversionError as e:
+        result['error'] = e.to_dict()
+    except Exception as e:  # JSON errors, bad options: reported like conversion errors
+        result['error'] = {'error': type(e).__name__, 'message': str(e)}
+    end = time.perf_counter()
+    if parsed and Metrics.enabled():
+        Metrics.document('tex', 'tex' in result, len(record['markdown'].encode('utf-8')),
+                         len(result.get('tex', '').encode('utf-8')))
+    result['timings'] = {
+        'parse': round((parsed or end) - start, 6),
+        'convert': round(end - parsed, 6) if parsed else 0.0,
+        'total': round(end - start, 6),
+    }
+    if 'tex' in result and options.get('profile'):
+        result['timings']['stages'] = {e['stage']: round(e['seconds'], 6) for e in converter.profile
+                                       if not e['skipped']}
+    return result
+
+
+def _prepare_batch_job(job: Dict, tmpdir: str) -> Optional[str]:
+    """Convert the document of an `md2x batch` job; module-level so that it runs in worker processes
+    
+    Returns the TeX document of a PDF job; a DOCX job is written directly, without LaTeX.
+    """
+    if job.get('format') == 'docx':
+        UniversalConverter().convert_to_docx(MarkdownReader(job['input']), job['options'],
+                                             os.path.join(tmpdir, 'document.docx'))
+        return None
+    return UniversalConverter().prepare_pdf(read_markdown(job['input']), job['options'], tmpdir)
+
+
+class DefaultCommandGroup(click.Group):
+    """Command group that runs its default command when no subcommand is given
+    
+    This keeps `md2x paper.md -f pdf` working next to `md2x build`.
+    """
+    default_command = 'convert'
+    
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] not in ctx.help_option_names:
+            args = [self.default_command] + list(args)
+        return super().parse_args(ctx, args)
+    
+    def invoke(self, ctx):
+        """Run a command, displaying its conversion errors with exit code 1"""
+        try:
+            return super().invoke(ctx)
+        except ConversionError as e:
+            click.echo(e.message, err=True)
+            ctx.exit(1)
+
+
+def _start_metrics(ctx, param, value):
+    """Export the metrics of the run, and of its worker processes, to the textfile of --metrics"""
+    if value:
+        Metrics.start(value)
+    return value
+
+
+# Shared by the commands that convert documents; the MD2X_METRICS variable sets it for all of them
+metrics_option = click.option(
+    '--metrics', type=click.Path(dir_okay=False), default=None, expose_value=False, callback=_start_metrics,
+    help='Write OpenMetrics counters and histograms of the run to this textfile, '
+         'refreshed every MD2X_METRICS_INTERVAL seconds (default: 15)')
+
+
+@click.group(cls=DefaultCommandGroup)
+def md2x():
+    """
+    md2x - Universal Markdown Converter
+    
+    Convert Markdown files to various formats optimized for academic use.
+    `md2x INPUT_FILE` is a shortcut for `md2x convert INPUT_FILE`.
+    
+    Examples:
+        md2x paper.md -f pdf
+        md2x paper.md -f arxiv -o submission/
+        md2x paper.md -f html --watch
+        md2x build md2x.json
+    """
+    if os.environ.get('MD2X_METRICS'):
+        Metrics.start(os.environ['MD2X_METRICS'])
+
+
+@md2x.command('convert')
+@click.argument('input_file', type=click.Path(exists=True, allow_dash=True))
 @click.option('-f', '--format', 'output_format', 
               type=click.Choice(['tex', 'pdf', 'html', 'docx', 'epub', 'rst', 'arxiv']),
               default='tex',
               help='Output format (default: tex)')
 @click.option('-o', '--output', 'output_path',
-              help='Output file/directory path')
+              help='Output file/directory path, or - for the standard output')
 @click.option('-t', '--template', 
               help='Custom LaTeX template file')
 @click.option('--arxiv', is_flag=True,
@@ -287,135 +727,318 @@ class UniversalConverter:
               help='Directory containing figures')
 @click.option('--metadata', type=click.Path(exists=True),
               help='JSON file with document metadata')
+@click.option('--longtable-threshold', type=int, default=None,
+              help='Number of table rows above which a longtable is used (ArXiv mode, default: 50)')
+@click.option('--preamble-cache', is_flag=True,
+              help='PDF: start LaTeX from a cached, precompiled format of the preamble')
+@click.option('--preview', is_flag=True,
+              help='PDF: fast preview for watch mode, a single LaTeX pass with draft images')
+@click.option('--live-preview', is_flag=True,
+              help='PDF watch mode: compile the sections changed by every save to OUTPUT.preview.pdf, '
+                   'while the full build runs in the background at a lower priority')
+@click.option('--diagnostics', type=click.Path(), default=None,
+              help='PDF: write the errors and warnings of LaTeX to this JSON file')
+@click.option('--split', type=click.IntRange(1, 6), default=None, metavar='LEVEL',
+              help='TeX/PDF: write every section of this header level to its own .tex file, '
+                   'converted in parallel, and \\input them from the main file')
+@click.option('--parallel', is_flag=True,
+              help='Convert the blocks of a large document (1 MB and more) in parallel, '
+                   'with the same output as the sequential conversion')
+@click.option('--optimize-images', is_flag=True,
+              help='Downscale the images to their print resolution and strip their metadata (cached)')
+@click.option('--image-dpi', type=int, default=300,
+              help='Print resolution of --optimize-images, in pixels per inch (default: 300)')
+@click.option('--project', is_flag=True,
+              help='INPUT_FILE is a JSON manifest listing the chapters of a book')
+@click.option('--include-only', 'include_only', multiple=True,
+              help='Project mode: only typeset this chapter in the PDF (repeatable)')
+@click.option('-j', '--jobs', type=int, default=None,
+              help='Number of worker processes (default: number of CPUs)')
 @click.option('--watch', is_flag=True,
               help='Watch for changes and auto-convert')
+@click.option('--profile', is_flag=True,
+              help='Print the time of every conversion stage, and the stages skipped '
+                   'because the document does not use their constructs')
+@metrics_option
 @click.option('-v', '--verbose', is_flag=True,
               help='Verbose output')
-def md2x(input_file, output_format, output_path, template, arxiv, 
+def convert(input_file, output_format, output_path, template, arxiv, 
          french_quotes, unnumbered, document_class, bibliography,
-         figures_dir, metadata, watch, verbose):
+         figures_dir, metadata, longtable_threshold, preamble_cache, preview, live_preview, diagnostics,
+         split, parallel, optimize_images, image_dpi, project, include_only, jobs, watch, profile, verbose):
     """
-    md2x - Universal Markdown Converter
+    Convert a Markdown file (or a book project) to another format.
     
-    Convert Markdown files to various formats optimized for academic use.
-    
-    Examples:
-        md2x paper.md -f pdf
-        md2x paper.md -f arxiv -o submission/
-        md2x paper.md -f html --watch
+    INPUT_FILE `-` reads the standard input, which is converted to the
+    standard output unless -o is given.
     """
+    if input_file == '-' and (project or watch):
+        click.echo("Error: --project and --watch need an input file, not the standard input", err=True)
+        sys.exit(1)
     
-    converter = UniversalConverter()
     
-    # Load metadata if provided
-    metadata_dict = {}
-    if metadata:
-        with open(metadata, 'r') as f:
-            metadata_dict = json.load(f)
+    # Multi-file book project: convert the changed chapters, then compile if needed
+    if project:
+        book = BookProject(input_file, output_path)
+        converted = book.build(jobs)
+        if verbose:
+            click.echo(f"Converted {len(converted)} of {len(book.chapters)} chapters: "
+                       + ", ".join(converted))
+        if output_format == 'pdf':
+            pdf = book.compile(book.chapter_names(include_only) if include_only else None)
+            if pdf is None:
+                click.echo("✗ Conversion failed", err=True)
+                sys.exit(1)
+            click.echo(f"✓ Conversion successful: {pdf}")
+        elif output_format == 'tex':
+            click.echo(f"✓ Conversion successful: {os.path.join(book.output_dir, 'master.tex')}")
+        else:
+            click.echo(f"Format {output_format} is not supported for projects", err=True)
+            sys.exit(1)
+        return
+    
+    if live_preview and (not watch or output_format != 'pdf'):
+        click.echo("Error: --live-preview requires --watch and -f pdf", err=True)
+        sys.exit(1)
+    
+    converter = UniversalConverter()
     
     # Prepare options
-    options = {
-        'french_quote': french_quotes,
-        'unnumbered': unnumbered,
-        'document_class': document_class,
-        'arxiv_mode': arxiv,
-        'bibliography': bibliography,
-        'figures_dir': figures_dir,
-        'metadata': metadata_dict,
-        'template': template,
-        'verbose': verbose
-    }
+    options = make_options(input_file, template, arxiv, french_quotes, unnumbered,
+                           document_class, bibliography, figures_dir, metadata,
+                           longtable_threshold, preamble_cache, preview, diagnostics, split, jobs,
+                           optimize_images, image_dpi, profile, parallel, verbose)
     
     # Read input file
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read()
+    content = read_input(input_file, output_format)
     
     # Determine output path if not specified
     if not output_path:
-        base_name = Path(input_file).stem
-        if output_format == 'arxiv':
-            output_path = f"{base_name}_arxiv"
-        elif output_format in ['tex', 'pdf', 'html', 'docx']:
-            output_path = f"{base_name}.{output_format}"
-        else:
-            output_path = f"{base_name}_output"
+        output_path = '-' if input_file == '-' else default_output_path(input_file, output_format)
+    to_stdout = output_path == '-'  # then the messages go to stderr
     
     # Convert based on format
     if verbose:
-        click.echo(f"Converting {input_file} to {output_format}...")
+        click.echo(f"Converting {input_file} to {output_format}...", err=to_stdout)
     
-    success = False
-    
-    if output_format == 'tex':
-        tex_content = converter.convert_to_tex(content, options)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(tex_content)
-        success = True
-        
-    elif output_format == 'pdf':
-        success = converter.convert_to_pdf(content, options, output_path)
-        
-    elif output_format == 'html':
-        html_content = converter.convert_to_html(content, options)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        success = True
-        
-    elif output_format == 'docx':
-        success = converter.convert_to_docx(content, options, output_path)
-        
-    elif output_format == 'arxiv':
-        success = converter.convert_to_arxiv(content, options, output_path)
-    
-    else:
-        click.echo(f"Format {output_format} not yet implemented", err=True)
+    success = converter.convert(content, output_format, output_path, options)
+    if profile:
+        print_profile(converter)
     
     if success:
-        click.echo(f"✓ Conversion successful: {output_path}")
+        click.echo(f"✓ Conversion successful: {output_path}", err=to_stdout)
     else:
         click.echo("✗ Conversion failed", err=True)
-        return 1
+        sys.exit(1)
     
-    # Watch mode
+    # Watch mode: a scheduler coalesces the file events and rebuilds in a child process,
+    # killed (with its pdflatex or pandoc runs) when a newer change arrives
     if watch:
         click.echo(f"Watching {input_file} for changes... (Ctrl+C to stop)")
         from watchdog.observers import Observer
         from watchdog.events import FileSystemEventHandler
         
+        watched = os.path.abspath(input_file)
+        scheduler = RebuildScheduler(
+            functools.partial(_watch_build, input_file, output_format, output_path, options),
+            on_cancel=lambda: click.echo("Build cancelled: newer change"),
+            niceness=10 if live_preview else 0)
+        schedulers = [scheduler]
+        if live_preview:
+            # The preview of the changed sections runs first; the full build lags behind it
+            save_snapshot(input_file, content)
+            schedulers.append(RebuildScheduler(functools.partial(_watch_preview, input_file, output_path, options)))
+            click.echo(f"Live preview: {preview_path(output_path)}")
+        
         class ChangeHandler(FileSystemEventHandler):
-            def on_modified(self, event):
-                if event.src_path == input_file:
-                    click.echo(f"\nFile changed, reconverting...")
-                    # Recursive call to md2x
-                    ctx = click.get_current_context()
-                    ctx.invoke(md2x, input_file=input_file, 
-                             output_format=output_format,
-                             output_path=output_path,
-                             template=template,
-                             arxiv=arxiv,
-                             french_quotes=french_quotes,
-                             unnumbered=unnumbered,
-                             document_class=document_class,
-                             bibliography=bibliography,
-                             figures_dir=figures_dir,
-                             metadata=metadata,
-                             watch=False,
-                             verbose=verbose)
+            """Forward the changes of the input file to the scheduler
+            
+            Editors save with several events (write, truncate, or write to a temporary
+            file and rename it), all coalesced by the scheduler.
+            """
+            def on_any_event(self, event):
+                paths = (event.src_path, getattr(event, 'dest_path', None))
+                if event.event_type in ('modified', 'created', 'moved') and watched in (
+                        os.path.abspath(p) for p in paths if p):
+                    for scheduler in schedulers:
+                        scheduler.notify()
         
-        handler = ChangeHandler()
         observer = Observer()
-        observer.schedule(handler, path=os.path.dirname(input_file) or '.', recursive=False)
+        observer.schedule(ChangeHandler(), path=os.path.dirname(watched), recursive=False)
+        for scheduler in schedulers:
+            scheduler.start()
         observer.start()
         
         try:
-            import time
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
             observer.stop()
+            for scheduler in schedulers:
+                scheduler.stop()
             click.echo("\nStopped watching.")
         observer.join()
 
 
+@md2x.command('build')
+@click.argument('project_file', default='md2x.json', type=click.Path(exists=True))
+@click.option('-j', '--jobs', type=int, default=None,
+              help='Number of worker processes (default: number of CPUs)')
+@click.option('--force', is_flag=True,
+              help='Rebuild every output, even the up-to-date ones')
+@click.option('-n', '--dry-run', is_flag=True,
+              help='Only list the outputs that would be rebuilt')
+@metrics_option
+@click.option('-v', '--verbose', is_flag=True,
+              help='Verbose output')
+def build(project_file, jobs, force, dry_run, verbose):
+    """
+    Rebuild the stale outputs of a project file (default: md2x.json).
+    
+    An output is rebuilt when it is missing or when one of its inputs
+    (Markdown, template, metadata, bibliography, figures, tables) or its
+    options changed since the last build. Stale outputs are built in parallel.
+    """
+    project = BuildProject(project_file)
+    if dry_run:
+        stale, fresh, _ = project.plan(force)
+        for target in stale:
+            click.echo(f"stale: {os.path.relpath(target['output'])}")
+        if verbose:
+            for target in fresh:
+                click.echo(f"up to date: {os.path.relpath(target['output'])}")
+        return
+    
+    built, failed, fresh = project.build(_build_target, jobs, force)
+    if verbose:
+        for target in fresh:
+            click.echo(f"up to date: {os.path.relpath(target['output'])}")
+    click.echo(f"✓ {len(built)} built, {len(fresh)} up to date, {len(failed)} failed")
+    if failed:
+        for target in failed:
+            click.echo(f"✗ {os.path.relpath(target['output'])}", err=True)
+        sys.exit(1)
+
+
+@md2x.command('outline')
+@click.argument('input_file', type=click.Path(exists=True))
+@click.option('-o', '--output', 'output_path', type=click.Path(), default=None,
+              help='Write the outline to this JSON file (default: standard output)')
+@click.option('--flat', is_flag=True,
+              help='Write the heading index as a flat list instead of a tree')
+def outline(input_file, output_path, flat):
+    """
+    Export the headers of a Markdown file as a JSON outline.
+    
+    Every header has its level, text, offset in the file and a generated
+    label; in the tree, the headers below it are in `children`.
+    """
+    headings = MDHeader.index(read_markdown(input_file), escaped=False)
+    data = json.dumps(headings if flat else MDHeader.outline(headings), indent=2) + "\n"
+    if output_path:
+        write_if_changed(output_path, data)
+    else:
+        click.echo(data, nl=False)
+
+
+@md2x.command('batch')
+@click.argument('input_files', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('-f', '--format', 'output_format', type=click.Choice(['pdf', 'docx']), default='pdf',
+              help='Output format (default: pdf)')
+@click.option('-o', '--output-dir', type=click.Path(), default=None,
+              help='Directory of the outputs (default: next to every input)')
+@click.option('-t', '--template', type=click.Path(exists=True),
+              help='Custom LaTeX template')
+@click.option('--bibliography', type=click.Path(exists=True),
+              help='BibTeX bibliography file')
+@click.option('--preamble-cache', is_flag=True,
+              help='Start LaTeX from a cached, precompiled format of the preamble')
+@click.option('-j', '--jobs', type=int, default=None,
+              help='Number of concurrent compilations (default: number of CPUs), within the memory bound')
+@click.option('--memory-per-job', type=int, default=512, show_default=True,
+              help='Memory reserved for a compilation, in MB')
+@click.option('--order', type=click.Choice(['priority', 'size', 'input']), default='priority',
+              help='Start order: by priority then size, by size, or as given (default: priority)')
+@click.option('--priority', 'priorities', multiple=True, metavar='PATTERN=N',
+              help='Priority of the inputs matching a glob pattern; higher starts first (repeatable)')
+@click.option('--timings', type=click.Path(), default=None,
+              help='Write the results and timings of the jobs to this JSON file')
+@metrics_option
+@click.option('-v', '--verbose', is_flag=True,
+              help='Verbose output')
+def batch(input_files, output_format, output_dir, template, bibliography, preamble_cache, jobs, memory_per_job,
+          order, priorities, timings, verbose):
+    """
+    Build the PDFs of many Markdown files concurrently.
+    
+    The LaTeX compile chains run under an asyncio scheduler. The number of
+    concurrent compilations is the number of CPUs (or --jobs), bounded by the
+    available memory (--memory-per-job). With --format docx, the documents are
+    written in process, without LaTeX.
+    """
+    try:
+        levels = job_priorities(list(input_files), priorities)
+    except ValueError:
+        raise click.BadParameter('expected PATTERN=N', param_hint='--priority')
+    batch_jobs = []
+    for input_file, priority in zip(input_files, levels):
+        output = default_output_path(input_file, output_format)
+        if output_dir:
+            output = os.path.join(output_dir, os.path.basename(output))
+        options = make_options(input_file, template, bibliography=bibliography, preamble_cache=preamble_cache)
+        batch_jobs.append({'input': input_file, 'output': output, 'options': options, 'priority': priority,
+                           'format': output_format})
+    
+    limit = job_limit(memory_per_job, jobs)
+    if verbose:
+        click.echo(f"Building {len(batch_jobs)} {output_format.upper()}s, {limit} at a time...")
+    start = time.perf_counter()
+    results = run_batch(batch_jobs, _prepare_batch_job, limit, order)
+    elapsed = time.perf_counter() - start
+    
+    click.echo(f"{'':2}{'output':40} {'queued':>8} {'convert':>8} {'latex':>8} {'total':>8}")
+    for result in results:
+        t = result['timings']
+        click.echo(f"{'✓' if result['ok'] else '✗'} {os.path.relpath(result['output']):40} "
+                   f"{t['queued']:8.2f} {t['convert']:8.2f} {t['latex']:8.2f} {t['total']:8.2f}")
+        if result['error']:
+            click.echo(f"    {result['error']}", err=True)
+    failed = [r for r in results if not r['ok']]
+    click.echo(f"✓ {len(results) - len(failed)} built, {len(failed)} failed in {elapsed:.2f}s "
+               f"({limit} concurrent)")
+    if timings:
+        report = [{k: r[k] for k in ('input', 'output', 'priority', 'ok', 'error', 'timings', 'diagnostics')}
+                  for r in results]
+        write_if_changed(timings, json.dumps(report, indent=2) + "\n")
+    if failed:
+        sys.exit(1)
+
+
+@md2x.command('stream')
+@click.argument('input_file', default='-', type=click.Path(exists=True, allow_dash=True))
+@click.option('-o', '--output', 'output_path', default='-', type=click.Path(allow_dash=True),
+              help='Write the results to this file (default: standard output)')
+@metrics_option
+def stream(input_file, output_path):
+    """
+    Convert a stream of NDJSON documents to TeX in a single process.
+    
+    Every line of INPUT_FILE (default: standard input) is a JSON record
+    `{"id": ..., "markdown": "...", "options": {...}}`; a line
+    `{"id": ..., "tex": "..."}` or `{"id": ..., "error": {...}}`, with the
+    `timings` of the conversion, is written for it, in order, as soon as it
+    is converted. The options are those of `md2x convert`: template, arxiv,
+    french_quotes, unnumbered, document_class, longtable_threshold, metadata
+    (an object) and profile, plus complete (wrap the body in the template).
+    """
+    converter = UniversalConverter()
+    with click.open_file(input_file, 'r', encoding='utf-8') as source, \
+            click.open_file(output_path, 'w', encoding='utf-8') as output:
+        for line in source:
+            if line.strip():
+                output.write(json.dumps(_stream_record(converter, line), ensure_ascii=False) + "\n")
+                output.flush()  # the reader of a pipe gets every result at once
+
+
 if __name__ == '__main__':
     md2x()
\ No newline at end of file
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Pathological-input performance harness for the md2x/md2tex converters
+
+Every converter of `utils/converters.py` and `utils/arxiv_converters.py` is run on
+generated adversarial inputs (long lines, deep nesting, unterminated fences, thousands
+of footnotes...), both as raw Markdown and as escaped by `MDCleaner.prepare_markdown()`.
+Every input is generated at `--size` and at four times that size: a converter fails if its
+time grows more than `--max-ratio` times with its input (4 times for a linear converter, 16
+for a quadratic one), a ratio that holds on any machine. Every input is converted in a child
+process that is killed after `--timeout` seconds per MB, so that a converter that
+backtracks forever cannot hang the harness.
+
+With `--corpus`, the harness instead converts real documents with and without the
+feature pre-scan (`utils/pipeline.py`), checks that both outputs are identical and
+reports the time saved by the stages it skips.
+
+Usage:
+    python perf_harness.py                  # 0.5 and 2 MB inputs, at most 8x slower on 2 MB
+    python perf_harness.py --size 1 --max-ratio 6 -k footnote
+    python perf_harness.py --corpus README.md --corpus examples/sample_paper.md
+"""
+
+import inspect
+import multiprocessing
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import click
+
+from utils import arxiv_converters, converters
+from utils.arxiv_converters import (ArxivCitation, ArxivEnhancedConverter, ArxivMath, ArxivMetadata,
+                                    ArxivTable, ArxivTableInclude)
+from utils.converters import MDCleaner, MDCode, MDHeader, MDList, MDQuote, MDReference, MDSimple
+from utils.docx import DocxWriter
+from utils.pipeline import Features, convert_markdown
+
+
+# ---------------------------------------------------------------
+# Adversarial inputs: every generator returns about `size` characters
+# ---------------------------------------------------------------
+
+def _repeat(unit: str, size: int, head: str = "", tail: str = "") -> str:
+    return head + unit * max(1, (size - len(head) - len(tail)) // len(unit)) + tail
+
+
+def _nested_list(size: int) -> str:
+    depth = 200
+    block = "".join("  " * i + f"- item {i}\n" for i in range(depth)) + "\n"
+    return _repeat(block, size)
+
+
+GENERATORS: Dict[str, Callable[[int], str]] = {
+    'long_line': lambda size: _repeat("word ", size),
+    'long_line_quotes': lambda size: _repeat("a 'b ", size, head='"'),
+    'long_line_brackets': lambda size: _repeat("[1-2,3 [x](y ", size),
+    'list_then_text': lambda size: _repeat("plain text after the list\n", size, head="- item\n"),
+    'ordered_then_text': lambda size: _repeat("plain text after the list\n", size, head="1. item\n"),
+    'list_then_blank_lines': lambda size: _repeat("   \n", size, head="- item\n"),
+    'many_short_lists': lambda size: _repeat("- a\n- b\n\n1. c\n2. d\n\n", size),
+    'deep_nesting': _nested_list,
+    'deep_quotes': lambda size: _repeat(">" * 500 + " quote\n", size),
+    'unterminated_fence': lambda size: _repeat("code line\n", size, head="```python\n"),
+    'many_fences': lambda size: _repeat("```\n", size),
+    'footnote_pointers': lambda size: _repeat("text[^1] ", size, tail="\n\n[^1]: the note\n"),
+    'footnote_definitions': lambda size: "".join(
+        f"text[^{n}] " for n in range(size // 40)
+    ) + "\n\n" + "".join(f"[^{n}]: note {n}\n\n" for n in range(size // 40)),
+    'footnote_definitions_no_blank': lambda size: _repeat("[^1]: note\n", size, head="text[^1]\n\n"),
+    'table_rows': lambda size: _repeat("| a | b | c |\n", size, head="| h | i | j |\n|:--|:-:|--:|\n"),
+    'table_pipes': lambda size: _repeat("|", size),
+    'unclosed_math': lambda size: _repeat("x $", size, head="$$"),
+    'dollar_amounts': lambda size: _repeat("$5 or $", size),
+    'multiline_math': lambda size: _repeat("$x\n", size, head="$$"),
+    'headers': lambda size: _repeat("# title\n## Abstract\ntext\n", size),
+    'abstract_without_section': lambda size: _repeat("text\n", size, head="## Abstract\n\n"),
+    'authors_line': lambda size: _repeat("Name, ", size, head="**Authors:** "),
+    'special_characters': lambda size: _repeat("\\{}_^&%$#~@@ ", size),
+}
+
+
+# ---------------------------------------------------------------
+# Converters: every public static method of the converter classes
+# whose first parameter is `string` must be registered here
+# ---------------------------------------------------------------
+
+CONVERTERS: Dict[str, Callable[[str], object]] = {
+    'MDCleaner.prepare_markdown': MDCleaner.prepare_markdown,
+    'MDCleaner.clean_tex': lambda s: MDCleaner.clean_tex(s, {}),
+    'MDCode.block_code': MDCode.block_code,
+    'MDQuote.inline_quote': lambda s: MDQuote.inline_quote(s, False),
+    'MDQuote.block_quote': MDQuote.block_quote,
+    'MDList.blocks': lambda s: list(MDList.blocks(s, MDList.unordered_item, True)),
+    'MDList.replace_blocks': lambda s: MDList.replace_blocks(s, MDList.ordered_item, False, str.upper),
+    'MDList.unordered_l': MDList.unordered_l,
+    'MDList.ordered_l': MDList.ordered_l,
+    'MDReference.definitions': MDReference.definitions,
+    'MDReference.extract_notes': MDReference.extract_notes,
+    'MDReference.replace_pointers': lambda s: MDReference.replace_pointers(s, {}),
+    'MDReference.footnote': MDReference.footnote,
+    'MDHeader.convert': lambda s: MDHeader.convert(s, False, "article"),
+    'MDHeader.index': lambda s: MDHeader.index(s, escaped=False),
+    'MDSimple.convert': MDSimple.convert,
+    'ArxivMetadata.extract_title': ArxivMetadata.extract_title,
+    'ArxivMetadata.extract_authors': ArxivMetadata.extract_authors,
+    'ArxivMetadata.extract_abstract': ArxivMetadata.extract_abstract,
+    'ArxivMetadata.abstract_span': lambda s: ArxivMetadata.abstract_span(s, MDHeader.index(s, escaped=False)),
+    'ArxivMetadata.extract': ArxivMetadata.extract,
+    'ArxivTable.convert_tables': ArxivTable.convert_tables,
+    'ArxivTableInclude.expand': ArxivTableInclude.expand,
+    'ArxivTableInclude.inject': lambda s: ArxivTableInclude.inject(s, {}),
+    'ArxivMath.convert_math': ArxivMath.convert_math,
+    'ArxivMath.protect_math': lambda s: ArxivMath.protect_math(s, lambda tex: "@@CODETOKEN0@@"),
+    'ArxivCitation.convert_citations': ArxivCitation.convert_citations,
+    'ArxivCitation.cited_keys': ArxivCitation.cited_keys,
+    'ArxivCitation.extract_bibliography': ArxivCitation.extract_bibliography,
+    'ArxivEnhancedConverter.front_matter': lambda s: ArxivEnhancedConverter().front_matter(s),
+    'ArxivEnhancedConverter.convert_for_arxiv': lambda s: ArxivEnhancedConverter().convert_for_arxiv(s),
+    'DocxWriter.body': lambda s: DocxWriter(lambda xml: None).body(lambda: [s]),
+    'pipeline.convert_markdown': convert_markdown,  # the stages together
+    'Features.scan': Features.scan,
+}
+
+
+def discover_converters() -> List[str]:
+    """List the methods of the converter modules that take a markdown `string`"""
+    found = []
+    for module in (converters, arxiv_converters):
+        for cls_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            for name, member in vars(cls).items():
+                function = member.__func__ if isinstance(member, staticmethod) else member
+                if name.startswith('_') or not inspect.isfunction(function):
+                    continue
+                params = [p for p in inspect.signature(function).parameters if p != 'self']
+                if params and params[0] == 'string':
+                    found.append(f"{cls_name}.{name}")
+    return found
+
+
+# ---------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------
+
+SCALE = 4  # the large inputs are this many times larger than the small ones
+MIN_TIME = 0.02  # seconds: the shorter times of the small inputs are mostly noise
+
+def _make_input(generator: str, size: int, escaped: bool) -> str:
+    string = GENERATORS[generator](size)
+    if escaped:
+        string = MDCleaner.prepare_markdown(string)[0]
+    return string
+
+
+def _worker(conn, generator: str, size: int, escaped: bool, names: List[str]):
+    """Run converters one after the other on one input, sending every timing to the parent"""
+    string = _make_input(generator, size, escaped)
+    conn.send(len(string.encode("utf-8")))
+    for name in names:
+        error = None
+        start = time.perf_counter()
+        try:
+            CONVERTERS[name](string)
+        except Exception as e:  # a failure is timed all the same
+            error = type(e).__name__
+        conn.send((name, time.perf_counter() - start, error))
+    conn.close()
+
+
+def run_input(generator: str, size: int, escaped: bool, names: List[str],
+              timeout: float) -> List[Tuple[str, float, float, str]]:
+    """
+    Time every converter on one input
+
+    Returns (converter, seconds, seconds per MB, note) for every converter, in order; the
+    seconds are `None` for a converter killed after `timeout` seconds per MB.
+    """
+    results = []
+    pending = list(names)
+    while pending:
+        parent, child = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_worker, args=(child, generator, size, escaped, pending))
+        process.start()
+        child.close()
+        megabytes = parent.recv() / 1e6
+        limit = max(timeout * megabytes, 0.5)
+        while pending:
+            if not parent.poll(limit):
+                process.kill()
+                results.append((pending.pop(0), None, None, "killed"))
+                break
+            name, elapsed, error = parent.recv()
+            pending.pop(0)
+            results.append((name, elapsed, elapsed / megabytes, f"raised {error}" if error else ""))
+        process.join()
+        parent.close()
+    return results
+
+
+def run_pair(generator: str, size: int, escaped: bool, names: List[str],
+             timeout: float) -> List[Tuple[str, float, float, str]]:
+    """
+    Time every converter on an input of `size` characters and on one `SCALE` times as large
+
+    Returns (converter, seconds on the small input, seconds on the large one, note) for
+    every converter, in order; the seconds are `None` for a killed converter.
+    """
+    small = run_input(generator, size, escaped, names, timeout)
+    large = run_input(generator, SCALE * size, escaped, names, timeout)
+    return [(name, t1, t2, note2 or note1) for (name, t1, _, note1), (_, t2, _, note2) in zip(small, large)]
+
+
+def growth(small: float, large: float) -> float:
+    """The ratio of the times on the large and the small input; the times below `MIN_TIME` are noise"""
+    return large / max(small, MIN_TIME)
+
+
+def _best_time(function: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_corpus(paths: Tuple[str, ...], repeat: int) -> bool:
+    """
+    Convert every document of a corpus with every stage, then with the stages selected by
+    the feature pre-scan, and print the best time of both
+
+    Returns False if the outputs differ for a document.
+    """
+    identical = True
+    totals = [0.0, 0.0]
+    for path in paths:
+        with open(path, mode="r", encoding="utf-8") as fh:
+            string = fh.read()
+        full = convert_markdown(string, features=Features.ALL)
+        if convert_markdown(string) != full:
+            click.echo(f"✗ {path}: the output differs when stages are skipped", err=True)
+            identical = False
+        every = _best_time(lambda: convert_markdown(string, features=Features.ALL), repeat)
+        scanned = _best_time(lambda: convert_markdown(string), repeat)
+        totals[0] += every
+        totals[1] += scanned
+        click.echo(f"  {path:40} {len(string.encode('utf-8')) / 1000:8.1f} kB {every * 1000:8.2f} ms "
+                   f"-> {scanned * 1000:8.2f} ms  ({Features.describe(Features.scan(string))})")
+    click.echo(f"corpus: {totals[0] * 1000:.2f} ms -> {totals[1] * 1000:.2f} ms "
+               f"({totals[0] / max(totals[1], 1e-9):.2f}x)")
+    return identical
+
+
+@click.command()
+@click.option('--size', type=float, default=0.5,
+              help='Size of the small generated inputs in MB; the large ones are 4 times as big (default: 0.5)')
+@click.option('--max-ratio', 'max_ratio', type=float, default=8.0,
+              help='Largest time ratio between the large and the small input (default: 8)')
+@click.option('--timeout', type=float, default=30.0,
+              help='Seconds per MB after which a converter is killed and fails (default: 30)')
+@click.option('-k', '--select', 'select', default=None,
+              help='Only run the converters and inputs whose name contains this string')
+@click.option('-v', '--verbose', is_flag=True, help='Print every timing, not only the failures')
+@click.option('--corpus', multiple=True, type=click.Path(exists=True),
+              help='Time the feature pre-scan on this document instead (repeatable)')
+@click.option('--repeat', type=int, default=20, help='Runs per document of --corpus, the best is kept (default: 20)')
+def harness(size, max_ratio, timeout, select, verbose, corpus, repeat):
+    """Run every converter on adversarial inputs and check how its time grows with the input"""
+    if corpus:
+        if not run_corpus(corpus, repeat):
+            sys.exit(1)
+        return
+
+    missing = sorted(set(discover_converters()) - set(CONVERTERS))
+    if missing:
+        click.echo("✗ converters missing from the harness: " + ", ".join(missing), err=True)
+        sys.exit(1)
+
+    size = int(size * 1e6)
+    failures = 0
+    worst = (0.0, "")
+    for generator in GENERATORS:
+        names = [name for name in CONVERTERS
+                 if not select or select in name or select in generator]
+        for escaped in (False, True):
+            label = generator + (" (escaped)" if escaped else "")
+            for name, small, large, note in run_pair(generator, size, escaped, names, timeout):
+                if small is not None and large is not None and growth(small, large) > max_ratio:
+                    # measure again before failing: a busy machine slows down a single run
+                    _, small_again, large_again, note = run_pair(generator, size, escaped, [name], timeout)[0]
+                    if small_again is None or large_again is None:
+                        small = large = None
+                    else:
+                        small, large = min(small, small_again), min(large, large_again)
+                ratio = None if small is None or large is None else growth(small, large)
+                failed = ratio is None or ratio > max_ratio
+                failures += failed
+                if ratio is not None and ratio > worst[0]:
+                    worst = (ratio, f"{name} on {label}")
+                if failed or verbose:
+                    timing = "  timeout" if ratio is None else f"{small:7.3f} s -> {large:7.3f} s  x{ratio:5.2f}"
+                    click.echo(f"{'✗' if failed else ' '} {name:42} {label:40} {timing} {note}")
+
+    click.echo(f"worst: x{worst[0]:.2f} on a {SCALE} times larger input ({worst[1]})")
+    if failures:
+        click.echo(f"✗ {failures} conversions grew more than x{max_ratio} or timed out", err=True)
+        sys.exit(1)
+    click.echo(f"✓ every converter grew at most x{max_ratio} on a {SCALE} times larger input")
+
+
+if __name__ == '__main__':
+    harness()
@@ -41,6 +41,7 @@ setup(
         "full": [
             "pypandoc>=1.6",
             "python-docx>=0.8.0",
+            "Pillow>=9.0",
         ]
     },
     entry_points={
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# ---------------------------------------------------------------
+# the tests import md2x, md2tex and utils from the root of the
+# repository, and every test gets its own md2x cache directory
+# ---------------------------------------------------------------
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    """
+    an empty cache directory (`MD2X_CACHE_DIR`) for every test
+    """
+    root = tmp_path / "cache"
+    monkeypatch.setenv("MD2X_CACHE_DIR", str(root))
+    return root
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from md2x import UniversalConverter, make_options
+from utils.arxiv_converters import ArxivEnhancedConverter, ArxivTable, ArxivTableInclude
+from utils.errors_warnings import InputException
+
+document = """# A Title
+
+**Authors:** Jane Doe
+
+## Abstract
+
+The abstract.
+
+## Introduction
+
+As shown in [Vaswani2017], attention works. The cost is $O(n^2)$.
+
+| a | b |
+|---|--:|
+| 1 | 2 |
+
+## References
+
+[Vaswani2017] Vaswani, A., et al. (2017). Attention is all you need.
+"""
+
+
+def test_front_matter():
+    result = ArxivEnhancedConverter().convert_for_arxiv(document)
+    assert "A Title" in result["title_block"]
+    assert "Jane Doe" in result["title_block"]
+    assert result["abstract"] == "\\begin{abstract}\nThe abstract.\n\\end{abstract}\n"
+    assert "Abstract" not in result["body"]
+
+
+def test_body_stages():
+    body = ArxivEnhancedConverter().convert_for_arxiv(document)["body"]
+    assert "\\cite{Vaswani2017}" in body
+    assert "$O(n^2)$" in body  # math is kept verbatim
+    assert "\\midrule" in body
+
+
+def test_references_stay_without_a_bibliography_file():
+    result = ArxivEnhancedConverter().convert_for_arxiv(document)
+    assert result["bibliography"] == ""
+    assert "References" in result["body"]
+    assert "Attention is all you need." in result["body"]
+
+
+def test_references_replaced_by_a_bibliography_file():
+    result = ArxivEnhancedConverter().convert_for_arxiv(document, bibliography=True)
+    assert result["bibliography"] == "\\bibliography{references}"
+    assert "References" not in result["body"]
+    assert "Attention is all you need." not in result["body"]
+
+
+def test_tables():
+    tex = ArxivTable.convert_tables("before\n| a | b | c |\n|:--|:-:|--:|\n| 1 | 2 | 3 |\nafter")
+    assert tex == ("before\n\\begin{table}[h]\n\\centering\n\\begin{tabular}{lcr}\n\\toprule\na & b & c \\\\\n"
+                   "\\midrule\n1 & 2 & 3 \\\\\n\\bottomrule\n\\end{tabular}\n\\caption{Table caption}\n"
+                   "\\label{tab:label}\n\\end{table}\nafter")
+    assert ArxivTable.convert_tables("a | b\n|no line break|") == "a | b\n|no line break|"
+
+
+def test_longtables():
+    rows = "".join(f"| {i} | {i * i} |\n" for i in range(60))
+    tex = ArxivTable.convert_tables("| n | square |\n|---|---:|\n" + rows)
+    assert tex.startswith("\\begin{longtable}{lr}\n") and tex.endswith("59 & 3481 \\\\\n\\end{longtable}\n")
+    assert tex.count("n & square \\\\") == 2  # the header is repeated on every page
+    assert "\\begin{tabular}" in ArxivTable.convert_tables("| n | square |\n|---|---:|\n" + rows, 60)
+    # without a separator row, every row is in the body
+    tex = ArxivTable.convert_tables("| a | b |\n| 1 | 2 |\n", 1)
+    assert "\\midrule" not in tex and "\\endlastfoot\na & b \\\\\n1 & 2 \\\\\n" in tex
+
+
+def test_table_includes(tmp_path):
+    (tmp_path / "results.csv").write_text('name,score_%\n"a, b",1&2\n\nx,$5\n')
+    string, includes = ArxivTableInclude.expand("Text.\n\n!table[Results_1](results.csv)\n\nMore.\n",
+                                                str(tmp_path))
+    assert string == "Text.\n\n\n@@TABLEINCLUDE0@@\n\n\nMore.\n"
+    relpath, chunk = includes["@@TABLEINCLUDE0@@"]
+    assert relpath == "md2x-tables/" + os.path.basename(chunk)
+    with open(chunk) as fh:
+        tex = fh.read()
+    assert tex.startswith("\\begin{longtable}{ll}\n\\caption{Results\\_1}")
+    assert "name & score\\_\\% \\\\\n" in tex and "a, b & 1\\&2 \\\\\nx & \\$5 \\\\\n" in tex
+    assert ArxivTableInclude.inject("@@TABLEINCLUDE0@@", includes) == "\\input{" + relpath[:-4] + "}"
+
+    assert ArxivTableInclude.render(str(tmp_path / "results.csv"), "Results_1") == chunk  # cached
+    (tmp_path / "results.csv").write_text("a\tb\n1\t2\n")
+    os.rename(tmp_path / "results.csv", tmp_path / "results.tsv")
+    with open(ArxivTableInclude.render(str(tmp_path / "results.tsv"))) as fh:
+        assert "1 & 2 \\\\" in fh.read()
+    with pytest.raises(InputException):
+        ArxivTableInclude.expand("!table[x](missing.csv)\n", str(tmp_path))
+
+
+def test_table_includes_in_code_blocks(tmp_path):
+    (tmp_path / "results.csv").write_text("a,b\n1,2\n")
+    string = "```markdown\n!table[x](missing.csv)\n```\n\n!table[y](results.csv)\n"
+    expanded, includes = ArxivTableInclude.expand(string, str(tmp_path))
+    assert list(includes) == ["@@TABLEINCLUDE0@@"]
+    assert expanded == "```markdown\n!table[x](missing.csv)\n```\n\n\n@@TABLEINCLUDE0@@\n\n"
+
+
+def test_table_includes_in_the_package(tmp_path):
+    (tmp_path / "results.csv").write_text("name,score\na,1\n")
+    options = make_options(str(tmp_path / "paper.md"))
+    output = tmp_path / "package"
+    UniversalConverter().convert_to_arxiv("# T\n\n!table[Res](results.csv)\n\ntext\n", options, str(output))
+    chunks = os.listdir(output / "md2x-tables")
+    assert len(chunks) == 1
+    assert f"\\input{{md2x-tables/{chunks[0][:-4]}}}" in (output / "main.tex").read_text()
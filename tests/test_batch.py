@@ -0,0 +1,72 @@
+import os
+import stat
+
+import pytest
+
+from md2x import _prepare_batch_job, make_options
+from utils import batch
+from utils.batch import job_limit, job_priorities, order_jobs, run_batch
+
+MB = 1024 * 1024
+
+
+def test_job_limit(monkeypatch):
+    monkeypatch.setattr(batch, "available_memory", lambda: 3 * 512 * MB + 1)
+    assert job_limit(512, jobs=8) == 3  # bounded by the memory
+    assert job_limit(512, jobs=2) == 2
+    assert job_limit(0, jobs=8) == 8
+    monkeypatch.setattr(batch, "available_memory", lambda: 100 * MB)
+    assert job_limit(512, jobs=8) == 1  # at least one
+    monkeypatch.setattr(batch, "available_memory", lambda: None)
+    assert job_limit(512) == (os.cpu_count() or 1)
+
+
+def test_order_jobs(tmp_path):
+    jobs = []
+    for name, size, priority in (("small", 10, 0), ("large", 1000, 0), ("urgent", 1, 5), ("medium", 100, 0)):
+        (tmp_path / f"{name}.md").write_text("x" * size)
+        jobs.append({"input": str(tmp_path / f"{name}.md"), "priority": priority})
+    jobs.append({"input": str(tmp_path / "missing.md"), "priority": 0})
+
+    def names(ordered):
+        return [os.path.basename(job["input"])[:-3] for job in ordered]
+
+    assert names(order_jobs(jobs)) == ["urgent", "large", "medium", "small", "missing"]
+    assert names(order_jobs(jobs, "size")) == ["large", "medium", "small", "urgent", "missing"]
+    assert order_jobs(jobs, "input") == jobs
+
+
+def test_job_priorities():
+    inputs = ["papers/a.md", "papers/draft-b.md", "c.md"]
+    assert job_priorities(inputs, ("papers/*=1", "draft-*=-1")) == [1, -1, 0]
+    assert job_priorities(inputs, ()) == [0, 0, 0]
+    with pytest.raises(ValueError):
+        job_priorities(inputs, ("papers/*=high",))
+
+
+@pytest.fixture
+def engines(tmp_path, monkeypatch):
+    """
+    fake LaTeX engines on the PATH, writing the PDF of any document
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for engine in ("pdflatex", "xelatex"):
+        script = bin_dir / engine
+        script.write_text("#!/bin/sh\necho 'Output written on document.pdf'\ntouch document.pdf\n")
+        script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+
+def test_bad_documents_fail_alone(tmp_path, engines):
+    (tmp_path / "good.md").write_text("# Good\n\ntext\n")
+    (tmp_path / "bad.md").write_text("    - a\n- b\n")  # inconsistent list indentation
+    jobs = [{"input": str(tmp_path / f"{name}.md"), "output": str(tmp_path / "out" / f"{name}.pdf"),
+             "options": make_options(str(tmp_path / f"{name}.md"))} for name in ("bad", "missing", "good")]
+    results = run_batch(jobs, _prepare_batch_job, limit=2, order="input")
+    assert [r["ok"] for r in results] == [False, False, True]
+    assert "inconsistant indentation" in results[0]["error"]
+    assert results[1]["error"] == f"{tmp_path / 'missing.md'} not found"
+    assert results[2]["error"] is None and (tmp_path / "out" / "good.pdf").exists()
+    for result in results:
+        assert set(result["timings"]) == {"queued", "convert", "latex", "total"}
@@ -0,0 +1,131 @@
+import pytest
+
+from md2x import UniversalConverter
+from utils.bibtex import BblWriter, BibBlocks, BibIndex, BibNames, BibParser
+
+bib = r"""@string{acm = "ACM Press"}
+@preamble{"\newcommand{\noop}[1]{}"}
+@article{knuth84, author = {Knuth, Donald E.}, title = {Literate {P}rogramming: An Overview},
+  journal = {The Computer Journal}, volume = 27, number = {2}, pages = {97-111}, year = 1984, month = may}
+@book{lamport86, author = "Leslie Lamport", title = "{\LaTeX}: A Document Preparation System",
+  publisher = acm, year = "1986"}
+@inproceedings{vaswani17, author = {Ashish Vaswani and Noam Shazeer and Niki Parmar and others},
+  title = {Attention Is All You Need}, crossref = {nips17}, pages = {5998--6008}, year = {2017},
+  booktitle = {Advances in Neural Information Processing Systems}, editor = {I. Guyon and U. von Luxburg}}
+@proceedings{nips17, title = {Advances in Neural Information Processing Systems}, year = {2017},
+  editor = {I. Guyon and U. von Luxburg}}
+@misc{knuth84b, author = {Donald Knuth}, title = {Another}, year = {1984}, howpublished = {Online}}
+"""
+cited = ["vaswani17", "lamport86", "knuth84", "knuth84b"]
+
+
+def bibitems(bbl: str):
+    return [line for line in bbl.splitlines() if line.startswith("\\bibitem")]
+
+
+def test_parse():
+    entries, preambles = BibParser.parse(bib)
+    assert sorted(entries) == ["knuth84", "knuth84b", "lamport86", "nips17", "vaswani17"]
+    assert preambles == ["\\newcommand{\\noop}[1]{}"]
+    assert entries["lamport86"].fields == {"author": "Leslie Lamport",
+                                           "title": "{\\LaTeX}: A Document Preparation System",
+                                           "publisher": "ACM Press", "year": "1986"}
+    assert entries["knuth84"].get("month") == "May" and entries["knuth84"].get("volume") == "27"
+
+
+def test_styles():
+    entries, preambles = BibParser.parse(bib)
+    assert bibitems(BblWriter.render(entries, cited, "plain")) == [
+        "\\bibitem{knuth84b}", "\\bibitem{knuth84}", "\\bibitem{lamport86}", "\\bibitem{vaswani17}"]
+    assert bibitems(BblWriter.render(entries, cited, "unsrt")) == [f"\\bibitem{{{key}}}" for key in cited]
+    alpha = BblWriter.render(entries, cited, "alpha", preambles)
+    assert alpha.startswith("\\newcommand{\\etalchar}[1]{$^{#1}$}\n\\newcommand{\\noop}[1]{}\n"
+                            "\\begin{thebibliography}{VSP{\\etalchar{+}}17}\n")
+    assert bibitems(alpha) == ["\\bibitem[Knu84a]{knuth84b}", "\\bibitem[Knu84b]{knuth84}",
+                               "\\bibitem[Lam86]{lamport86}", "\\bibitem[VSP{\\etalchar{+}}17]{vaswani17}"]
+    assert bibitems(BblWriter.render(entries, ["lamport86", "*"], "unsrt"))[:2] == [
+        "\\bibitem{lamport86}", "\\bibitem{knuth84}"]
+    with pytest.raises(ValueError):
+        BblWriter.render(entries, cited, "apalike")
+
+
+def test_alpha_labels():
+    entries, _ = BibParser.parse(r"""
+@book{neumann45, author = {John von Neumann}, title = {First Draft}, year = 1945}
+@article{lvns86, author = {Leslie Lamport and John von Neumann and Smith, Jr, Jane}, title = {T}, year = 1986}
+@article{five, author = {A. Able and B. Baker and C. Cole and D. Dunn and E. Eve}, title = {T}, year = 1990}
+@article{accent, author = {Ahmet {\"O}zt{\"u}rk}, title = {T}, year = 2001}
+@proceedings{proc, organization = {The Foundation}, title = {P}, year = 2003}
+@misc{nobody, title = {T}, year = {2004}}
+""")
+    bbl = BblWriter.render(entries, ["*"], "alpha")
+    assert bibitems(bbl) == ["\\bibitem[ABC{\\etalchar{+}}90]{five}", "\\bibitem[Fou03]{proc}",
+                             "\\bibitem[LvNS86]{lvns86}", "\\bibitem[nob04]{nobody}",
+                             "\\bibitem[{\\\"O}zt01]{accent}", "\\bibitem[vN45]{neumann45}"]
+
+
+def test_entries():
+    entries, _ = BibParser.parse(bib)
+    bbl = BblWriter.render(entries, cited, "plain")
+    assert ("\\bibitem{knuth84}\nDonald E.~Knuth.\n\\newblock Literate {P}rogramming: An overview.\n"
+            "\\newblock {\\em The Computer Journal}, 27(2):97--111, May 1984.\n") in bbl
+    assert ("\\bibitem{vaswani17}\nAshish~Vaswani, Noam~Shazeer, Niki~Parmar, et~al.\n"
+            "\\newblock Attention is all you need.\n\\newblock In I.~Guyon and U.~von~Luxburg, editors, "
+            "{\\em Advances in Neural Information Processing Systems}, pages 5998--6008, 2017.\n") in bbl
+    assert "\\newblock {\\em {\\LaTeX}: A Document Preparation System}.\n\\newblock ACM Press, 1986.\n" in bbl
+
+
+def test_names():
+    assert BibNames.parse("Ludwig van Beethoven") == BibNames.parse("van Beethoven, Ludwig") == (
+        "Ludwig", "van", "Beethoven", "")
+    assert BibNames.parse("Knuth, Jr, Donald") == ("Donald", "", "Knuth", "Jr")
+    assert BibNames.split("{Barnes and Noble} and Jane Doe") == ["{Barnes and Noble}", "Jane Doe"]
+    assert BibNames.format("Ludwig van Beethoven and Knuth, Jr, Donald and A. B. Other") == (
+        "Ludwig~van~Beethoven, Donald~Knuth, Jr, and A. B.~Other")
+    assert BibBlocks.title("The {TeX}book: A Guide") == "The {TeX}book: A guide"
+
+
+def test_write_bbl(tmp_path):
+    (tmp_path / "references.bib").write_text(bib)
+    tex = "\\cite{knuth84,lamport86}\n\\bibliographystyle{unsrt}\n\\bibliography{references}\n"
+    converter = UniversalConverter()
+    assert converter.write_bbl(tex, str(tmp_path / "references.bib"), str(tmp_path / "main.bbl"))
+    assert bibitems((tmp_path / "main.bbl").read_text()) == ["\\bibitem{knuth84}", "\\bibitem{lamport86}"]
+    assert not converter.write_bbl(tex.replace("unsrt", "apalike"), str(tmp_path / "references.bib"),
+                                   str(tmp_path / "other.bbl"))
+    assert not (tmp_path / "other.bbl").exists()
+    tex = tex.replace("lamport86", "vaswani17")  # an entry with a crossref: left to bibtex
+    assert not converter.write_bbl(tex, str(tmp_path / "references.bib"),
+                                   str(tmp_path / "other.bbl"))
+    assert not (tmp_path / "other.bbl").exists()
+    entries, _ = BibIndex(str(tmp_path / "references.bib")).parse(["vaswani17"])
+    assert sorted(entries) == ["nips17", "vaswani17"]  # with its crossref
+
+
+def test_index(tmp_path, cache):
+    path = tmp_path / "shared.bib"
+    path.write_text(bib + "@comment{ignored}\n@misc(paren, title = {Déjà (vu)}, crossref = {vaswani17})\n",
+                    encoding="utf-8")
+    index = BibIndex(str(path))
+    assert list(index.keys) == ["knuth84", "lamport86", "vaswani17", "nips17", "knuth84b", "paren"]
+    assert index.resolve(["paren", "knuth84", "missing", "knuth84"]) == ["paren", "knuth84", "vaswani17", "nips17"]
+    assert index.resolve(["*"]) == list(index.keys)
+    pruned = index.pruned(["paren"])
+    assert pruned.startswith('@string{acm = "ACM Press"}\n\n@preamble{')
+    assert "@misc(paren, title = {Déjà (vu)}, crossref = {vaswani17})\n\n@inproceedings{vaswani17" in pruned
+    assert "knuth84" not in pruned and "@proceedings{nips17" in pruned
+    entries, _ = BibParser.parse(pruned)
+    assert entries["paren"].get("title") == "Déjà (vu)"
+    assert len(list((cache / "bib").iterdir())) == 1
+
+
+def test_index_cache(tmp_path, monkeypatch):
+    path = tmp_path / "shared.bib"
+    path.write_text(bib)
+    BibIndex(str(path))
+    monkeypatch.setattr(BibIndex, "build", staticmethod(lambda path: pytest.fail("not cached")))
+    assert "knuth84" in BibIndex(str(path)).keys  # read from the cache
+    monkeypatch.undo()
+    path.write_text(bib.replace("knuth84b", "knuth85"))
+    keys = BibIndex(str(path)).keys  # the file changed: indexed again
+    assert "knuth85" in keys and "knuth84b" not in keys
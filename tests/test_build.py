@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+from md2x import _build_target
+from utils.build import BuildProject
+from utils.errors_warnings import InputException
+from utils.pipeline import convert_markdown
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "a.csv").write_text("x,y\n1,2\n")
+    (tmp_path / "figure.png").write_bytes(b"\x89PNG")
+    (tmp_path / "paper.md").write_text("# Paper\n\n![figure](figure.png)\n\nText.\n")
+    (tmp_path / "notes.md").write_text("# Notes\n\nMore.\n")
+    path = tmp_path / "md2x.json"
+    path.write_text(json.dumps({"outputs": [
+        {"input": "paper.md", "output": "build/paper.tex", "depends": ["data/*.csv"]},
+        {"input": "notes.md", "format": "docx", "unnumbered": True},
+    ]}))
+    return str(path)
+
+
+def outputs(targets):
+    return [os.path.basename(t["output"]) for t in targets]
+
+
+def test_targets(project, tmp_path):
+    paper, notes = BuildProject(project).targets
+    assert paper["output"] == str(tmp_path / "build" / "paper.tex") and paper["format"] == "tex"
+    assert notes["output"] == str(tmp_path / "notes.docx") and notes["options"] == {"unnumbered": True}
+    assert BuildProject(project).dependencies(paper) == [
+        str(tmp_path / "data" / "a.csv"), str(tmp_path / "figure.png"), str(tmp_path / "paper.md")]
+
+
+def test_rebuild_only_stale_outputs(project, tmp_path):
+    built, failed, fresh = BuildProject(project).build(_build_target, jobs=2)
+    assert outputs(built) == ["paper.tex", "notes.docx"] and failed == fresh == []
+    assert (tmp_path / "build" / "paper.tex").read_text() == convert_markdown(
+        "# Paper\n\n![figure](figure.png)\n\nText.\n")
+    assert outputs(BuildProject(project).build(_build_target)[2]) == ["paper.tex", "notes.docx"]
+
+    (tmp_path / "data" / "a.csv").write_text("x,y\n3,4\n")  # a dependency of paper.tex
+    stale, fresh, _ = BuildProject(project).plan()
+    assert outputs(stale) == ["paper.tex"] and outputs(fresh) == ["notes.docx"]
+    os.utime(tmp_path / "notes.md")  # touched, but the same content
+    assert outputs(BuildProject(project).build(_build_target)[0]) == ["paper.tex"]
+
+    os.remove(tmp_path / "notes.docx")
+    assert outputs(BuildProject(project).plan()[0]) == ["notes.docx"]
+    assert outputs(BuildProject(project).plan(force=True)[0]) == ["paper.tex", "notes.docx"]
+
+
+def test_failed_outputs_are_rebuilt(project, tmp_path):
+    BuildProject(project).build(lambda target: target["format"] == "tex" and _build_target(target), jobs=1)
+    state = json.loads((tmp_path / ".md2x-build.json").read_text())
+    assert list(state) == [os.path.join("build", "paper.tex")]
+    assert outputs(BuildProject(project).plan()[0]) == ["notes.docx"]
+
+
+def test_invalid_projects(tmp_path):
+    (tmp_path / "bad.json").write_text('{"outputs": [{"input": "a.md", "format": "odt"}]}')
+    with pytest.raises(InputException):
+        BuildProject(str(tmp_path / "bad.json"))
+    (tmp_path / "bad.json").write_text('{"outputs": {}}')
+    with pytest.raises(InputException):
+        BuildProject(str(tmp_path / "bad.json"))
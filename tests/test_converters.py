@@ -0,0 +1,75 @@
+import re
+
+from utils.converters import MDHeader
+from utils.parallel import convert_parallel
+from utils.pipeline import convert_markdown
+from utils.split import convert_split
+
+document = "".join(f"# Intro\n\nText {i}.\n\n## Part {i % 3}\n\nMore.\n\n## Part\n\n#### Note\n\nend.\n\n"
+                   for i in range(8))
+
+
+def labels(tex: str):
+    return re.findall(r"\\label\{([^}]*)\}", tex)
+
+
+def test_index_labels():
+    headings = MDHeader.index("# Results\n\n## Results\n\n```\n# not a header\n```\n\n# Ça va?\n", escaped=False)
+    assert [h["label"] for h in headings] == ["sec:results", "sec:results-2", "sec:a-va"]
+
+
+def test_sections_are_labelled():
+    tex = convert_markdown("# Results\n\ntext\n\n## Results\n\n#### Detail\n")
+    assert "\\section{Results}\\label{sec:results}\n" in tex
+    assert "\\subsection{Results}\\label{sec:results-2}\n" in tex
+    assert "\\textbf{Detail}" in tex and len(labels(tex)) == 2
+    tex = convert_markdown("# Results\n", unnumbered=True, document_class="book")
+    assert "\\chapter*{Results}\\label{sec:results}\n\\addcontentsline{toc}{chapter}{Results}" in tex
+
+
+def test_labels_match_the_outline():
+    outline = [h["label"] for h in MDHeader.index(document, escaped=False) if h["level"] <= 3]
+    assert labels(convert_markdown(document)) == outline
+    assert len(set(outline)) == len(outline)
+
+
+def test_labels_are_numbered_across_parts():
+    whole = labels(convert_markdown(document))
+    assert labels(convert_parallel(document, jobs=2, size=100)) == whole
+    _, files = convert_split(document, 1, jobs=1)
+    split = []
+    for target in files.values():
+        with open(target, encoding="utf-8") as fh:
+            split += labels(fh.read())
+    assert split == whole
+
+
+def test_shared_labels():
+    parts = [["A", "B"], ["A", "C"], ["A 2", "A"]]
+    assert MDHeader.shared_labels(parts) == [set(), {"sec:a"}, {"sec:a", "sec:a-2"}]
+    whole = MDHeader.index("".join(f"# {text}\n" for part in parts for text in part))
+    used = MDHeader.shared_labels(parts)[2]
+    assert [h["label"] for h in MDHeader.index("# A 2\n# A\n", used=used)] == [h["label"] for h in whole[-2:]]
+
+
+def test_footnotes():
+    tex = convert_markdown("Text[^1] and[^2][^3].\n\n[^1]: the *note*\nmore\n\n[^2]:\n")
+    assert "Text\\footnote{the \\textit{note} more} and." in tex
+    assert "[" not in tex
+
+
+def test_duplicate_footnote_definitions_are_reported(capsys):
+    tex = convert_markdown("Text[^1].\n[^1]: note\nMore.\n[^1]: note\n**bold** end\n")
+    assert tex == "Text\\footnote{note More.}.\n"
+    assert "footnotes defined more than once: [^1]" in capsys.readouterr().err
+
+    convert_markdown("Text[^1].\n\n[^1]: note\n")
+    assert capsys.readouterr().err == ""
+
+
+def test_duplicate_footnotes_across_blocks(capsys):
+    document = "".join(f"Paragraph {i}[^{i % 3}].\n\n[^{i % 3}]: note {i}\n\n" for i in range(30))
+    assert convert_parallel(document, jobs=2, size=100) == convert_markdown(document)
+    errors = capsys.readouterr().err.splitlines()
+    assert errors == ["WARNING - footnotes defined more than once: [^0], [^1], [^2]. the first definition "
+                      "of a footnote is used, the text of the others is removed"] * 2
@@ -0,0 +1,121 @@
+import re
+import struct
+import zipfile
+import zlib
+from xml.etree import ElementTree
+
+from utils.docx import DocxWriter, write_docx
+
+w = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+document = """# Title
+
+Some **bold** and *italic* text with `code`, a [link](http://example.com/?a=1&b=2) and an [anchor](#title).
+A note[^1], the same note[^1] and a missing one[^9].
+
+![A figure](figure.png)
+
+## Lists
+
+- an item
+    - nested
+- another
+
+3. three
+4. four
+
+> a quote
+> on two lines
+
+| a | b |
+|---|--:|
+| 1 | 2 |
+
+```
+code <kept> as is
+```
+
+---
+
+[^1]: the note, with a [link](http://example.com/note).
+"""
+
+
+def png(width: int, height: int) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\x00" + b"\xff" * width * 3 for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+def build(tmp_path, string: str = document):
+    (tmp_path / "figure.png").write_bytes(png(1200, 300))
+    path = tmp_path / "doc.docx"
+    write_docx(string, str(path), base_dir=str(tmp_path))
+    return zipfile.ZipFile(path)
+
+
+def test_package(tmp_path):
+    with build(tmp_path) as archive:
+        names = archive.namelist()
+        assert names[:2] == ["[Content_Types].xml", "_rels/.rels"]
+        assert "word/media/image1.png" in names
+        for name in names:
+            if name.endswith((".xml", ".rels")):
+                ElementTree.fromstring(archive.read(name))  # every part is well-formed
+        types = archive.read("[Content_Types].xml").decode("utf-8")
+        for name in ("document", "styles", "numbering", "footnotes", "settings"):
+            assert f'PartName="/word/{name}.xml"' in types
+        rels = archive.read("word/_rels/document.xml.rels").decode("utf-8")
+        for target in re.findall(r'Target="([^"]*)"(?! TargetMode)', rels):
+            assert f"word/{target}" in names
+        assert 'Target="http://example.com/?a=1&amp;b=2" TargetMode="External"' in rels
+        assert "http://example.com/note" in archive.read("word/_rels/footnotes.xml.rels").decode("utf-8")
+
+
+def test_document_xml(tmp_path):
+    with build(tmp_path) as archive:
+        body = ElementTree.fromstring(archive.read("word/document.xml")).find(f"{w}body")
+        notes = ElementTree.fromstring(archive.read("word/footnotes.xml"))
+        numbering = archive.read("word/numbering.xml").decode("utf-8")
+    styles = [p.find(f"{w}pPr/{w}pStyle").get(f"{w}val") for p in body.iter(f"{w}p")
+              if p.find(f"{w}pPr/{w}pStyle") is not None]
+    assert styles == ["Heading1", "Heading2", "Quote", "SourceCode"]
+    texts = "".join(t.text or "" for t in body.iter(f"{w}t"))
+    assert "code <kept> as is" in texts and "a quote on two lines" in texts
+    assert body.find(f".//{w}hyperlink[@{w}anchor='title']") is not None
+    assert len(body.findall(f".//{w}tbl/{w}tr")) == 2
+    assert len(body.findall(f".//{w}numPr")) == 5
+    assert '<w:startOverride w:val="3"/>' in numbering  # the numbered list starts at its first number
+    pointers = [r.get(f"{w}id") for r in body.iter(f"{w}footnoteReference")]
+    assert pointers == ["1", "2"]  # a note pointed to twice is written twice, a missing one is removed
+    ids = [n.get(f"{w}id") for n in notes.iter(f"{w}footnote")]
+    assert ids == ["-1", "0", "1", "2"]
+    extent = body.find(".//{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}extent")
+    assert extent.get("cx") == str(6 * 914400) and extent.get("cy") == str(6 * 914400 // 4)
+
+
+def test_same_document_same_file(tmp_path):
+    build(tmp_path).close()
+    first = (tmp_path / "doc.docx").read_bytes()
+    assert not write_docx(document, str(tmp_path / "doc.docx"), base_dir=str(tmp_path))
+    assert (tmp_path / "doc.docx").read_bytes() == first
+    assert write_docx(document + "\nmore\n", str(tmp_path / "doc.docx"), base_dir=str(tmp_path))
+
+
+def test_invalid_characters_and_missing_image(tmp_path):
+    with build(tmp_path, "A \x01control & <tag>\n\n![caption](missing.png)\n") as archive:
+        xml = archive.read("word/document.xml").decode("utf-8")
+        assert "A control &amp; &lt;tag&gt;" in xml and "caption" in xml
+        assert not any(name.startswith("word/media/") for name in archive.namelist())
+
+
+def test_duplicate_footnotes(tmp_path, capsys):
+    parts = []
+    writer = DocxWriter(parts.append)
+    writer.body(lambda: ["Text[^1].\n\n[^1]: first\n\n[^1]: second\n\n[^2]: other\n\n[^2]: again\n"])
+    assert writer.notes == {"1": "first", "2": "other"}
+    assert capsys.readouterr().err.splitlines() == [
+        "WARNING - footnotes defined more than once: [^1], [^2]. the first definition of a footnote is used, "
+        "the text of the others is removed"]
+    assert "second" not in "".join(parts)
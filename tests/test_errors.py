@@ -0,0 +1,65 @@
+import pickle
+
+from click.testing import CliRunner
+
+from md2tex import md2tex
+from md2x import _build_target, _watch_build, make_options, md2x
+from utils.errors_warnings import ConversionError, IndentationException, InputException
+from utils.pipeline import convert_markdown
+
+bad_list = "    - a\n- b\n"
+
+
+def test_errors_are_data():
+    error = InputException("not_inpath", "paper.md")
+    assert isinstance(error, ConversionError) and str(error) == error.message
+    assert error.to_dict() == {"error": "InputException", "key": "not_inpath", "value": "paper.md",
+                               "message": "ERROR - input file `paper.md` not found. exiting..."}
+    copy = pickle.loads(pickle.dumps(error))  # sent back by worker processes
+    assert type(copy) is InputException and copy.to_dict() == error.to_dict()
+    try:
+        convert_markdown(bad_list)
+    except IndentationException as e:
+        assert e.key == "firstindent" and e.value.startswith("    - a")
+    else:
+        raise AssertionError("no IndentationException")
+
+
+def test_commands_exit_with_the_message(tmp_path):
+    source = tmp_path / "paper.md"
+    source.write_text(bad_list)
+    result = CliRunner().invoke(md2x, [str(source), "-f", "tex", "-o", str(tmp_path / "paper.tex")])
+    assert result.exit_code == 1 and "inconsistant indentation" in result.stderr
+    assert not (tmp_path / "paper.tex").exists()
+
+    missing = str(tmp_path / "missing.md")
+    result = CliRunner().invoke(md2tex, [missing, "-o", "-"])
+    assert result.exit_code == 1 and result.stdout == ""  # not in the TeX stream
+    assert result.stderr == InputException("not_inpath", missing).message + "\n"
+    source.write_text("# T\n")
+    result = CliRunner().invoke(md2tex, [str(source), "-d", "report"])
+    assert result.exit_code == 1 and "`--document-class`: `report`" in result.stderr
+
+
+def test_failed_conversions_exit_with_1(tmp_path, monkeypatch):
+    source = tmp_path / "paper.md"
+    source.write_text("# T\n")
+    result = CliRunner().invoke(md2x, [str(source), "-f", "rst"])
+    assert result.exit_code == 1
+    monkeypatch.setenv("PATH", str(tmp_path))  # no LaTeX engine
+    result = CliRunner().invoke(md2x, [str(source), "-f", "pdf", "-o", str(tmp_path / "paper.pdf")])
+    assert result.exit_code == 1 and "Conversion failed" in result.stderr
+    result = CliRunner().invoke(md2x, ["-", "--watch"], input="# T\n")
+    assert result.exit_code == 1
+
+
+def test_workers_survive_bad_documents(tmp_path, capsys):
+    source = tmp_path / "paper.md"
+    source.write_text(bad_list)
+    target = {"input": str(source), "output": str(tmp_path / "paper.tex"), "format": "tex", "options": {}}
+    assert _build_target(target) is False
+    assert "Error building" in capsys.readouterr().err
+
+    _watch_build(str(source), "tex", str(tmp_path / "paper.tex"), make_options(str(source)))
+    err = capsys.readouterr().err
+    assert "inconsistant indentation" in err and "Conversion failed" in err
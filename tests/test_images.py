@@ -0,0 +1,88 @@
+import os
+import struct
+import zlib
+
+import pytest
+
+from utils import images
+from utils.images import ImageOptimizer
+
+
+def chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def png(width: int, height: int, text: bool = True) -> bytes:
+    rows = b"".join(b"\x00" + b"\x80" * width * 3 for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + (chunk(b"tEXt", b"Comment\x00secret") if text else b"") + chunk(b"IDAT", zlib.compress(rows))
+            + chunk(b"IEND", b""))
+
+
+def segment(marker: int, data: bytes) -> bytes:
+    return bytes([0xFF, marker]) + struct.pack(">H", len(data) + 2) + data
+
+
+jpeg = (b"\xff\xd8" + segment(0xE0, b"JFIF\x00\x01\x01") + segment(0xE1, b"Exif\x00\x00secret")
+        + segment(0xFE, b"a comment") + segment(0xC0, b"\x08" + struct.pack(">HH", 480, 640) + b"\x03")
+        + segment(0xDA, b"\x03") + b"scan data\xff\xd9")
+
+
+def test_strip_metadata():
+    assert ImageOptimizer.strip_png(png(4, 2)) == png(4, 2, text=False)
+    stripped = ImageOptimizer.strip_jpeg(jpeg)
+    assert b"secret" not in stripped and b"a comment" not in stripped
+    assert b"JFIF" in stripped and stripped.endswith(b"scan data\xff\xd9")
+    assert ImageOptimizer.strip_png(b"not a png") == b"not a png"
+    assert ImageOptimizer.strip_jpeg(jpeg[:30]) == jpeg[:30]  # truncated: left to LaTeX
+
+
+def test_size():
+    assert ImageOptimizer.size(png(4, 2), ".png") == (4, 2)
+    assert ImageOptimizer.size(jpeg, ".jpg") == (640, 480)
+    assert ImageOptimizer.size(b"GIF89a" + struct.pack("<HH", 7, 3), ".gif") == (7, 3)
+    assert ImageOptimizer.width(b"junk", ".png") is None
+
+
+def test_optimize_is_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "Image", None)
+    source = tmp_path / "photo.jpg"
+    source.write_bytes(jpeg)
+    target = ImageOptimizer.optimize(str(source))
+    with open(target, mode="rb") as fh:
+        assert fh.read() == ImageOptimizer.strip_jpeg(jpeg)
+    assert ImageOptimizer.optimize(str(source), dpi=150) != target  # other settings, other result
+    monkeypatch.setattr(ImageOptimizer, "strip_jpeg", staticmethod(lambda data: pytest.fail("not cached")))
+    assert ImageOptimizer.optimize(str(source)) == target
+
+    vector = tmp_path / "plot.pdf"
+    vector.write_bytes(b"%PDF-1.5")
+    with open(ImageOptimizer.optimize(str(vector)), mode="rb") as fh:
+        assert fh.read() == b"%PDF-1.5"
+
+
+def test_wide_image_without_pillow(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(images, "Image", None)
+    monkeypatch.setattr(ImageOptimizer, "warned", [])
+    for n in range(2):
+        (tmp_path / f"wide{n}.png").write_bytes(png(3000 + n, 1))
+        ImageOptimizer.optimize(str(tmp_path / f"wide{n}.png"), dpi=100, print_width=2)
+    assert capsys.readouterr().err.count("Pillow is not installed") == 1
+
+
+def test_downscale(tmp_path):
+    pytest.importorskip("PIL")
+    (tmp_path / "wide.png").write_bytes(png(1000, 10))
+    with open(ImageOptimizer.optimize(str(tmp_path / "wide.png"), dpi=100, print_width=2), mode="rb") as fh:
+        assert ImageOptimizer.size(fh.read(16 << 10), ".png") == (200, 2)
+
+
+def test_rewrite(tmp_path):
+    (tmp_path / "figure.png").write_bytes(png(4, 2))
+    string = ("![A figure](figure.png)\n\n```\n![in code](figure.png)\n```\n\n![remote](http://x/figure.png) "
+              "![missing](missing.png)\n")
+    rewritten, files = ImageOptimizer.rewrite(string, str(tmp_path), jobs=1)
+    (relpath, target), = files.items()
+    assert relpath == f"md2x-images/{os.path.basename(target)}"
+    assert rewritten == string.replace("](figure.png)", f"]({relpath})", 1)
+    assert ImageOptimizer.rewrite("no image", str(tmp_path)) == ("no image", {})
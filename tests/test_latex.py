@@ -0,0 +1,192 @@
+import asyncio
+import os
+import stat
+
+import pytest
+
+from md2x import UniversalConverter, make_options
+from utils.latex import (PreambleFormat, compile_latex, compile_latex_async, compile_plan, draft_images, latex_engine,
+                         latex_steps, latex_target, preview_source)
+from utils.latexlog import LatexLog
+
+document = "\\documentclass{article}\n\\begin{document}\nHello\n\\end{document}\n"
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """
+    a fake `pdflatex` on the PATH, printing the output given to it, keeping its arguments and
+    the last document, and writing the PDF
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (tmp_path / "template.tex").write_text("\\documentclass{@@DOCUMENTCLASSTOKEN@@}\n\\usepackage{graphicx}\n"
+                                           "\\begin{document}\n@@BODYTOKEN@@\n\\end{document}\n")
+
+    def install(output: str = "", code: int = 0):
+        (tmp_path / "output.txt").write_text(output)
+        script = bin_dir / "pdflatex"
+        script.write_text(f"#!/bin/sh\ncat {tmp_path / 'output.txt'}\necho $@ >> {tmp_path / 'calls.txt'}\n"
+                          f"cp document.tex {tmp_path / 'last.tex'}\ntouch document.pdf\nexit {code}\n")
+        script.chmod(script.stat().st_mode | stat.S_IEXEC)
+        return tmp_path / "calls.txt"
+
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return install
+
+
+def build(tmp_path, markdown: str, **options) -> bool:
+    options = make_options(str(tmp_path / "paper.md"), str(tmp_path / "template.tex"), **options)
+    return UniversalConverter().convert_to_pdf(markdown, options, str(tmp_path / "paper.pdf"))
+
+
+def test_steps():
+    assert latex_steps(document) == ["draft", "draft", "final"]
+    assert latex_steps(document + "\\bibliography{refs}") == ["draft", "draft", "draft", "bibtex", "draft", "final"]
+    assert latex_steps(document, preview=True) == ["final"]
+
+
+def test_compile(tmp_path, engine):
+    calls = engine("This is pdfTeX\n(./document.tex)\nOutput written on document.pdf\n")
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    (workdir / "document.tex").write_text(document)
+    assert compile_latex(document, str(workdir), {}) == []
+    assert len(calls.read_text().splitlines()) == 3
+
+
+def test_compile_async(tmp_path, engine):
+    calls = engine("This is pdfTeX\n(./document.tex)\nOutput written on document.pdf\n")
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    (workdir / "document.tex").write_text(document)
+    assert asyncio.run(compile_latex_async(document, str(workdir), {})) == []
+    assert calls.read_text().splitlines()[-1].endswith("document.tex")
+
+
+def test_fatal_errors():
+    log = LatexLog()
+    log.feed("(./document.tex\n! Undefined control sequence.\nl.12 \\foo\n\n")
+    assert log.errors == [{"level": "error", "file": "document.tex", "line": 12,
+                           "message": "Undefined control sequence."}]
+    assert log.fatal is None
+    log.feed("! LaTeX Error: File `missing.sty' not found.\n\n*** (job aborted, file error in nonstop mode)\n"
+             "! Emergency stop.\n")
+    log.close()
+    assert log.fatal["message"] == "LaTeX Error: File `missing.sty' not found."
+    assert len(log.errors) == 3
+    log = LatexLog()
+    log.feed("./document.tex:3: ==> Fatal error occurred, no output PDF file produced!\n")
+    assert log.fatal["line"] == 3
+
+
+def test_recoverable_error(tmp_path, engine):
+    calls = engine("(./document.tex\n! Undefined control sequence.\nl.3 \\foo\n\n)\n", code=1)
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    (workdir / "document.tex").write_text(document)
+    diagnostics = compile_latex(document, str(workdir), {})
+    assert [d["message"] for d in diagnostics] == ["Undefined control sequence."]
+    assert len(calls.read_text().splitlines()) == 3  # every pass ran
+    assert (workdir / "document.pdf").exists()
+
+
+def test_fatal_error(tmp_path, engine):
+    calls = engine("(./document.tex\n! LaTeX Error: File `missing.sty' not found.\n! Emergency stop.\n", code=1)
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    (workdir / "document.pdf").write_text("%PDF-1.5 truncated")
+    diagnostics = compile_latex(document, str(workdir), {})
+    assert diagnostics[0]["message"] == "LaTeX Error: File `missing.sty' not found."
+    assert not calls.exists() or len(calls.read_text().splitlines()) == 1  # killed in the first pass
+    assert not (workdir / "document.pdf").exists()
+
+
+def test_engine(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))  # no engine installed: xelatex is asked for
+    assert latex_engine(document) == "pdflatex"
+    assert latex_engine("\\documentclass{article}\n\\usepackage[no-math]{fontspec}\n" + document) == "xelatex"
+    assert latex_engine("%\\usepackage{fontspec}\n" + document) == "pdflatex"
+    assert latex_engine("\\documentclass{article}\n\\usepackage{unicode-math}\n", "lualatex") == "lualatex"
+    with open(os.path.join(os.path.dirname(__file__), "..", "utils", "template.tex")) as fh:
+        assert latex_engine(fh.read()) == "xelatex"
+    assert compile_plan(document, ".", {})[0][1][0] == "pdflatex"
+    draft, _, final = compile_plan("\\usepackage{fontspec}\n" + document, ".", {})
+    assert draft[1][:1] == final[1][:1] == ["xelatex"] and "-no-pdf" in draft[1]
+
+    script = tmp_path / "lualatex"  # installed without xelatex
+    script.write_text("#!/bin/sh\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    assert latex_engine("\\usepackage{fontspec}\n" + document) == "lualatex"
+    assert latex_engine(document) == "pdflatex"
+
+
+@pytest.fixture
+def format_engine(tmp_path, monkeypatch):
+    """
+    a fake `pdflatex` dumping a format with `-ini`, unless the preamble has `\\fail`
+    """
+    bin_dir = tmp_path / "fmtbin"
+    bin_dir.mkdir()
+    script = bin_dir / "pdflatex"
+    script.write_text(f"#!/bin/sh\necho $@ >> {tmp_path / 'ini.txt'}\n"
+                      'if [ "$1" = "--version" ]; then echo "pdfTeX 3.14"; exit 0; fi\n'
+                      'grep -q fail preamble.tex || touch "${3#-jobname=}.fmt"\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(PreambleFormat, "versions", {})
+    return tmp_path / "ini.txt"
+
+
+def test_preamble_format(tmp_path, format_engine, capsys):
+    tex = "\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\nHello\n\\end{document}\n"
+    fmt = PreambleFormat.ensure(tex)
+    assert fmt and os.path.exists(fmt)
+    assert PreambleFormat.ensure(tex.replace("Hello", "Changed")) == fmt  # the same preamble
+    assert len([c for c in format_engine.read_text().splitlines() if "-ini" in c]) == 1
+    assert PreambleFormat.ensure(tex.replace("amsmath", "amssymb")) != fmt
+    assert PreambleFormat.ensure("Hello") is None  # no preamble
+
+    failing = tex.replace("amsmath", "fail")
+    assert PreambleFormat.ensure(failing) is None
+    assert "preamble" in capsys.readouterr().err
+    PreambleFormat.ensure(failing)  # not retried
+    assert len([c for c in format_engine.read_text().splitlines() if "-ini" in c]) == 3
+
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    command = compile_plan(tex, str(workdir), {"preamble_cache": True})[-1][1]
+    name = os.path.splitext(os.path.basename(fmt))[0]
+    assert command == ["pdflatex", "-interaction=nonstopmode", "-file-line-error", f"-fmt={name}", "document.tex"]
+    assert (workdir / os.path.basename(fmt)).exists()
+
+
+def test_draft_passes(tmp_path, engine):
+    assert latex_target("document", "draft") == ["-draftmode", "document.tex"]
+    assert latex_target("document", "draft", "lualatex") == ["--draftmode", "document.tex"]
+    assert latex_target("document", "draft", "xelatex") == ["-no-pdf", "document.tex"]
+    assert latex_target("document", "final", "xelatex") == ["document.tex"]
+    steps = [(step, command[0]) for step, command, _ in compile_plan(document + "\\bibliography{refs}", ".", {})]
+    assert steps == [("draft", "pdflatex")] * 3 + [("bibtex", "bibtex"), ("draft", "pdflatex"), ("final", "pdflatex")]
+
+    calls = engine()
+    assert build(tmp_path, "# Title\n\nText.\n")
+    assert calls.read_text().splitlines() == [
+        "-interaction=nonstopmode -file-line-error -draftmode document.tex",
+        "-interaction=nonstopmode -file-line-error -draftmode document.tex",
+        "-interaction=nonstopmode -file-line-error document.tex",
+    ]
+
+
+def test_preview(tmp_path, engine):
+    (step, command, _), = compile_plan(document + "\\bibliography{refs}", str(tmp_path), {"preview": True})
+    assert step == "final" and command[-1] == "document.tex"
+    source = preview_source(document)
+    assert PreambleFormat.preamble(source) == PreambleFormat.preamble(document)  # the same format
+    assert source.startswith(PreambleFormat.preamble(document) + "\\begin{document}" + draft_images + "\nHello")
+
+    calls = engine()
+    assert build(tmp_path, "# Title\n\n![A figure](figure.png)\n", preview=True)
+    assert calls.read_text().splitlines() == ["-interaction=nonstopmode -file-line-error document.tex"]
+    tex = (tmp_path / "last.tex").read_text()
+    assert tex.count(draft_images) == 1 and tex.index("\\begin{document}") < tex.index(draft_images)
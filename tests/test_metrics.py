@@ -0,0 +1,70 @@
+import pytest
+
+from utils.metrics import Metrics
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setenv("MD2X_METRICS", str(tmp_path / "md2x.prom"))
+    Metrics._reset()
+    yield Metrics
+    Metrics._reset()
+
+
+def samples(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+
+def test_disabled_without_a_textfile(monkeypatch):
+    monkeypatch.delenv("MD2X_METRICS", raising=False)
+    Metrics._reset()
+    Metrics.inc("md2x_documents", format="tex", status="ok")
+    assert Metrics.values == {}
+
+
+def test_counters(registry):
+    registry.document("tex", True, 100, 250)
+    registry.document("tex", True, 10, 25)
+    registry.document("pdf", False, 5)
+    text = registry.render(registry.values)
+    assert text.endswith("# EOF\n")
+    values = samples(text)
+    assert values['md2x_documents_total{format="tex",status="ok"}'] == "2"
+    assert values['md2x_documents_total{format="pdf",status="error"}'] == "1"
+    assert values['md2x_input_bytes_total{format="tex"}'] == "110"
+    assert values['md2x_output_bytes_total{format="tex"}'] == "275"
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    registry.observe("md2x_stage_duration_seconds", 0.0002, stage="s")
+    registry.observe("md2x_stage_duration_seconds", 0.03, stage="s")
+    registry.observe("md2x_stage_duration_seconds", 3.5, stage="s")  # above the last bound
+    values = samples(registry.render(registry.values))
+    assert values['md2x_stage_duration_seconds_bucket{stage="s",le="0.0001"}'] == "0"
+    assert values['md2x_stage_duration_seconds_bucket{stage="s",le="0.0005"}'] == "1"
+    assert values['md2x_stage_duration_seconds_bucket{stage="s",le="0.05"}'] == "2"
+    assert values['md2x_stage_duration_seconds_bucket{stage="s",le="1.0"}'] == "2"
+    assert values['md2x_stage_duration_seconds_bucket{stage="s",le="+Inf"}'] == "3"
+    assert values['md2x_stage_duration_seconds_count{stage="s"}'] == "3"
+    assert float(values['md2x_stage_duration_seconds_sum{stage="s"}']) == pytest.approx(3.5302)
+
+
+def test_label_escaping(registry):
+    registry.cache('a"b\\c', True)
+    assert 'md2x_cache_requests_total{cache="a\\"b\\\\c",result="hit"} 1' in registry.render(registry.values)
+
+
+def test_merge_and_export(registry, tmp_path):
+    registry.observe("md2x_subprocess_duration_seconds", 1.5, command="pdflatex")
+    other = [["md2x_subprocess_duration_seconds", {"command": "pdflatex"}, [0] * 2 + [1] + [0] * 7 + [1, 0.5]]]
+    registry.flush()
+    merged = registry.merge([[[name, dict(labels), value] for (name, labels), value in registry.values.items()],
+                             other])
+    values = samples(registry.render(merged))
+    assert values['md2x_subprocess_duration_seconds_count{command="pdflatex"}'] == "2"
+    assert values['md2x_subprocess_duration_seconds_bucket{command="pdflatex",le="1.0"}'] == "1"
+    assert values['md2x_subprocess_duration_seconds_bucket{command="pdflatex",le="2.5"}'] == "2"
+
+    registry.export(str(tmp_path / "md2x.prom"))
+    exported = samples((tmp_path / "md2x.prom").read_text())
+    assert exported['md2x_subprocess_duration_seconds_count{command="pdflatex"}'] == "1"
@@ -0,0 +1,54 @@
+import os
+import random
+
+import pytest
+
+from utils.parallel import cut_points, convert_parallel
+from utils.pipeline import convert_markdown
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+pieces = ["Text [^1] and [^2].", "# Header", "## Part", "- item", "    - nested", "1. first", "```\ncode\n\nmore\n```",
+          "> quote", "[^1]: a note.", "[^2]: another\n    note.", "See [3] and [Doe2020].", "$x^2$", "$$\ny\n$$",
+          "| a | b |\n|---|---|\n| 1 | 2 |", '"quoted"', ""]
+
+
+def read(name: str) -> str:
+    with open(os.path.join(root, name), encoding="utf-8") as fh:
+        return fh.read()
+
+
+@pytest.mark.parametrize("name", ["README.md", "README_md2x.md", "IMPROVEMENTS.md"])
+def test_parallel_is_sequential(name):
+    string = read(name)
+    assert cut_points(string, 1000)
+    assert convert_parallel(string, jobs=2, size=1000) == convert_markdown(string)
+
+
+@pytest.mark.parametrize("options", [dict(french_quote=True), dict(unnumbered=True, document_class="book"),
+                                     dict(arxiv=True, longtable_threshold=1)])
+def test_parallel_options(options):
+    string = read("README_md2x.md")
+    assert convert_parallel(string, jobs=2, size=4000, **options) == convert_markdown(string, **options)
+
+
+def test_cut_points():
+    string = "Intro.\n\n```\ncode\n\nWith a blank line.\n```\n\nAfter.\n\n- item\n\n1. first\n\nLast.\n"
+    cuts = cut_points(string, 1)
+    assert [string[cut:cut + 5] for cut in cuts] == ["After", "Last."]
+    assert cut_points(string, len(string)) == []
+    string = "Intro.\n\n\\begin{lstlisting}\n\nInside.\n\n\\end{lstlisting}\n\nOut.\n"
+    assert [string[cut:cut + 4] for cut in cut_points(string, 1)] == ["Out."]
+
+
+def test_parallel_fuzz():
+    generator = random.Random(47)
+    for _ in range(3):
+        string = "\n\n".join(generator.choice(pieces) for _ in range(200)) + "\n"
+        assert cut_points(string, 200)
+        assert convert_parallel(string, jobs=2, size=200) == convert_markdown(string)
+
+
+def test_footnotes_across_blocks():
+    string = "First[^1].\n\n" + "Filler text.\n\n" * 50 + "Second[^1] and [^2].\n\n[^1]: the note.\n\n[^2]: other.\n"
+    assert len(cut_points(string, 100)) > 2
+    assert convert_parallel(string, jobs=2, size=100) == convert_markdown(string)
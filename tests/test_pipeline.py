@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from utils.arxiv_converters import ArxivEnhancedConverter
+from utils.errors_warnings import IndentationException
+from utils.pipeline import Features, convert_markdown
+
+documents = [
+    "Plain prose, without any construct.\n\nA second paragraph.\n",
+    "# Title\n\n## Part\n\nText with a \"quote\" and 'another'.\n",
+    "- a\n- b\n    - c\n\n1. one\n2. two\n",
+    "```python\nx = 1\n```\n- after the code\n",
+    "```\ncode\n```\n1. after the code\n",
+    "> a quote\n> on two lines\n\ntext\n",
+    "A note[^1] and a missing one[^2].\n\n[^1]: the note.\n",
+    "A pointer to a missing note [[^9]1] is removed.\n",
+    "| a | b |\n|---|---|\n| 1 | 2 |\n",
+    "Inline $x^2$ and display:\n\n$$\ny = 1\n$$\n",
+    "As shown in [1] and [Vaswani2017].\n",
+    "Escaped \\$ and a lone # and > and | in prose.\n",
+]
+pieces = ["text", "# H", "## H2", "- item", "    - nested", "1. first", "```", "> quote", "[^1]", "[^1]: note",
+          "[2]", "[Doe2020]", "$x$", "$$", "| a | b |", "|---|---|", '"q"', "'q'", "", "\\$", "\\#"]
+
+
+def convert(string: str, features: int) -> str:
+    try:
+        return convert_markdown(string, features=features)
+    except IndentationException as e:  # an invalid list fails in the same way
+        return repr(e)
+
+
+@pytest.mark.parametrize("string", documents)
+def test_skipped_stages_change_nothing(string):
+    features = Features.scan(string)
+    assert convert_markdown(string, features=features) == convert_markdown(string, features=Features.ALL)
+    assert (convert_markdown(string, features=features, arxiv=True)
+            == convert_markdown(string, features=Features.ALL, arxiv=True))
+
+
+def test_skipped_stages_fuzz():
+    generator = random.Random(43)
+    for _ in range(200):
+        string = "\n".join(generator.choice(pieces) for _ in range(generator.randint(1, 12))) + "\n"
+        features = Features.scan(string)
+        assert convert(string, features) == convert(string, Features.ALL), string
+
+
+def test_scan():
+    assert Features.scan(documents[0]) == 0
+    assert Features.scan(documents[3]) & Features.LIST  # a list item right after a closing fence
+    assert Features.scan(documents[4]) & Features.LIST
+    assert Features.scan(documents[7]) & Features.CITATION  # `[1]` once the pointer is removed
+    assert Features.scan(documents[10]) == Features.CITATION
+    assert Features.describe(Features.FENCE | Features.MATH) == "fence, math"
+    assert Features.describe(0) == "none"
+
+
+def test_profile():
+    profile = []
+    convert_markdown(documents[0], profile=profile)
+    stages = {p["stage"]: p for p in profile}
+    assert stages["Features.scan"]["skipped"] is None
+    assert stages["MDReference.footnote"]["skipped"] == "footnote"
+    assert all(p["seconds"] == 0.0 for p in profile if p["skipped"])
+
+
+def test_arxiv_features():
+    string = "# A Title\n\n## Introduction\n\nAs shown in [Vaswani2017], $O(n^2)$.\n"
+    converter = ArxivEnhancedConverter()
+    assert (converter.convert_for_arxiv(string)["body"]
+            == converter.convert_for_arxiv(string, features=Features.ALL)["body"])
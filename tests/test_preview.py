@@ -0,0 +1,56 @@
+import md2x
+from md2x import _watch_preview, make_options
+from utils.preview import changed_sections, load_snapshot, preview_path, save_snapshot
+
+document = "# One\n\ntext\n\n## Details\n\nmore\n\n# Two\n\nend\n"
+
+
+def test_changed_sections():
+    assert changed_sections(document, document) == []
+    edited = document.replace("more", "changed")
+    assert [name for name, _ in changed_sections(document, edited)] == ["02-details"]
+    moved = "# Two\n\nend\n\n# One\n\ntext\n\n## Details\n\nmore\n"
+    assert changed_sections(document, moved) == []  # the same sections, in another order
+    assert [name for name, _ in changed_sections(document, document + "\n# Three\n\nnew\n")] == ["04-three"]
+
+
+def test_snapshot(tmp_path):
+    source = str(tmp_path / "paper.md")
+    assert preview_path(str(tmp_path / "paper.pdf")) == str(tmp_path / "paper.preview.pdf")
+    assert load_snapshot(source) is None
+    save_snapshot(source, document)
+    assert load_snapshot(source) == document
+    assert load_snapshot(str(tmp_path / "other.md")) is None
+
+
+def test_watch_preview(tmp_path, monkeypatch):
+    compiled = []
+
+    def convert_to_pdf(self, content, options, output_path):
+        compiled.append((content, options, output_path))
+        return True
+
+    monkeypatch.setattr(md2x.UniversalConverter, "convert_to_pdf", convert_to_pdf)
+    source = tmp_path / "paper.md"
+    source.write_text(document)
+    output = str(tmp_path / "paper.pdf")
+    options = make_options(str(source))
+    _watch_preview(str(source), output, options)
+    assert compiled == [] and load_snapshot(str(source)) == document  # the first save only records a snapshot
+
+    source.write_text(document.replace("end", "the end"))
+    _watch_preview(str(source), output, options)
+    (content, preview_options, path), = compiled
+    assert content == "# Two\n\nthe end\n" and path == str(tmp_path / "paper.preview.pdf")
+    assert preview_options["preview"] and preview_options["preamble_cache"] and preview_options["split"] is None
+    assert load_snapshot(str(source)) == source.read_text()
+
+
+def test_failed_preview_keeps_snapshot(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(md2x.UniversalConverter, "convert_to_pdf", lambda *args: False)
+    source = tmp_path / "paper.md"
+    source.write_text(document)
+    save_snapshot(str(source), document.replace("text", "old"))
+    _watch_preview(str(source), str(tmp_path / "paper.pdf"), make_options(str(source)))
+    assert "Preview failed" in capsys.readouterr().err
+    assert load_snapshot(str(source)) == document.replace("text", "old")  # the next save previews it again
@@ -0,0 +1,80 @@
+import json
+import os
+import stat
+
+import pytest
+
+from utils.errors_warnings import InputException
+from utils.pipeline import convert_markdown
+from utils.project import BookProject
+
+chapters = {"intro.md": "# Intro\n\nHello.\n", "methods.md": "# Methods\n\n- a\n- b\n",
+            "results.md": "# Results\n\nDone[^1].\n\n[^1]: a note.\n"}
+
+
+@pytest.fixture
+def project(tmp_path):
+    for name, text in chapters.items():
+        (tmp_path / name).write_text(text)
+    (tmp_path / "book.tex").write_text("\\documentclass{@@DOCUMENTCLASSTOKEN@@}\n\\begin{document}\n"
+                                       "@@BODYTOKEN@@\\end{document}\n")
+    manifest = tmp_path / "book.json"
+    manifest.write_text(json.dumps({"chapters": list(chapters), "template": "book.tex"}))
+    return str(manifest)
+
+
+def test_build(project, tmp_path):
+    book = BookProject(project)
+    assert book.output_dir == str(tmp_path / "book_build")
+    assert book.build(jobs=2) == ["01-intro", "02-methods", "03-results"]
+    for text, chapter in zip(chapters.values(), book.chapters):
+        tex = (tmp_path / "book_build" / "chapters" / f"{chapter}.tex").read_text()
+        assert tex == convert_markdown(text, document_class="book")
+    assert (tmp_path / "book_build" / "master.tex").read_text() == (
+        "\\documentclass{book}\n\\begin{document}\n\\include{chapters/01-intro}\n\\include{chapters/02-methods}\n"
+        "\\include{chapters/03-results}\n\\end{document}\n")
+
+    assert book.build() == []  # nothing changed
+    (tmp_path / "methods.md").write_text("# Methods\n\nChanged.\n")
+    assert book.build() == ["02-methods"]
+    assert book.build(force=True) == list(book.chapters)
+    with open(project, "w") as fh:
+        json.dump({"chapters": list(chapters), "template": "book.tex", "unnumbered": True}, fh)
+    assert BookProject(project).build() == list(book.chapters)  # the options changed
+
+
+def test_include_only(project):
+    book = BookProject(project)
+    assert book.chapter_names(["methods.md", "results", "01-intro"]) == ["02-methods", "03-results", "01-intro"]
+    master = book.master(book.chapter_names(["methods"]))
+    assert "\\includeonly{chapters/02-methods}\n\\begin{document}" in master
+    assert "\\include{chapters/01-intro}" in master
+    with pytest.raises(InputException):
+        book.chapter_names(["appendix"])
+
+
+def test_invalid_projects(project, tmp_path):
+    (tmp_path / "empty.json").write_text('{"chapters": []}')
+    with pytest.raises(InputException):
+        BookProject(str(tmp_path / "empty.json"))
+    (tmp_path / "missing.json").write_text('{"chapters": ["intro.md", "missing.md"]}')
+    with pytest.raises(InputException):
+        BookProject(str(tmp_path / "missing.json"))
+    (tmp_path / "notemplate.json").write_text('{"chapters": ["intro.md"], "template": "intro.md"}')
+    with pytest.raises(InputException):
+        BookProject(str(tmp_path / "notemplate.json")).master()
+
+
+def test_compile(project, tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "pdflatex"
+    script.write_text(f"#!/bin/sh\necho $@ >> {tmp_path / 'calls.txt'}\ntouch preview.pdf\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    book = BookProject(project)
+    book.build()
+    assert book.compile(book.chapter_names(["results"])) == str(tmp_path / "book_build" / "preview.pdf")
+    calls = (tmp_path / "calls.txt").read_text().splitlines()
+    assert calls == ["-interaction=nonstopmode -draftmode preview.tex", "-interaction=nonstopmode preview.tex"]
+    assert "\\includeonly{chapters/03-results}" in (tmp_path / "book_build" / "preview.tex").read_text()
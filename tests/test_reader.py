@@ -0,0 +1,51 @@
+import codecs
+import zipfile
+
+import pytest
+
+from utils.docx import write_docx
+from utils.reader import MarkdownReader
+
+document = ("# Title\r\n\r\nsome text[^1] with a [link](http://x/1)\r\n\r\n"
+            "```\r\ncode\r\n\r\n\r\nmore code\r\n```\r\n\r\n- an item\r\n- another\r\n\r\n"
+            "[^1]: the note\r\n\r\n| a | b |\r\n|---|---|\r\n| 1 | 2 |\r\n\r\nend é\r\n") * 20
+
+
+@pytest.fixture
+def small_slices(monkeypatch):
+    monkeypatch.setattr(MarkdownReader, "slice_size", 7)
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-8-sig", "utf-16"])
+def test_read_normalizes_newlines(tmp_path, encoding):
+    path = tmp_path / "doc.md"
+    path.write_bytes(document.encode(encoding))
+    assert MarkdownReader(str(path)).read() == document.replace("\r\n", "\n")
+
+
+def test_decode_falls_back_to_latin1():
+    assert MarkdownReader.decode("café\r\n".encode("latin-1")) == "café\n"
+    assert MarkdownReader.decode(codecs.BOM_UTF8 + "café".encode("utf-8")) == "café"
+
+
+def test_slices_and_blocks_join_to_the_file(tmp_path, small_slices):
+    path = tmp_path / "doc.md"
+    path.write_bytes(document.encode("utf-8"))
+    reader = MarkdownReader(str(path))
+    assert "".join(reader.slices()) == reader.read()
+    blocks = list(reader.blocks())
+    assert len(blocks) > 1 and "".join(blocks) == reader.read()
+    for block in blocks:
+        assert block.count("```") % 2 == 0  # never cut inside a code block
+
+
+def test_docx_from_blocks_equals_docx_from_string(tmp_path, small_slices):
+    path = tmp_path / "doc.md"
+    path.write_bytes(document.encode("utf-8"))
+    reader = MarkdownReader(str(path))
+    write_docx(reader, str(tmp_path / "streamed.docx"))
+    write_docx(reader.read(), str(tmp_path / "whole.docx"))
+    assert (tmp_path / "streamed.docx").read_bytes() == (tmp_path / "whole.docx").read_bytes()
+    with zipfile.ZipFile(tmp_path / "streamed.docx") as archive:
+        assert "more code" in archive.read("word/document.xml").decode("utf-8")
+        assert "the note" in archive.read("word/footnotes.xml").decode("utf-8")
@@ -0,0 +1,27 @@
+from utils.split import convert_split, section_dir, section_manifest, split_markdown, stage_sections
+
+document = "# One\n\ntext[^1]\n\n# Two\n\nmore\n\n# Three\n\nend\n\n[^1]: the note\n"
+
+
+def test_split_moves_footnotes_to_their_section():
+    sections = split_markdown(document, 1)
+    assert [name for name, _ in sections] == ["01-one", "02-two", "03-three"]
+    assert "[^1]: the note" in sections[0][1]
+    assert "[^1]:" not in sections[2][1]
+
+
+def test_stage_sections_removes_only_its_own_files(tmp_path):
+    directory = tmp_path / section_dir
+    directory.mkdir()
+    (directory / "appendix.tex").write_text("written by hand")
+
+    _, files = convert_split(document, 1, jobs=1)
+    stage_sections(str(tmp_path), files)
+    assert sorted(p.name for p in directory.glob("*.tex")) == ["01-one.tex", "02-two.tex", "03-three.tex",
+                                                              "appendix.tex"]
+    assert (directory / section_manifest).read_text() == "01-one.tex\n02-two.tex\n03-three.tex\n"
+
+    _, files = convert_split("# One\n\ntext\n", 1, jobs=1)
+    stage_sections(str(tmp_path), files)
+    assert sorted(p.name for p in directory.glob("*.tex")) == ["01-one.tex", "appendix.tex"]
+    assert (directory / "appendix.tex").read_text() == "written by hand"
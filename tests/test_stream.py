@@ -0,0 +1,50 @@
+import json
+
+from click.testing import CliRunner
+
+from md2x import md2x
+from utils.pipeline import convert_markdown
+
+records = [
+    {"id": 1, "markdown": "# A\n\nx [^1]\n\n[^1]: a note.\n"},
+    {"id": "b", "markdown": "Text", "options": {"bogus": 1}},
+    {"id": 3, "markdown": "    - a\n- b\n"},
+    {"id": 4, "markdown": "# A\n\ntext\n", "options": {"complete": True, "profile": True, "unnumbered": True}},
+    {"markdown": 5},
+]
+
+
+def stream(lines, *args):
+    result = CliRunner().invoke(md2x, ["stream", *args], input="".join(lines))
+    assert result.exit_code == 0, result.output
+    return [json.loads(line) for line in result.stdout.splitlines()]
+
+
+def test_stream_records():
+    lines = [json.dumps(record) + "\n" for record in records]
+    results = stream(lines[:2] + ["not json\n", "\n"] + lines[2:])
+    assert [r["id"] for r in results] == [1, "b", None, 3, 4, None]  # in order, blank lines skipped
+    assert results[0]["tex"] == convert_markdown(records[0]["markdown"])
+    assert results[1]["error"] == {"error": "ValueError", "message": "unknown options: bogus"}
+    assert results[2]["error"]["error"] == "JSONDecodeError"
+    assert results[3]["error"]["error"] == "IndentationException" and results[3]["error"]["key"] == "firstindent"
+    assert results[4]["tex"].startswith("\\documentclass") and "\\section*{A}" in results[4]["tex"]
+    assert "MDHeader.convert" in results[4]["timings"]["stages"]
+    assert results[5]["error"]["message"] == "expected an object with a `markdown` string"
+    for result in results:
+        assert set(result["timings"]) >= {"parse", "convert", "total"}
+
+
+def test_stream_files(tmp_path):
+    source = tmp_path / "in.ndjson"
+    source.write_text(json.dumps({"id": 1, "markdown": "Ça va?"}, ensure_ascii=False) + "\n", encoding="utf-8")
+    stream([], str(source), "-o", str(tmp_path / "out.ndjson"))
+    result = json.loads((tmp_path / "out.ndjson").read_text(encoding="utf-8"))
+    assert result["tex"] == convert_markdown("Ça va?")
+    assert "Ça va?" in (tmp_path / "out.ndjson").read_text(encoding="utf-8")  # not escaped
+
+
+def test_stdin_stdout():
+    result = CliRunner().invoke(md2x, ["-", "-f", "tex", "-o", "-"], input="# T\n\nhi\n")
+    assert result.exit_code == 0, result.output
+    assert result.stdout == convert_markdown("# T\n\nhi\n")
@@ -0,0 +1,42 @@
+from utils.converters import MDList
+from utils.pipeline import convert_markdown
+from utils.texcheck import check_tex
+
+
+def messages(tex: str):
+    return [(d["line"], d["column"], d["message"]) for d in check_tex(tex)]
+
+
+def test_balanced():
+    tex = ("\\documentclass{article}\n\\newenvironment{box}{\\begin{center}}{\\end{center}}\n"
+           "\\begin{document}\n\\textbf{a \\{ b} % } {\n\\verb|}{|\n"
+           "\\begin{lstlisting}\n} \\end{itemize}\n\\end{lstlisting}\n\\end{document}\n")
+    assert check_tex(tex) == []
+
+
+def test_positions():
+    tex = "\\begin{document}\nab}\n\\begin{center}\n{x\n\\end{itemize}\n\\end{document}\n"
+    assert messages(tex) == [
+        (2, 3, "`}` closes no group"),
+        (4, 1, "`{` is never closed"),
+        (5, 1, "`\\end{itemize}` closes `\\begin{center}` of line 3"),
+        (6, 1, "`\\end{document}` closes `\\begin{center}` of line 3"),
+    ]
+    assert check_tex(tex, "chapter")[0]["file"] == "chapter.tex"
+
+
+def test_leftover_tokens():
+    assert messages("a\n  @@CODETOKEN3@@ and USERRESERVEDTOKEN\n") == [
+        (2, 3, "leftover `@@CODETOKEN3@@`"), (2, 22, "leftover `USERRESERVEDTOKEN`")]
+    # written by the user as inline code: not leftovers of the conversion
+    assert check_tex("\\texttt{@@CODETOKEN0@@} \\texttt{a {USERRESERVEDTOKEN}} \\lstinline{@@TABLEINCLUDE1@@}\n") == []
+    assert check_tex(convert_markdown("Use `@@CODETOKEN0@@` here.\n\n```\n@@CODETOKEN1@@\n```\n")) == []
+    assert len(check_tex("\\texttt{a} @@CODETOKEN0@@\n")) == 1
+
+
+def test_nested_enumerate():
+    tex = MDList.enumerate_env("1. a\n    1. b\n        1. c\n2. d\n")
+    assert tex.count("\\begin{enumerate}") == tex.count("\\end{enumerate}") == 3
+    assert "\\end{itemize}" not in tex
+    assert check_tex(tex) == []
+    assert check_tex(convert_markdown("1. a\n    1. b\n        1. c\n\ntext\n")) == []
@@ -0,0 +1,48 @@
+import functools
+import time
+
+from md2x import _watch_build, make_options
+from utils.watch import RebuildScheduler
+
+
+def _wait(scheduler, timeout=30.0):
+    end = time.monotonic() + timeout
+    while not scheduler.idle() and time.monotonic() < end:
+        time.sleep(0.05)
+
+
+def test_rebuild_can_start_process_pools(tmp_path):
+    source = tmp_path / "paper.md"
+    source.write_text("# One\n\ntext\n\n# Two\n\nmore\n\n# Three\n\nend\n")
+    output = tmp_path / "out" / "paper.tex"
+    output.parent.mkdir()
+    options = make_options(str(source), split=1, jobs=2)  # the sections are converted on a pool
+    scheduler = RebuildScheduler(functools.partial(_watch_build, str(source), "tex", str(output), options),
+                                 delay=0.01)
+    scheduler.start()
+    try:
+        scheduler.notify()
+        time.sleep(0.1)
+        _wait(scheduler)
+    finally:
+        scheduler.stop()
+    assert scheduler.builds == 1
+    assert output.read_text() == "".join(f"\\input{{md2x-sections/{name}}}\n"
+                                         for name in ("01-one", "02-two", "03-three"))
+    assert (output.parent / "md2x-sections" / "02-two.tex").is_file()
+
+
+def test_cancelled_build(tmp_path):
+    cancelled = []
+    scheduler = RebuildScheduler(functools.partial(time.sleep, 30), delay=0.01,
+                                 on_cancel=lambda: cancelled.append(True))
+    scheduler.start()
+    try:
+        scheduler.notify()
+        time.sleep(0.3)
+        scheduler.notify()  # kills the running build
+        time.sleep(0.3)
+    finally:
+        scheduler.stop()
+    assert scheduler.builds == 2
+    assert cancelled == [True]
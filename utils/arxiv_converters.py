@@ -1,22 +1,30 @@
+import csv
+import os
 import re
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cache import cache_dir, file_digest, text_digest
+from .converters import MDHeader
+from .errors_warnings import InputException
+from .metrics import Metrics
 
 class ArxivMetadata:
     """
     Extract and format metadata for ArXiv submissions
     """
     @staticmethod
-    def extract_title(string: str) -> Tuple[str, str]:
+    def extract_title(string: str, headings: List[Dict] = None) -> Tuple[str, str]:
         """
         Extract title from markdown and format for LaTeX
+        The title is the first H1 header of the heading index (`MDHeader.index()`),
+        built if `headings` is not given
         """
-        # Look for the first H1 header
-        title_match = re.search(r"^#\s+(.+?)$", string, re.MULTILINE)
-        if title_match:
-            title = title_match.group(1).strip()
+        if headings is None:
+            headings = MDHeader.index(string, escaped=False)
+        title = ArxivMetadata.title_heading(headings)
+        if title:
             # Remove the title from the content
-            string = re.sub(r"^#\s+.+?$", "", string, count=1, flags=re.MULTILINE)
-            return title, string
+            return title["text"], string[:title["offset"]] + string[title["end"]:]
         return "", string
     
     @staticmethod
@@ -34,19 +42,66 @@ class ArxivMetadata:
         return "", string
     
     @staticmethod
-    def extract_abstract(string: str) -> Tuple[str, str]:
+    def extract_abstract(string: str, headings: List[Dict] = None) -> Tuple[str, str]:
         """
         Extract abstract section from markdown
+        The abstract is the text of the `## Abstract` section, up to the next header
         """
-        # Look for ## Abstract section
-        abstract_match = re.search(r"^##\s+Abstract\s*\n+([\s\S]+?)(?=^##|\Z)", string, re.MULTILINE)
-        if abstract_match:
-            abstract = abstract_match.group(1).strip()
+        if headings is None:
+            headings = MDHeader.index(string, escaped=False)
+        span = ArxivMetadata.abstract_span(string, headings)
+        if span:
+            start, end = span
             # Remove the abstract section from content
-            string = re.sub(r"^##\s+Abstract\s*\n+[\s\S]+?(?=^##|\Z)", "", string, count=1, flags=re.MULTILINE)
-            return abstract, string
+            header_end = next(h["end"] for h in headings if h["offset"] == start)
+            return string[header_end:end].strip(), string[:start] + string[end:]
         return "", string
     
+    @staticmethod
+    def title_heading(headings: List[Dict]) -> Dict:
+        """
+        The heading of the title: the first H1 header with a text
+        """
+        return next((h for h in headings if h["level"] == 1 and h["text"]), None)
+    
+    @staticmethod
+    def abstract_span(string: str, headings: List[Dict]) -> Tuple[int, int]:
+        """
+        The (start, end) offsets of the `## Abstract` section, or None
+        """
+        for n, heading in enumerate(headings):
+            if heading["level"] == 2 and heading["text"] == "Abstract":
+                end = headings[n + 1]["offset"] if n + 1 < len(headings) else len(string)
+                if string[heading["end"]:end].strip():
+                    return heading["offset"], end
+        return None
+    
+    @staticmethod
+    def extract(string: str) -> Tuple[str, str, str, str]:
+        """
+        Extract the title, authors and abstract of a document, indexing its headers once
+        Returns (title, authors, abstract, remaining content)
+        """
+        authors, string = ArxivMetadata.extract_authors(string)
+        headings = MDHeader.index(string, escaped=False)
+        title = ArxivMetadata.title_heading(headings)
+        abstract = ""
+        cuts = []  # (start, end) of the parts to remove
+        if title:
+            cuts.append((title["offset"], title["end"]))
+        span = ArxivMetadata.abstract_span(string, headings)
+        if span:
+            header_end = next(h["end"] for h in headings if h["offset"] == span[0])
+            abstract = string[header_end:span[1]].strip()
+            cuts.append(span)
+        parts = []
+        prev = 0
+        for start, end in sorted(cuts):
+            parts.append(string[prev:start])
+            prev = end
+        parts.append(string[prev:])
+        return title["text"] if title else "", authors, abstract, "".join(parts)
+    
     @staticmethod
     def format_title_block(title: str, authors: str, date: str = "") -> str:
         """
@@ -79,75 +134,270 @@ class ArxivMetadata:
 class ArxivTable:
     """
     Convert markdown tables to LaTeX tables
+
+    tables are found with a single line scan and built with list joins, so the
+    conversion is linear in the number of rows. tables with more body rows
+    than `longtable_threshold` are emitted as a `longtable`, which can break
+    across pages, instead of a floating `tabular`.
     """
+    longtable_threshold = 50  # default number of body rows above which `longtable` is used
+    alignments = {
+        (True, True): "c",  # :---:
+        (False, True): "r",  # ---:
+        (True, False): "l",  # :---
+        (False, False): "l",  # ---
+    }
+
     @staticmethod
-    def convert_tables(string: str) -> str:
+    def convert_tables(string: str, longtable_threshold: int = None) -> str:
         """
         Convert markdown tables to LaTeX format
+
+        a table is a run of consecutive lines that start and end with a `|`.
+        :param string: the document to convert
+        :param longtable_threshold: number of body rows above which a `longtable` is
+                                    created. defaults to `ArxivTable.longtable_threshold`
         """
-        # Find all tables in the markdown
-        table_pattern = r"((?:^\|.+\|$\n)+)"
-        tables = re.finditer(table_pattern, string, re.MULTILINE)
-        
-        for table_match in tables:
-            table_text = table_match.group(0)
-            latex_table = ArxivTable._convert_single_table(table_text)
-            string = string.replace(table_text, latex_table)
-        
-        return string
-    
+        if "|" not in string:
+            return string
+        if longtable_threshold is None:
+            longtable_threshold = ArxivTable.longtable_threshold
+
+        out = []
+        block = []  # lines of the table being scanned
+        lines = string.split("\n")
+        last = len(lines) - 1
+        for i, line in enumerate(lines):
+            if i < last:
+                line += "\n"
+            if ArxivTable._is_table_line(line):
+                block.append(line)
+                continue
+            if block:
+                out.append(ArxivTable._convert_single_table("".join(block), longtable_threshold))
+                block = []
+            out.append(line)
+        if block:
+            out.append(ArxivTable._convert_single_table("".join(block), longtable_threshold))
+
+        return "".join(out)
+
     @staticmethod
-    def _convert_single_table(table_text: str) -> str:
+    def _is_table_line(line: str) -> bool:
+        """
+        check that a line is a markdown table row: `|...|` followed by a line break
+        """
+        return (
+            line.startswith("|")
+            and line.endswith("\n")
+            and len(line) > 3
+            and line[-2] == "|"
+        )
+
+    @staticmethod
+    def _split_row(line: str) -> List[str]:
+        """
+        split a markdown table row into its stripped cells
+        """
+        return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+    @staticmethod
+    def _parse_alignment(cells: List[str]):
+        """
+        parse a separator row (`|:---|:---:|---:|`) into LaTeX column specifiers.
+        :return: a list of column specifiers, or None if `cells` is not a separator row
+        """
+        spec = []
+        for cell in cells:
+            if not re.match(r"^:?-+:?$", cell):
+                return None
+            spec.append(ArxivTable.alignments[(cell.startswith(":"), cell.endswith(":"))])
+        return spec
+
+    @staticmethod
+    def _convert_single_table(table_text: str, longtable_threshold: int = None) -> str:
         """
         Convert a single markdown table to LaTeX
         """
         lines = table_text.strip().split('\n')
         if len(lines) < 2:
             return table_text
-        
-        # Parse the table
-        rows = []
-        for line in lines:
-            # Remove leading and trailing pipes and split
-            cells = [cell.strip() for cell in line.strip('|').split('|')]
-            rows.append(cells)
-        
-        # Check if second row is separator
-        is_header_separator = all(re.match(r'^[-:]+$', cell.strip()) for cell in rows[1])
-        
-        if is_header_separator and len(rows) > 2:
-            header = rows[0]
-            data = rows[2:]
-            col_count = len(header)
+        if longtable_threshold is None:
+            longtable_threshold = ArxivTable.longtable_threshold
+
+        header = ArxivTable._split_row(lines[0])
+        spec = ArxivTable._parse_alignment(ArxivTable._split_row(lines[1]))
+        if spec is not None and len(lines) > 2:
+            body = lines[2:]
         else:
-            data = rows
-            col_count = len(rows[0]) if rows else 0
-        
-        # Build LaTeX table
-        latex = "\\begin{table}[h]\n\\centering\n"
-        latex += "\\begin{tabular}{" + "l" * col_count + "}\n"
-        latex += "\\toprule\n"
-        
-        if is_header_separator and len(rows) > 2:
-            latex += " & ".join(header) + " \\\\\n"
-            latex += "\\midrule\n"
-        
-        for row in data:
-            latex += " & ".join(row) + " \\\\\n"
-        
-        latex += "\\bottomrule\n"
-        latex += "\\end{tabular}\n"
-        latex += "\\caption{Table caption}\n"
-        latex += "\\label{tab:label}\n"
-        latex += "\\end{table}\n"
-        
-        return latex
+            header = None
+            spec = None
+            body = lines
+
+        rows = [" & ".join(ArxivTable._split_row(line)) + " \\\\" for line in body]
+        col_count = len(spec) if spec else len(ArxivTable._split_row(body[0]))
+        colspec = "".join(spec) if spec else "l" * col_count
+        head = [" & ".join(header) + " \\\\", "\\midrule"] if header else []
+
+        if len(rows) > longtable_threshold:
+            parts = list(ArxivTable.longtable_lines(colspec, head, rows))
+        else:
+            parts = [
+                "\\begin{table}[h]",
+                "\\centering",
+                "\\begin{tabular}{" + colspec + "}",
+                "\\toprule",
+                *head,
+                *rows,
+                "\\bottomrule",
+                "\\end{tabular}",
+                "\\caption{Table caption}",
+                "\\label{tab:label}",
+                "\\end{table}",
+            ]
+        parts.append("")  # trailing line break
+
+        return "\n".join(parts)
+
+    @staticmethod
+    def longtable_lines(colspec: str, head: List[str], rows: Iterable[str],
+                        caption: str = "Table caption") -> Iterator[str]:
+        """
+        yield the lines of a `longtable` one by one. `rows` may be a lazy iterable,
+        so that very large tables can be written without being held in memory.
+        :param colspec: the LaTeX column specification (`lcr`...)
+        :param head: the header lines, repeated on every page (may be empty)
+        :param rows: the body rows, already formatted as `a & b \\\\`
+        :param caption: the table caption
+        """
+        yield "\\begin{longtable}{" + colspec + "}"
+        yield "\\caption{" + caption + "}\\label{tab:label} \\\\"
+        yield "\\toprule"
+        yield from head
+        yield "\\endfirsthead"
+        yield "\\toprule"
+        yield from head
+        yield "\\endhead"
+        yield "\\bottomrule"
+        yield "\\endlastfoot"
+        yield from rows
+        yield "\\end{longtable}"
+
+
+class ArxivTableInclude:
+    """
+    Expand table include directives into `longtable`s rendered from CSV/TSV files
+
+    a directive is a line of the form `!table[caption](path/to/results.csv)`. the
+    file is streamed row by row into a `.tex` chunk stored in the md2x cache and keyed
+    by the hash and mtime of the file; the document only `\\input`s that chunk, so the
+    table is never held in memory as one string.
+    """
+    directive = re.compile(r"^[ \t]*!table\[(.*?)\]\((.+?\.(?:csv|tsv))\)[ \t]*$", re.M | re.I)
+    fence = re.compile(r"```.*?```", flags=re.S)  # code blocks, whose directives are only shown
+    include_dir = "md2x-tables"  # directory of the chunks, relative to the main .tex file
+    escapes = {
+        "\\": r"\textbackslash{}", "{": r"\{", "}": r"\}", "&": r"\&", "%": r"\%",
+        "$": r"\$", "#": r"\#", "_": r"\_", "~": r"\textasciitilde{}", "^": r"\textasciicircum{}",
+    }
+    escape_re = re.compile(r"[\\{}&%$#_~^]")
+
+    @staticmethod
+    def expand(string: str, base_dir: str = ".") -> Tuple[str, Dict[str, Tuple[str, str]]]:
+        """
+        render the tables of all include directives outside code blocks and replace
+        each directive by a `@@TABLEINCLUDEn@@` token. the tokens survive the rest of the pipeline
+        and are replaced by `inject()` at the end of the conversion.
+
+        :param string: the markdown document
+        :param base_dir: the directory against which relative CSV paths are resolved
+        :return: the updated string and a dict mapping each token to
+                 (path of the chunk relative to the .tex file, path of the chunk in the cache)
+        """
+        if "!table[" not in string:
+            return string, {}
+        includes = {}
+        fences = [fence.span() for fence in ArxivTableInclude.fence.finditer(string)]
+
+        def replace(match):
+            if any(start <= match.start() < end for start, end in fences):
+                return match.group(0)
+            path = match.group(2)
+            if not os.path.isabs(path):
+                path = os.path.join(base_dir, path)
+            if not os.path.isfile(path):
+                raise InputException("not_table_include", path)
+            cached = ArxivTableInclude.render(path, match.group(1))
+            token = f"@@TABLEINCLUDE{len(includes)}@@"
+            relpath = f"{ArxivTableInclude.include_dir}/{os.path.basename(cached)}"
+            includes[token] = (relpath, cached)
+            return f"\n{token}\n"
+
+        return ArxivTableInclude.directive.sub(replace, string), includes
+
+    @staticmethod
+    def inject(string: str, includes: Dict[str, Tuple[str, str]]) -> str:
+        """
+        replace the `@@TABLEINCLUDEn@@` tokens by `\\input{}` commands
+        :param string: the converted TeX
+        :param includes: the dict returned by `expand()`
+        """
+        for token, (relpath, _) in includes.items():
+            string = string.replace(token, "\\input{" + relpath[:-len(".tex")] + "}")
+        return string
+
+    @staticmethod
+    def escape(cell: str) -> str:
+        """
+        escape the LaTeX special characters of a CSV cell
+        """
+        return ArxivTableInclude.escape_re.sub(lambda m: ArxivTableInclude.escapes[m[0]], cell.strip())
+
+    @staticmethod
+    def render(path: str, caption: str = "") -> str:
+        """
+        render a CSV/TSV file to a `longtable`, using the cached chunk if the file
+        did not change. the first row of the file is the table header.
+
+        :param path: the path to the CSV (`.csv`) or TSV (`.tsv`) file
+        :param caption: the caption of the table
+        :return: the path to the rendered chunk in the cache
+        """
+        key = text_digest(file_digest(path), str(os.stat(path).st_mtime_ns), caption)
+        chunk = os.path.join(cache_dir("tables"), f"table-{key[:24]}.tex")
+        hit = os.path.exists(chunk)
+        Metrics.cache("tables", hit)
+        if hit:
+            return chunk
+
+        escape = ArxivTableInclude.escape
+        delimiter = "\t" if path.lower().endswith(".tsv") else ","
+        tmp = f"{chunk}.{os.getpid()}.tmp"
+        with open(path, mode="r", encoding="utf-8", newline="") as src, \
+                open(tmp, mode="w", encoding="utf-8") as dst:
+            reader = csv.reader(src, delimiter=delimiter)
+            header = next(reader, [])
+            head = [" & ".join(escape(c) for c in header) + " \\\\", "\\midrule"] if header else []
+            rows = (" & ".join(escape(c) for c in row) + " \\\\" for row in reader if row)
+            lines = ArxivTable.longtable_lines(
+                "l" * max(len(header), 1), head, rows, escape(caption) or "Table caption"
+            )
+            for line in lines:
+                dst.write(line + "\n")
+        os.replace(tmp, chunk)  # atomic, so that concurrent builds never read a partial chunk
+        return chunk
 
 
 class ArxivMath:
     """
     Handle mathematical expressions for ArXiv
     """
+    # the display (group 1) and inline (group 2) math of the markdown source, which never
+    # spans an empty line. as in pandoc, an inline `$` opens before and closes after a
+    # non-space, and not before a digit, so that `$5 or $10` is not math
+    markdown_math = re.compile(r"\$\$((?:.|\n(?![ \t]*\n))+?)\$\$"
+                               r"|(?<![\\$])\$(?![\s$])((?:[^$\n]|\n(?![ \t]*\n))+?)(?<!\s)\$(?!\d)")
+
     @staticmethod
     def convert_math(string: str) -> str:
         """
@@ -162,6 +412,24 @@ class ArxivMath:
         
         return string
 
+    @staticmethod
+    def protect_math(string: str, store: Callable[[str], str]) -> str:
+        """
+        Keep the math of a markdown document verbatim, during the core conversion
+        Every `$$...$$` (as `\\[...\\]`) and `$...$` is replaced by the token returned by
+        `store()` (see `MDCleaner.prepare_markdown()`), so that it is not escaped. a span
+        holding a code block (an `@@CODETOKEN@@`) is not math
+        """
+        if "$" not in string:
+            return string
+
+        def replace(match):
+            if "@@" in match[0]:
+                return match[0]
+            return store(match[0] if match[1] is None else "\\[" + match[1] + "\\]")
+
+        return ArxivMath.markdown_math.sub(replace, string)
+
 
 class ArxivCitation:
     """
@@ -181,6 +449,26 @@ class ArxivCitation:
         
         return string
     
+    @staticmethod
+    def cited_keys(string: str) -> List[str]:
+        """
+        Collect the keys cited with `\\cite{}` (and its natbib/biblatex variants)
+        in order of first citation. numeric ranges (`\\cite{1-3}`) are expanded.
+        `\\nocite{*}` yields the key `*`.
+        """
+        keys = []
+        seen = set()
+        for match in re.finditer(r"\\(?:no)?cite[a-zA-Z]*\*?(?:\[[^\]]*\])*\{([^}]*)\}", string):
+            for key in match.group(1).split(','):
+                key = key.strip()
+                bounds = re.match(r'^(\d+)-(\d+)$', key)
+                expanded = [str(n) for n in range(int(bounds[1]), int(bounds[2]) + 1)] if bounds else [key]
+                for k in expanded:
+                    if k and k not in seen:
+                        seen.add(k)
+                        keys.append(k)
+        return keys
+
     @staticmethod
     def extract_bibliography(string: str) -> Tuple[str, str]:
         """
@@ -223,41 +511,63 @@ class ArxivEnhancedConverter:
         self.math = ArxivMath()
         self.citation = ArxivCitation()
     
-    def convert_for_arxiv(self, string: str, metadata: Dict[str, str] = None) -> Dict[str, str]:
+    def front_matter(self, string: str, metadata: Dict[str, str] = None, french_quote: bool = False,
+                     unnumbered: bool = False, document_class: str = "article",
+                     bibliography: bool = False) -> Tuple[Dict[str, str], str]:
         """
-        Perform all ArXiv-specific conversions
-        Returns a dictionary with converted components
+        Extract the title, authors, abstract and bibliography of a markdown document
+        Returns the `title_block`, `abstract` and `bibliography` of `convert_for_arxiv()`,
+        and the markdown of the body, still to convert
+
+        The References section is replaced by `\\bibliography{}` only when the entries
+        come from a BibTeX file (`bibliography`); otherwise it stays in the body.
         """
+        from .pipeline import convert_markdown  # which imports this module
+
+        def convert(markdown: str) -> str:
+            return convert_markdown(markdown, french_quote, unnumbered, document_class, arxiv=True).strip()
+
         result = {}
-        
-        # Extract metadata
-        title, string = self.metadata.extract_title(string)
-        authors, string = self.metadata.extract_authors(string)
-        abstract, string = self.metadata.extract_abstract(string)
+        title, authors, abstract, string = self.metadata.extract(string)
+        if bibliography:
+            bibliography, string = self.citation.extract_bibliography(string)
+        else:
+            bibliography = ""
         
         # Format title block
         result['title_block'] = self.metadata.format_title_block(
-            title, 
-            authors, 
+            convert(title) if title else "",
+            convert(authors) if authors else "",
             metadata.get('date', '') if metadata else ''
         )
         
         # Format abstract
         if abstract:
-            result['abstract'] = f"\\begin{{abstract}}\n{abstract}\n\\end{{abstract}}\n"
+            result['abstract'] = f"\\begin{{abstract}}\n{convert(abstract)}\n\\end{{abstract}}\n"
         else:
             result['abstract'] = ""
         
-        # Convert content
-        string = self.table.convert_tables(string)
-        string = self.math.convert_math(string)
-        string = self.citation.convert_citations(string)
-        
-        # Extract bibliography
-        bibliography, string = self.citation.extract_bibliography(string)
         result['bibliography'] = bibliography
+        return result, string
+
+    def convert_for_arxiv(self, string: str, metadata: Dict[str, str] = None,
+                          longtable_threshold: int = None, features: Optional[int] = None,
+                          profile: Optional[List[Dict]] = None, french_quote: bool = False,
+                          unnumbered: bool = False, document_class: str = "article",
+                          bibliography: bool = False) -> Dict[str, str]:
+        """
+        Convert a markdown document for ArXiv
+        Returns a dictionary with converted components
         
-        # Store the processed body
-        result['body'] = string
-        
-        return result
\ No newline at end of file
+        The metadata are read from the markdown, then the body goes through the core
+        conversion once, with the table, math and citation stages (see `convert_markdown()`),
+        which are skipped when `features` (the bitmap of `Features.scan()`, computed from
+        the body if not given) has no such construct.
+        """
+        from .pipeline import convert_markdown  # which imports this module
+
+        result, string = self.front_matter(string, metadata, french_quote, unnumbered, document_class,
+                                           bibliography)
+        result['body'] = convert_markdown(string, french_quote, unnumbered, document_class, features, profile,
+                                          arxiv=True, longtable_threshold=longtable_threshold)
+        return result
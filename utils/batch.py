@@ -0,0 +1,162 @@
+import asyncio
+import fnmatch
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .helpers import copy_if_changed
+from .latex import compile_latex_async
+from .metrics import Metrics
+
+# ---------------------------------------------------------------
+# batch PDF builds: the compile chains of many documents run
+# concurrently under an asyncio scheduler, with a job limit
+# bounded by the CPUs and the available memory. DOCX jobs are
+# written by the conversion itself, without a compile chain
+# ---------------------------------------------------------------
+
+
+def available_memory() -> Optional[int]:
+    """
+    :return: the memory available to new processes in bytes, or None if it can't be read
+    """
+    try:
+        with open("/proc/meminfo", mode="r") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def job_limit(memory_per_job: int = 512, jobs: Optional[int] = None) -> int:
+    """
+    the number of documents compiled at the same time
+    :param memory_per_job: the memory a compilation needs, in MB
+    :param jobs: optional. the number of compilations to run, instead of the number of CPUs
+    :return: the smallest of `jobs` (or the number of CPUs) and the number of compilations
+             that fit in the available memory; at least 1
+    """
+    limit = jobs or os.cpu_count() or 1
+    memory = available_memory()
+    if memory is not None and memory_per_job > 0:
+        limit = min(limit, memory // (memory_per_job * 1024 * 1024))
+    return max(1, limit)
+
+
+def order_jobs(jobs: List[Dict], order: str = "priority") -> List[Dict]:
+    """
+    sort the jobs of a batch: by decreasing `priority`, then by decreasing size of the input
+    (the longest compilations start first, so that they don't end the batch alone)
+    :param jobs: the jobs, with `input` and `priority` keys
+    :param order: `priority`, `size` (ignore the priorities) or `input` (keep the order)
+    """
+    if order == "input":
+        return list(jobs)
+
+    def size(job):
+        try:
+            return os.path.getsize(job["input"])
+        except OSError:
+            return 0
+
+    if order == "size":
+        return sorted(jobs, key=lambda job: -size(job))
+    return sorted(jobs, key=lambda job: (-job.get("priority", 0), -size(job)))
+
+
+def job_priorities(inputs: List[str], rules: Tuple[str, ...]) -> List[int]:
+    """
+    the priority of every input, from `PATTERN=N` rules (the last matching rule wins)
+    :param inputs: the paths of the inputs
+    :param rules: the rules, where `PATTERN` is a glob matched against the path and the name
+    :return: the priorities, 0 for the inputs that match no rule
+    """
+    parsed = []
+    for rule in rules:
+        pattern, _, value = rule.rpartition("=")
+        parsed.append((pattern, int(value)))
+    priorities = []
+    for path in inputs:
+        priority = 0
+        for pattern, value in parsed:
+            if fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(os.path.basename(path), pattern):
+                priority = value
+        priorities.append(priority)
+    return priorities
+
+
+async def _run_job(job: Dict, prepare: Callable[[Dict, str], Optional[str]], semaphore: asyncio.Semaphore,
+                   pool: ProcessPoolExecutor, start: float) -> Dict:
+    """
+    convert a document in the process pool, then run its compile chain, if it has one
+    :return: the job with its result: `ok`, `diagnostics`, `error` and `timings` (seconds)
+    """
+    loop = asyncio.get_running_loop()
+    result = dict(job, ok=False, diagnostics=[], error=None)
+    fmt = job.get("format", "pdf")
+    async with semaphore:
+        started = time.perf_counter()
+        convert = latex = 0.0
+        with tempfile.TemporaryDirectory() as workdir:
+            try:
+                tex = await loop.run_in_executor(pool, prepare, job, workdir)
+                convert = time.perf_counter() - started
+                if tex is not None:
+                    result["diagnostics"] = await compile_latex_async(tex, workdir, job["options"])
+                latex = time.perf_counter() - started - convert
+                document = os.path.join(workdir, f"document.{fmt}")
+                errors = [d for d in result["diagnostics"] if d["level"] == "error"]
+                if os.path.exists(document):  # recoverable LaTeX errors are in the diagnostics
+                    os.makedirs(os.path.dirname(os.path.abspath(job["output"])), exist_ok=True)
+                    copy_if_changed(document, job["output"])
+                    result["ok"] = True
+                elif errors:
+                    result["error"] = errors[0]["message"]
+                else:
+                    result["error"] = f"no {fmt.upper()} produced"
+            except FileNotFoundError as e:
+                result["error"] = f"{e.filename or e} not found"
+            except Exception as e:  # a bad document fails its job, not the batch
+                result["error"] = str(e) or type(e).__name__
+    result["timings"] = {
+        "queued": round(started - start, 3),
+        "convert": round(convert, 3),
+        "latex": round(latex, 3),
+        "total": round(time.perf_counter() - started, 3),
+    }
+    if Metrics.enabled():
+        Metrics.document(fmt, result["ok"], os.path.getsize(job["input"]),
+                         os.path.getsize(job["output"]) if result["ok"] else 0)
+    return result
+
+
+async def _run_batch(jobs: List[Dict], prepare: Callable[[Dict, str], Optional[str]], limit: int) -> List[Dict]:
+    semaphore = asyncio.Semaphore(limit)  # waiters are served in order: the jobs start in order
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=limit) as pool:
+        return await asyncio.gather(*(_run_job(job, prepare, semaphore, pool, start) for job in jobs))
+
+
+def run_batch(jobs: List[Dict], prepare: Callable[[Dict, str], Optional[str]], limit: int,
+              order: str = "priority") -> List[Dict]:
+    """
+    build the PDFs (or DOCX files) of a batch of documents, `limit` at a time
+    :param jobs: the jobs: `{"input", "output", "options", "priority"}`, with the conversion
+                 options of `md2x.make_options()`, and an optional `format`: `pdf` (the
+                 default) or `docx`
+    :param prepare: a module-level function writing `{workdir}/document.tex` (and the files it
+                    needs) for a job, and returning the TeX document; or, for a job without a
+                    compile chain, writing `{workdir}/document.{format}` and returning None.
+                    it runs in worker processes
+    :param limit: the number of jobs running at the same time (see `job_limit()`)
+    :param order: the order the jobs start in (see `order_jobs()`)
+    :return: the results of the jobs, in the order they started (see `_run_job()`)
+    """
+    return asyncio.run(_run_batch(order_jobs(jobs, order), prepare, limit))
@@ -0,0 +1,759 @@
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import cache_dir, file_digest
+from .metrics import Metrics
+
+# ---------------------------------------------------------------
+# a small BibTeX reader and `.bbl` writer. it covers the common
+# styles (`plain`, `unsrt`, `alpha`) so that ArXiv packages can be
+# built without running pdflatex + bibtex to produce `main.bbl`
+# ---------------------------------------------------------------
+
+
+class BibEntry:
+    """
+    a single bibliography entry (`@article{key, ...}`)
+    """
+    __slots__ = ("type", "key", "fields", "raw")
+
+    def __init__(self, type: str, key: str, fields: Dict[str, str], raw: str = ""):
+        """
+        :param type: the lowercased entry type (`article`, `book`...)
+        :param key: the citation key
+        :param fields: the lowercased field names mapped to their values, with the
+                       outer braces or quotes removed and `@string` macros expanded
+        :param raw: the source text of the entry in the .bib file
+        """
+        self.type = type
+        self.key = key
+        self.fields = fields
+        self.raw = raw
+
+    def get(self, field: str, default: str = "") -> str:
+        return self.fields.get(field, default)
+
+
+class BibParser:
+    """
+    parse the contents of a .bib file into `BibEntry` objects.
+
+    the parser is a single forward scan over the file with brace counting:
+    it does not use nested regular expressions, so its cost is linear in the
+    size of the file.
+    """
+    months = {
+        "jan": "January", "feb": "February", "mar": "March", "apr": "April",
+        "may": "May", "jun": "June", "jul": "July", "aug": "August",
+        "sep": "September", "oct": "October", "nov": "November", "dec": "December",
+    }  # predefined `@string` macros
+    entry_start = re.compile(r"@[ \t]*([A-Za-z]+)[ \t\r\n]*[{(]")
+    braces = re.compile(r"[{}]")
+    parens = re.compile(r"[{})]")
+
+    @staticmethod
+    def parse(string: str, keys: Optional[Iterable[str]] = None) -> Tuple[Dict[str, BibEntry], List[str]]:
+        """
+        parse a .bib file.
+        :param string: the contents of the .bib file
+        :param keys: optional. if provided, only the entries with these keys are parsed
+                     into fields; the others are skipped (`@string` macros are always read)
+        :return: a dict mapping the citation keys to their entries (in file order)
+                 and the list of `@preamble` contents
+        """
+        wanted = set(keys) if keys is not None else None
+        macros = dict(BibParser.months)
+        entries = {}
+        preambles = []
+        pos = 0
+        while True:
+            match = BibParser.entry_start.search(string, pos)
+            if match is None:
+                break
+            kind = match.group(1).lower()
+            body_start = match.end()
+            body_end = BibParser._closing(string, body_start - 1)
+            pos = body_end + 1
+            body = string[body_start:body_end]
+
+            if kind == "comment":
+                continue
+            elif kind == "string":
+                name, _, value = body.partition("=")
+                macros[name.strip().lower()] = BibParser._value(value.strip(), macros)
+            elif kind == "preamble":
+                preambles.append(BibParser._value(body.strip(), macros))
+            else:
+                key, _, fields = body.partition(",")
+                key = key.strip()
+                if not key or (wanted is not None and key not in wanted):
+                    continue
+                entries[key] = BibEntry(kind, key, BibParser._fields(fields, macros),
+                                        string[match.start():body_end + 1])
+        return entries, preambles
+
+    @staticmethod
+    def _closing(string: str, start: int) -> int:
+        """
+        find the position of the delimiter closing the one at `start` (`{` or `(`).
+        if the entry is not closed, the end of the string is returned.
+        """
+        depth = 0
+        if string[start] == "{":
+            for match in BibParser.braces.finditer(string, start):
+                depth += 1 if match[0] == "{" else -1
+                if depth == 0:
+                    return match.start()
+        else:
+            for match in BibParser.parens.finditer(string, start + 1):
+                if match[0] == ")" and depth == 0:
+                    return match.start()
+                depth += {"{": 1, "}": -1}.get(match[0], 0)
+        return len(string)
+
+    @staticmethod
+    def _fields(string: str, macros: Dict[str, str]) -> Dict[str, str]:
+        """
+        split the body of an entry (after the key) into `name = value` fields
+        """
+        fields = {}
+        depth = 0
+        quoted = False
+        start = 0
+        for i, c in enumerate(string + ","):
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+            elif c == '"' and depth == 0:
+                quoted = not quoted
+            elif c == "," and depth == 0 and not quoted:
+                name, eq, value = string[start:i].partition("=")
+                if eq:
+                    fields[name.strip().lower()] = BibParser._value(value.strip(), macros)
+                start = i + 1
+        return fields
+
+    @staticmethod
+    def _value(string: str, macros: Dict[str, str]) -> str:
+        """
+        evaluate a field value: `{...}`, `"..."`, numbers and macros concatenated with `#`
+        """
+        parts = []
+        depth = 0
+        quoted = False
+        start = 0
+        for i, c in enumerate(string + "#"):
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+            elif c == '"' and depth == 0:
+                quoted = not quoted
+            elif c == "#" and depth == 0 and not quoted:
+                parts.append(string[start:i].strip())
+                start = i + 1
+        out = []
+        for part in parts:
+            if len(part) >= 2 and part[0] + part[-1] in ("{}", '""'):
+                out.append(part[1:-1])
+            else:
+                out.append(macros.get(part.lower(), part))
+        return re.sub(r"\s+", " ", "".join(out)).strip()
+
+
+class BibIndex:
+    """
+    an on-disk index of a .bib file, keyed by citation key.
+
+    the index maps each key to the byte span of its entry in the file (and to
+    its `crossref` parent), and stores the spans of the `@string` and `@preamble`
+    blocks. it is built with a single scan and cached by the hash of the file,
+    so that large shared bibliographies are only scanned once: later builds read
+    the few cited entries directly with `seek()`.
+    """
+    entry_start = re.compile(rb"@[ \t]*([A-Za-z]+)[ \t\r\n]*[{(]")
+    braces = re.compile(rb"[{}]")
+    parens = re.compile(rb"[{})]")
+    crossref = re.compile(rb"\bcrossref\s*=\s*[{\"]?\s*([^}\",\s]+)", re.I)
+    version = 1  # bump when the format of the cached index changes
+
+    def __init__(self, path: str):
+        """
+        load the index of a .bib file from the cache, or build and cache it
+        :param path: the path to the .bib file
+        """
+        self.path = path
+        digest = file_digest(path)
+        cached = os.path.join(cache_dir("bib"), f"{digest}-v{BibIndex.version}.json")
+        try:
+            with open(cached, mode="r", encoding="utf-8") as fh:
+                index = json.load(fh)
+            Metrics.cache("bib", True)
+        except (FileNotFoundError, ValueError):
+            Metrics.cache("bib", False)
+            index = BibIndex.build(path)
+            tmp = f"{cached}.{os.getpid()}.tmp"
+            with open(tmp, mode="w", encoding="utf-8") as fh:
+                json.dump(index, fh)
+            os.replace(tmp, cached)
+        self.keys = index["entries"]  # {key: [start, end, crossref or None]}
+        self.headers = index["headers"]  # [[start, end]] spans of @string and @preamble blocks
+
+    @staticmethod
+    def build(path: str) -> Dict:
+        """
+        scan a .bib file and build its index
+        :param path: the path to the .bib file
+        :return: the index, as a json-serializable dict
+        """
+        with open(path, mode="rb") as fh:
+            data = fh.read()
+        entries = {}
+        headers = []
+        pos = 0
+        while True:
+            match = BibIndex.entry_start.search(data, pos)
+            if match is None:
+                break
+            kind = match.group(1).lower()
+            end = BibIndex._closing(data, match.end() - 1) + 1
+            pos = end
+            if kind == b"comment":
+                continue
+            if kind in (b"string", b"preamble"):
+                headers.append([match.start(), end])
+                continue
+            key = data[match.end():end].split(b",", 1)[0].strip().decode("utf-8", "replace")
+            if key and key not in entries:
+                ref = BibIndex.crossref.search(data, match.end(), end)
+                entries[key] = [match.start(), end, ref.group(1).decode("utf-8", "replace") if ref else None]
+        return {"entries": entries, "headers": headers}
+
+    @staticmethod
+    def _closing(data: bytes, start: int) -> int:
+        """
+        bytes counterpart of `BibParser._closing()`
+        """
+        depth = 0
+        if data[start:start + 1] == b"{":
+            for match in BibIndex.braces.finditer(data, start):
+                depth += 1 if match[0] == b"{" else -1
+                if depth == 0:
+                    return match.start()
+        else:
+            for match in BibIndex.parens.finditer(data, start + 1):
+                if match[0] == b")" and depth == 0:
+                    return match.start()
+                depth += {b"{": 1, b"}": -1}.get(match[0], 0)
+        return len(data)
+
+    def resolve(self, keys: Iterable[str]) -> List[str]:
+        """
+        the keys to keep for a list of cited keys: the cited keys found in the index
+        followed by their (transitive) `crossref` parents. `*` selects every entry.
+        """
+        keys = list(keys)
+        if "*" in keys:
+            return list(self.keys)
+        out = []
+        seen = set()
+        parents = []
+        for key in keys:
+            if key in self.keys and key not in seen:
+                seen.add(key)
+                out.append(key)
+        i = 0
+        queue = list(out)
+        while i < len(queue):
+            parent = self.keys[queue[i]][2]
+            i += 1
+            if parent and parent in self.keys and parent not in seen:
+                seen.add(parent)
+                parents.append(parent)
+                queue.append(parent)
+        return out + parents  # bibtex wants cross-referenced entries after the entries citing them
+
+    def pruned(self, keys: Iterable[str]) -> str:
+        """
+        the text of a .bib file restricted to some cited keys: all `@string` and
+        `@preamble` blocks, then the cited entries and their `crossref` parents
+        """
+        chunks = []
+        with open(self.path, mode="rb") as fh:
+            for start, end in self.headers + [self.keys[k][:2] for k in self.resolve(keys)]:
+                fh.seek(start)
+                chunks.append(fh.read(end - start).decode("utf-8", "replace"))
+        return "\n\n".join(chunks) + "\n"
+
+    def prune(self, keys: Iterable[str], out_path: str):
+        """
+        write a .bib file restricted to some cited keys (see `pruned()`)
+        :param keys: the cited keys
+        :param out_path: the path of the .bib file to write
+        """
+        with open(out_path, mode="w", encoding="utf-8") as fh:
+            fh.write(self.pruned(keys))
+
+    def parse(self, keys: Iterable[str]) -> Tuple[Dict[str, BibEntry], List[str]]:
+        """
+        parse only the entries needed for some cited keys
+        :return: the same as `BibParser.parse()`
+        """
+        return BibParser.parse(self.pruned(keys))
+
+
+class BibNames:
+    """
+    parse and format BibTeX name lists (`Knuth, Donald E. and Leslie Lamport`)
+    """
+    @staticmethod
+    def split(names: str) -> List[str]:
+        """
+        split a name list on the ` and ` that are not inside braces
+        """
+        out = []
+        depth = 0
+        start = 0
+        lowered = names.lower()
+        i = 0
+        while i < len(names):
+            c = names[i]
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+            elif depth == 0 and lowered.startswith(" and ", i):
+                out.append(names[start:i].strip())
+                i += 5
+                start = i
+                continue
+            i += 1
+        out.append(names[start:].strip())
+        return [n for n in out if n]
+
+    @staticmethod
+    def parse(name: str) -> Tuple[str, str, str, str]:
+        """
+        split a name into its (first, von, last, jr) parts
+        """
+        parts = [p.strip() for p in BibNames._split_top(name, ",")]
+        if len(parts) == 1:
+            words = BibNames._split_top(parts[0], " ")
+            if len(words) == 1:
+                return "", "", words[0], ""
+            # `First von Last`: the von part starts at the first lowercase word
+            von_start = next((i for i, w in enumerate(words[:-1]) if w[:1].islower()), len(words) - 1)
+            von_end = von_start
+            while von_end < len(words) - 1 and words[von_end][:1].islower():
+                von_end += 1
+            return (" ".join(words[:von_start]), " ".join(words[von_start:von_end]),
+                    " ".join(words[von_end:]), "")
+        words = BibNames._split_top(parts[0], " ")
+        von_end = 0
+        while von_end < len(words) - 1 and words[von_end][:1].islower():
+            von_end += 1
+        von, last = " ".join(words[:von_end]), " ".join(words[von_end:])
+        if len(parts) == 2:
+            return parts[1], von, last, ""
+        return parts[2], von, last, parts[1]
+
+    @staticmethod
+    def _split_top(string: str, sep: str) -> List[str]:
+        """
+        split a string on a separator that is not inside braces
+        """
+        out = []
+        depth = 0
+        start = 0
+        for i, c in enumerate(string):
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+            elif c == sep and depth == 0:
+                out.append(string[start:i])
+                start = i + 1
+        out.append(string[start:])
+        return [s for s in out if s.strip()] if sep == " " else out
+
+    @staticmethod
+    def format(names: str) -> str:
+        """
+        format a name list the way `plain.bst` does: `First von Last, Jr`,
+        joined with `,` and `and`
+        """
+        formatted = []
+        for name in BibNames.split(names):
+            if name.lower() == "others":
+                formatted.append("others")
+                continue
+            first, von, last, jr = BibNames.parse(name)
+            out = "~".join(p for p in (first, von) if p)
+            out = f"{out}~{last}" if out else last
+            if jr:
+                out += f", {jr}"
+            formatted.append(out)
+        if formatted and formatted[-1] == "others":
+            return ", ".join(formatted[:-1]) + ", et~al." if len(formatted) > 2 \
+                else formatted[0] + " et~al."
+        if len(formatted) <= 2:
+            return " and ".join(formatted)
+        return ", ".join(formatted[:-1]) + ", and " + formatted[-1]
+
+    @staticmethod
+    def last_names(names: str) -> List[str]:
+        """
+        the `von Last` parts of all names of a name list
+        """
+        out = []
+        for name in BibNames.split(names):
+            _, von, last, _ = BibNames.parse(name)
+            out.append(f"{von} {last}".strip())
+        return out
+
+
+class BblWriter:
+    """
+    write a `.bbl` file (a `thebibliography` environment) from parsed entries,
+    for the `plain`, `unsrt` and `alpha` styles. the order, labels and blocks are
+    those of the `.bst` files, with two differences: entries with a `crossref` are
+    left to bibtex (see `can_render()`), and the widest `alpha` label is the longest
+    one, where bibtex measures the printed width.
+    """
+    styles = ("plain", "unsrt", "alpha")
+    etalchar = "\\newcommand{\\etalchar}[1]{$^{#1}$}"  # written by `alpha.bst` when a label uses it
+
+    @staticmethod
+    def can_render(entries: Dict[str, BibEntry], keys: List[str], style: str = "plain") -> bool:
+        """
+        whether `render()` writes the .bbl that bibtex would: the style is supported and
+        no cited entry has a `crossref`. the `.bst` files print such an entry as
+        `In \\cite{parent}` and add the parents cited by several entries, which is left
+        to bibtex.
+        :param entries: the parsed .bib entries
+        :param keys: the cited keys. `*` cites all entries
+        :param style: the bibliography style
+        """
+        if style not in BblWriter.styles:
+            return False
+        cited = entries if "*" in keys else [k for k in keys if k in entries]
+        return not any(entries[k].get("crossref") for k in cited)
+
+    @staticmethod
+    def render(entries: Dict[str, BibEntry], keys: List[str], style: str = "plain",
+               preambles: List[str] = None) -> str:
+        """
+        render the `.bbl` contents for the cited keys (see `can_render()`).
+        :param entries: the parsed .bib entries
+        :param keys: the cited keys, in citation order. `*` cites all entries
+        :param style: the bibliography style (`plain`, `unsrt` or `alpha`)
+        :param preambles: the `@preamble` contents of the .bib file
+        :return: the string representation of the .bbl file
+        """
+        if style not in BblWriter.styles:
+            raise ValueError(f"unsupported bibliography style `{style}`")
+        if "*" in keys:
+            keys = [k for k in keys if k != "*"] + [k for k in entries if k not in keys]
+        cited = []
+        seen = set()
+        for key in keys:
+            if key in entries and key not in seen:
+                cited.append(entries[key])
+                seen.add(key)
+
+        out = []
+        if style == "alpha":
+            labels = BblWriter._alpha_labels(cited)
+            widest = max(labels.values(), key=len) if labels else ""
+            if any("\\etalchar" in label for label in labels.values()):
+                out.append(BblWriter.etalchar)
+        else:
+            if style == "plain":
+                cited.sort(key=BblWriter._sort_key)
+            labels = {}
+            widest = str(10 ** (len(str(len(cited))) - 1)) if cited else "1"
+
+        if preambles:
+            out.append(" ".join(preambles))
+        out.append("\\begin{thebibliography}{" + widest + "}\n")
+        for entry in cited:
+            label = f"[{labels[entry.key]}]" if entry.key in labels else ""
+            out.append(f"\\bibitem{label}{{{entry.key}}}\n" + BblWriter.format_entry(entry) + "\n")
+        out.append("\\end{thebibliography}\n")
+        return "\n".join(out)
+
+    @staticmethod
+    def _sort_key(entry: BibEntry) -> Tuple[str, str, str]:
+        """
+        the `plain` sort key: author (or editor) last names, year, title
+        """
+        names = entry.get("author") or entry.get("editor")
+        sort_names = " ".join(BibNames.last_names(names)) if names else entry.key
+        return (BibBlocks.purify(sort_names).lower(), entry.get("year"),
+                BibBlocks.purify(entry.get("title")).lower())
+
+    @staticmethod
+    def _alpha_labels(entries: List[BibEntry]) -> Dict[str, str]:
+        """
+        build the `alpha` labels (`Knu84`, `KL86`, `vN45`, `ABC{\\etalchar{+}}90`) and sort the
+        entries by label, then as `plain` does; the entries sharing a label get `a`, `b`...
+        suffixes in that order
+        """
+        labels = {entry.key: BblWriter._alpha_label(entry) for entry in entries}
+        entries.sort(key=lambda e: (BibBlocks.purify(labels[e.key]).lower(), BblWriter._sort_key(e)))
+        counts = {}
+        for label in labels.values():
+            counts[label] = counts.get(label, 0) + 1
+        suffix = {}
+        for entry in entries:
+            label = labels[entry.key]
+            if counts[label] > 1:
+                n = suffix.get(label, 0)
+                suffix[label] = n + 1
+                labels[entry.key] = label + chr(ord("a") + n)
+        return labels
+
+    @staticmethod
+    def _alpha_label(entry: BibEntry) -> str:
+        """
+        the `alpha` label of an entry before duplicates are told apart, as `calc.label`
+        builds it: from the authors (or the editors of a book, only the editors of
+        proceedings), else the first 3 letters of the `key` field, of the organization
+        of a manual or proceedings, or of the citation key; then the end of the year
+        """
+        f = entry.get
+        people = {"book": ("author", "editor"), "inbook": ("author", "editor"),
+                  "proceedings": ("editor",)}.get(entry.type, ("author",))
+        names = next((f(field) for field in people if f(field)), "")
+        if names:
+            label = BblWriter._label_names(names)
+        elif f("key"):
+            label = BibBlocks.prefix(f("key"), 3)
+        elif f("organization") and entry.type in ("manual", "proceedings"):
+            label = BibBlocks.prefix(re.sub(r"^The\s+", "", f("organization")), 3)
+        else:
+            label = entry.key[:3]
+        return label + BibBlocks.purify(f("year"))[-2:]
+
+    @staticmethod
+    def _label_names(names: str) -> str:
+        """
+        the names of an `alpha` label, as `format.lab.names` builds them: the initials of
+        the von and last parts of up to 4 names (`KL`, `LvNS`), or of 3 names and a `+`
+        when there are more or the list ends with `others`. a single name gives its von
+        and last initials if there are 2 or more (`vN`), else the first 3 letters of the
+        last name (`Knu`)
+        """
+        split = BibNames.split(names)
+        if len(split) == 1:
+            _, von, last, _ = BibNames.parse(split[0])
+            label = BibBlocks.initials(von) + BibBlocks.initials(last)
+            return label if BibBlocks.length(label) >= 2 else BibBlocks.prefix(last, 3)
+        label = ""
+        for n, name in enumerate(split[:3] if len(split) > 4 else split):
+            if n == len(split) - 1 and name.lower() == "others":
+                label += "{\\etalchar{+}}"
+            else:
+                _, von, last, _ = BibNames.parse(name)
+                label += BibBlocks.initials(von) + BibBlocks.initials(last)
+        if len(split) > 4:
+            label += "{\\etalchar{+}}"
+        return label
+
+    @staticmethod
+    def format_entry(entry: BibEntry) -> str:
+        """
+        format the body of a `\\bibitem` as `plain.bst` does, one `\\newblock` per block
+        """
+        b = BibBlocks
+        f = entry.get
+        names = b.names(f("author")) or b.names(f("editor"), editor=True)
+        blocks = []
+        if entry.type == "article":
+            blocks = [names, b.title(f("title")),
+                      b.join(b.emph(f("journal")) + b.volume(f("volume"), f("number"), f("pages")),
+                             b.date(f("month"), f("year")))]
+        elif entry.type in ("book", "booklet", "manual"):
+            blocks = [names, b.emph(f("title")),
+                      b.join(f("organization") if entry.type == "manual" else "",
+                             f("publisher"), f("address"), f("howpublished"), b.date(f("month"), f("year")))]
+        elif entry.type in ("inproceedings", "conference", "incollection"):
+            editors = b.names(f("editor"), editor=True) if f("author") else ""
+            blocks = [names, b.title(f("title")),
+                      b.join("In " + b.join(editors, b.emph(f("booktitle"))), b.pages(f("pages")),
+                             f("address"), b.date(f("month"), f("year"))),
+                      b.join(f("organization"), f("publisher"))]
+        elif entry.type in ("phdthesis", "mastersthesis"):
+            kind = "PhD thesis" if entry.type == "phdthesis" else "Master's thesis"
+            blocks = [names, b.emph(f("title")),
+                      b.join(f("type") or kind, f("school"), f("address"), b.date(f("month"), f("year")))]
+        elif entry.type == "techreport":
+            blocks = [names, b.title(f("title")),
+                      b.join(((f("type") or "Technical Report") + " " + f("number")).strip(),
+                             f("institution"), f("address"), b.date(f("month"), f("year")))]
+        else:  # misc, unpublished, online...
+            blocks = [names, b.title(f("title")),
+                      b.join(f("howpublished"), b.url(f("url")), b.date(f("month"), f("year")))]
+        blocks.append(f("note"))
+        return "\n\\newblock ".join(b.period(block) for block in blocks if block)
+
+
+class BibBlocks:
+    """
+    helpers formatting the pieces of a bibliography entry
+    """
+    @staticmethod
+    def purify(string: str) -> str:
+        """
+        remove commands and the characters that are neither letters, digits nor spaces
+        (hyphens and ties become spaces), as `purify$` does for sorting and labels
+        """
+        return re.sub(r"\\[A-Za-z]+\s*|[^\w\s~-]|_", "", string).replace("-", " ").replace("~", " ")
+
+    @staticmethod
+    def _special(string: str, i: int) -> int:
+        """
+        the end of the special character (`{\\"o}`) starting at `i`, or -1 if there is none
+        """
+        if not string.startswith("{\\", i):
+            return -1
+        depth = 0
+        for j in range(i, len(string)):
+            depth += {"{": 1, "}": -1}.get(string[j], 0)
+            if depth == 0:
+                return j + 1
+        return len(string)
+
+    @staticmethod
+    def _characters(string: str) -> List[Tuple[int, int]]:
+        """
+        the characters of a string as `text.length$` and `text.prefix$` count them: a
+        special character is one character, and braces are not counted
+        :return: the end of every character in the string, with the brace depth there
+        """
+        ends = []
+        depth = 0
+        i = 0
+        while i < len(string):
+            end = BibBlocks._special(string, i) if depth == 0 else -1
+            if end != -1:
+                ends.append((end, depth))
+                i = end
+                continue
+            if string[i] == "{":
+                depth += 1
+            elif string[i] == "}":
+                depth = max(depth - 1, 0)
+            else:
+                ends.append((i + 1, depth))
+            i += 1
+        return ends
+
+    @staticmethod
+    def length(string: str) -> int:
+        """
+        the length of a string, as `text.length$` counts it
+        """
+        return len(BibBlocks._characters(string))
+
+    @staticmethod
+    def prefix(string: str, n: int) -> str:
+        """
+        the first `n` characters of a string, as `text.prefix$` takes them: the braces
+        left open are closed
+        """
+        characters = BibBlocks._characters(string)
+        if len(characters) <= n:
+            return string
+        end, depth = characters[n - 1]
+        return string[:end] + "}" * depth
+
+    @staticmethod
+    def initials(part: str) -> str:
+        """
+        the first letter of every word of a name part (words are separated by spaces, ties
+        and hyphens), as `format.name$` abbreviates it with `{l{}}`: `von Neumann` gives `vN`
+        """
+        out = ""
+        for word in re.split(r"[\s~-]+", part):
+            end = BibBlocks._special(word, 0)
+            if end != -1:
+                out += word[:end]
+            else:
+                letter = re.search(r"[^\W\d_]", word)
+                out += letter[0] if letter else ""
+        return out
+
+    @staticmethod
+    def join(*parts: str) -> str:
+        return ", ".join(p for p in parts if p)
+
+    @staticmethod
+    def period(block: str) -> str:
+        return block if block.endswith((".", "?", "!")) else block + "."
+
+    @staticmethod
+    def emph(string: str) -> str:
+        return "{\\em " + string + "}" if string else ""
+
+    @staticmethod
+    def names(names: str, editor: bool = False) -> str:
+        if not names:
+            return ""
+        out = BibNames.format(names)
+        if editor:
+            out += ", editors" if len(BibNames.split(names)) > 1 else ", editor"
+        return out
+
+    @staticmethod
+    def title(title: str) -> str:
+        """
+        change the case of a title as `change.case$` with the `t` option: lowercase
+        everything except the first letter, the letters after a colon and braced groups
+        """
+        out = []
+        depth = 0
+        upper_next = True
+        for c in title:
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+            if depth > 0 or not c.isalpha():
+                out.append(c)
+                if c == ":" and depth == 0:
+                    upper_next = True
+                continue
+            out.append(c if upper_next else c.lower())
+            upper_next = False
+        return "".join(out)
+
+    @staticmethod
+    def pages(pages: str) -> str:
+        if not pages:
+            return ""
+        pages = re.sub(r"\s*-+\s*", "--", pages)
+        return ("pages " if "--" in pages else "page ") + pages
+
+    @staticmethod
+    def volume(volume: str, number: str, pages: str) -> str:
+        """
+        the `, 12(3):45--67` part of an article
+        """
+        out = volume
+        if number:
+            out += f"({number})"
+        if pages:
+            out += (":" if out else "") + re.sub(r"\s*-+\s*", "--", pages)
+        return ", " + out if out else ""
+
+    @staticmethod
+    def date(month: str, year: str) -> str:
+        return " ".join(p for p in (month, year) if p)
+
+    @staticmethod
+    def url(url: str) -> str:
+        return "\\url{" + url + "}" if url else ""
@@ -0,0 +1,203 @@
+import glob
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .cache import file_digest, text_digest
+from .errors_warnings import InputException
+
+# ---------------------------------------------------------------
+# `md2x build`: a json project file lists the outputs to build;
+# the inputs each output depends on are recorded after every
+# build, so that only the stale outputs are rebuilt
+# ---------------------------------------------------------------
+
+
+class BuildProject:
+    """
+    a set of outputs described by a json project file:
+
+        {
+            "outputs": [
+                {
+                    "input": "paper.md",
+                    "format": "pdf",                # optional, defaults to `tex`
+                    "output": "build/paper.pdf",    # optional, defaults to `md2x`'s default output path
+                    "template": "template.tex",     # optional: the options of `md2x convert`
+                    "metadata": "metadata.json",
+                    "bibliography": "references.bib",
+                    "figures": "figures/",
+                    "arxiv": true,
+                    "depends": ["data/*.csv"]       # optional, extra dependencies (glob patterns)
+                }
+            ]
+        }
+
+    paths are relative to the project file. an output depends on its markdown input,
+    template, metadata, bibliography, the files of its figures directory, the images and
+    CSV tables referenced by the markdown, and its `depends` patterns. the digests of these
+    files and the options of every output are stored in `.md2x-build.json`; an output is
+    stale if it does not exist, or if its options or any of its dependencies changed.
+    """
+    state_file = ".md2x-build.json"
+    formats = {"tex": "tex", "pdf": "pdf", "html": "html", "docx": "docx", "arxiv": "_arxiv"}
+    path_options = ("template", "metadata", "bibliography", "figures", "diagnostics")
+    flag_options = ("arxiv", "french_quotes", "unnumbered", "document_class", "longtable_threshold",
+                    "preamble_cache", "split", "optimize_images", "image_dpi")
+    references = re.compile(r"!(?:table)?\[[^\]\n]*\]\(([^)\s]+)\)")  # images and `!table[](file.csv)`
+
+    def __init__(self, path: str):
+        """
+        :param path: the path to the json project file
+        """
+        if not os.path.isfile(path):
+            raise InputException("not_inpath", path)
+        with open(path, mode="r", encoding="utf-8") as fh:
+            try:
+                config = json.load(fh)
+            except ValueError:
+                raise InputException("build_project", path)
+        if not isinstance(config, dict) or not isinstance(config.get("outputs"), list):
+            raise InputException("build_project", path)
+
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.state_path = os.path.join(self.root, BuildProject.state_file)
+        self.targets = [self._target(spec) for spec in config["outputs"]]
+
+    def _path(self, path: str) -> str:
+        return os.path.normpath(os.path.join(self.root, path))
+
+    def _target(self, spec: Dict) -> Dict:
+        """
+        normalize an entry of the project file into a build target:
+        `{"input", "output", "format", "options", "depends"}` with absolute paths.
+        `options` holds keyword arguments for `md2x.make_options()`.
+        """
+        if not isinstance(spec, dict) or "input" not in spec:
+            raise InputException("build_project", json.dumps(spec))
+        source = self._path(spec["input"])
+        fmt = spec.get("format", "tex")
+        if fmt not in BuildProject.formats:
+            raise InputException("build_format", fmt)
+        output = spec.get("output")
+        if output is None:
+            stem = os.path.splitext(source)[0]
+            suffix = BuildProject.formats[fmt]
+            output = stem + suffix if suffix.startswith("_") else f"{stem}.{suffix}"
+        options = {k: self._path(spec[k]) for k in BuildProject.path_options if spec.get(k)}
+        options.update({k: spec[k] for k in BuildProject.flag_options if k in spec})
+        return {
+            "input": source,
+            "output": self._path(output),
+            "format": fmt,
+            "options": options,
+            "depends": [self._path(p) for p in spec.get("depends", [])],
+        }
+
+    def dependencies(self, target: Dict) -> List[str]:
+        """
+        the files an output depends on (see the class docstring)
+        """
+        deps = [target["input"]]
+        options = target["options"]
+        deps += [options[k] for k in ("template", "metadata", "bibliography") if k in options]
+        if "figures" in options:
+            deps += [os.path.join(d, f) for d, _, files in os.walk(options["figures"]) for f in files]
+        if os.path.isfile(target["input"]):
+            base = os.path.dirname(target["input"])
+            with open(target["input"], mode="r", encoding="utf-8", errors="replace") as fh:
+                for match in BuildProject.references.finditer(fh.read()):
+                    path = os.path.normpath(os.path.join(base, match.group(1)))
+                    if os.path.isfile(path):
+                        deps.append(path)
+        for pattern in target["depends"]:
+            deps += glob.glob(pattern, recursive=True)
+        return sorted(set(deps))
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.state_path, mode="r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _record(self, target: Dict, previous: Optional[Dict]) -> Dict:
+        """
+        the state of a target: the digest of its options, and the
+        (mtime, size, digest) of its dependencies. a dependency whose mtime and size
+        did not change since `previous` is not hashed again.
+        """
+        previous = (previous or {}).get("deps", {})
+        deps = {}
+        for path in self.dependencies(target):
+            if not os.path.isfile(path):
+                deps[os.path.relpath(path, self.root)] = None  # missing dependency: always stale
+                continue
+            stat = os.stat(path)
+            key = os.path.relpath(path, self.root)
+            known = previous.get(key)
+            if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+                deps[key] = known
+            else:
+                deps[key] = [stat.st_mtime_ns, stat.st_size, file_digest(path)]
+        options = text_digest(target["format"], json.dumps(target["options"], sort_keys=True))
+        return {"options": options, "deps": deps}
+
+    @staticmethod
+    def _same(old: Optional[Dict], new: Dict) -> bool:
+        if not old or old.get("options") != new["options"] or old["deps"].keys() != new["deps"].keys():
+            return False
+        return all(v is not None and old["deps"][k] is not None and old["deps"][k][2] == v[2]
+                   for k, v in new["deps"].items())
+
+    def plan(self, force: bool = False) -> Tuple[List[Dict], List[Dict], Dict]:
+        """
+        find the stale outputs
+        :param force: consider every output stale
+        :return: the stale targets, the up-to-date targets and the new state of every target
+        """
+        state = self._load_state()
+        stale, fresh, records = [], [], {}
+        for target in self.targets:
+            key = os.path.relpath(target["output"], self.root)
+            records[key] = self._record(target, state.get(key))
+            if force or not os.path.exists(target["output"]) or not BuildProject._same(state.get(key), records[key]):
+                stale.append(target)
+            else:
+                fresh.append(target)
+        return stale, fresh, records
+
+    def build(self, runner: Callable[[Dict], bool], jobs: Optional[int] = None,
+              force: bool = False) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+        """
+        rebuild the stale outputs in parallel and record the new state of the successful ones
+        :param runner: a module-level function building a target, returning True on success.
+                       it is run in worker processes
+        :param jobs: the number of worker processes. defaults to the number of CPUs
+        :param force: rebuild every output
+        :return: the built, failed and up-to-date targets
+        """
+        stale, fresh, records = self.plan(force)
+        results = []
+        for target in stale:
+            os.makedirs(os.path.dirname(target["output"]), exist_ok=True)
+        if len(stale) == 1 or jobs == 1:
+            results = [runner(target) for target in stale]
+        elif stale:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(runner, stale))
+
+        built = [t for t, ok in zip(stale, results) if ok]
+        failed = [t for t, ok in zip(stale, results) if not ok]
+
+        state = self._load_state()
+        for target in built + fresh:  # fresh targets: refresh the mtimes of touched dependencies
+            key = os.path.relpath(target["output"], self.root)
+            state[key] = records[key]
+        for target in failed:
+            state.pop(os.path.relpath(target["output"], self.root), None)
+        with open(self.state_path, mode="w", encoding="utf-8") as fh:
+            json.dump(state, fh, indent=2, sort_keys=True)
+        return built, failed, fresh
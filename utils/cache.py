@@ -0,0 +1,56 @@
+import hashlib
+import os
+
+# -----------------------------------------------
+# on-disk cache shared by the conversion stages.
+# entries are plain files keyed by content hashes,
+# so a changed input never hits a stale entry
+# -----------------------------------------------
+
+
+def cache_root() -> str:
+    """
+    the root directory of the md2x cache. it can be set with the `MD2X_CACHE_DIR`
+    environment variable and defaults to `$XDG_CACHE_HOME/md2x` (`~/.cache/md2x`).
+    """
+    root = os.environ.get("MD2X_CACHE_DIR")
+    if not root:
+        root = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "md2x")
+    return root
+
+
+def cache_dir(namespace: str) -> str:
+    """
+    return (and create if needed) the cache directory of a conversion stage
+    :param namespace: the name of the stage using the cache (`tables`, `bib`...)
+    :return: the absolute path to the directory
+    """
+    path = os.path.join(cache_root(), namespace)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    compute the sha256 of a file by streaming it in chunks
+    :param path: the path to the file to hash
+    :param chunk_size: the number of bytes read at once
+    :return: the hex digest of the file
+    """
+    h = hashlib.sha256()
+    with open(path, mode="rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def text_digest(*parts: str) -> str:
+    """
+    compute the sha256 of one or several strings
+    :return: the hex digest of the strings
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
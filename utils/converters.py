@@ -1,5 +1,7 @@
 import re
+from typing import Callable, Dict, List, Optional, Set
 
+from .errors_warnings import Warnings
 from .minted import languages
 from .helpers import process_list_indentation
 
@@ -24,9 +26,11 @@ class MDSimple:
         r"(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)": r"\\textit{\1}",  # italics
         r"(?<!`)`(?!`)(.+?)(?<!`)`(?!`)": r"\\texttt{\1}",  # inline code
 
-        # images and hyperlink
-        r"(?<!!)\[(.*?)\]\((.*?)\)": r"\\href{\2}{\1}",  # hyperlink
-        r"!\[(.*?)\]\((.*?)\)": r"""
+        # images and hyperlink. the text may hold one level of brackets and the url one
+        # level of parentheses; unlike `.*?`, these patterns stop at the next link instead
+        # of rescanning the whole line from every `[`
+        r"(?<!!)\[((?:[^\[\]\n]|\[[^\[\]\n]*\])*)\]\(((?:[^()\[\]\n]|\([^()\[\]\n]*\))*)\)": r"\\href{\2}{\1}",  # hyperlink
+        r"!\[((?:[^\[\]\n]|\[[^\[\]\n]*\])*)\]\(((?:[^()\[\]\n]|\([^()\[\]\n]*\))*)\)": r"""
 \\begin{figure}[h!]
     \\centering
     \\includegraphics[width=\\linewidth]{\2}
@@ -51,50 +55,163 @@ class MDSimple:
 
 
 class MDHeader:
-    """
+    r"""
     header substitutions
 
+    headers are found in a single pass into a heading index (`index()`), which drives the
+    LaTeX sectioning (`convert()`), the JSON outline (`outline()`) and the extraction of the
+    ArXiv title and abstract.
+
     contains
     --------
     book_unnumbered: a dict to convert markdown headers to latex `book` document class unnumbered sections
     book_numbered: a dict to convert markdown headers to latex `book` document class numbered sections
     article_unnumbered: a dict to convert markdown headers to latex `book` document class unnumbered sections
     article_numbered: a dict to convert markdown headers to latex `book` document class numbered sections
+    the dicts map a header level to its replacement; the last level is used for all the
+    deeper levels.
     """
+    escaped = re.compile(r"^[^\S\n]*((?:\\#)+)(?!\\)(.*?)$", flags=re.M)  # after `prepare_markdown()`
+    raw = re.compile(r"^[^\S\n]*(#+)(?!\S)(.*?)$", flags=re.M)  # in the markdown source: `# title`
+    fence = re.compile(r"```.*?```", flags=re.S)  # code blocks, whose lines are not headers
+
     book_numbered = {
-        r"^\s*(\\#){1}(?!\\#?)(.*?)$": r"\\chapter{\2}\n",  # 1st level title
-        r"^\s*(\\#){2}(?!\\#?)(.*?)$": r"\\section{\2}\n",  # 2nd level title
-        r"^\s*(\\#){3}(?!\\#?)(.*?)$": r"\\subsection{\2}\n",  # 3rd level title
-        r"^\s*(\\#){4}(?!\\#?)(.*?)$": r"\\subsubsection{\2}\n",  # 4th level title
-        r"^\s*(\\#){5,}(?!\\#?)(.*?)$": r"\n\n\\textbf{\2}\n\n",  # 5th+ level title
+        1: r"\\chapter{\2}\n",  # 1st level title
+        2: r"\\section{\2}\n",  # 2nd level title
+        3: r"\\subsection{\2}\n",  # 3rd level title
+        4: r"\\subsubsection{\2}\n",  # 4th level title
+        5: r"\n\n\\textbf{\2}\n\n",  # 5th+ level title
     }
     book_unnumbered = {
-        r"^\s*(\\#){1}(?!\\#?)(.*?)$": r"\\chapter*{\2}\n\\addcontentsline{toc}{chapter}{\2}\n",
-        r"^\s*(\\#){2}(?!\\#?)(.*?)$": r"\\section*{\2}\n\\addcontentsline{toc}{section}{\2}\n",
-        r"^\s*(\\#){3}(?!\\#?)(.*?)$": r"\\subsection*{\2}\n\\addcontentsline{toc}{subsection}{\2}\n",
-        r"^\s*(\\#){4}(?!\\#?)(.*?)$": r"\\subsubsection*{\2}\n\\addcontentsline{toc}{subsubsection}{\2}\n",
-        r"^\s*(\\#){5,}(?!\\#?)(.*?)$": r"\n\n\\noindent{}\\textbf{\2}\n\n",
+        1: r"\\chapter*{\2}\n\\addcontentsline{toc}{chapter}{\2}\n",
+        2: r"\\section*{\2}\n\\addcontentsline{toc}{section}{\2}\n",
+        3: r"\\subsection*{\2}\n\\addcontentsline{toc}{subsection}{\2}\n",
+        4: r"\\subsubsection*{\2}\n\\addcontentsline{toc}{subsubsection}{\2}\n",
+        5: r"\n\n\\noindent{}\\textbf{\2}\n\n",
     }
     article_numbered = {
-        r"^\s*(\\#){1}(?!\\#?)(.*?)$": r"\\section{\2}\n",  # 1st level title
-        r"^\s*(\\#){2}(?!\\#?)(.*?)$": r"\\subsection{\2}\n",  # 2nd level title
-        r"^\s*(\\#){3}(?!\\#?)(.*?)$": r"\\subsubsection{\2}\n",  # 3rd level title
-        r"^\s*(\\#){4,}(?!\\#?)(.*?)$": r"\n\n\\noindent{}\\textbf{\2}\n\n",  # 4th level title
+        1: r"\\section{\2}\n",  # 1st level title
+        2: r"\\subsection{\2}\n",  # 2nd level title
+        3: r"\\subsubsection{\2}\n",  # 3rd level title
+        4: r"\n\n\\noindent{}\\textbf{\2}\n\n",  # 4th level title
     }
     article_unnumbered = {
-        r"^\s*(\\#){1}(?!\\#?)(.*?)$": r"\\section*{\2}\n\\addcontentsline{toc}{section}{\2}\n",
-        r"^\s*(\\#){2}(?!\\#?)(.*?)$": r"\\section*{\2}\n\\addcontentsline{toc}{subsection}{\2}\n",
-        r"^\s*(\\#){3}(?!\\#?)(.*?)$": r"\\subsection*{\2}\n\\addcontentsline{toc}{subsubsection}{\2}\n",
-        r"^\s*(\\#){4,}(?!\\#?)(.*?)$": r"\n\n\\noindent{}\\textbf{\2}\n\n",
+        1: r"\\section*{\2}\n\\addcontentsline{toc}{section}{\2}\n",
+        2: r"\\section*{\2}\n\\addcontentsline{toc}{subsection}{\2}\n",
+        3: r"\\subsection*{\2}\n\\addcontentsline{toc}{subsubsection}{\2}\n",
+        4: r"\n\n\\noindent{}\\textbf{\2}\n\n",
     }
 
     @staticmethod
-    def convert(string: str, unnumbered: bool, document_class: str):
+    def _matches(string: str, escaped: bool = True):
+        """
+        find the headers of a string, in order
+        :param string: the string representation of the markdown file
+        :param escaped: whether the string was escaped by `MDCleaner.prepare_markdown()`
+                        (`\#`), or is the markdown source (`#`), whose code blocks are skipped
+        :return: a generator of (match, level)
+        """
+        if escaped:
+            for match in MDHeader.escaped.finditer(string):
+                yield match, len(match.group(1)) // 2
+            return
+        fences = MDHeader.fence.finditer(string)
+        fence = next(fences, None)
+        for match in MDHeader.raw.finditer(string):
+            while fence is not None and fence.end() <= match.start():
+                fence = next(fences, None)
+            if fence is None or match.end() <= fence.start():
+                yield match, len(match.group(1))
+
+    @staticmethod
+    def slug(text: str) -> str:
+        """
+        the label of a header text, before the duplicates are numbered
+        """
+        return "sec:" + (re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "section")
+
+    @staticmethod
+    def _label(text: str, labels: Set[str], counts: Dict[str, int]) -> str:
+        """
+        the unique label of a header: the duplicates of a label are numbered `-2`, `-3`...
+        :param labels: the labels already used, updated with the new one
+        :param counts: {label: the last number tried for its duplicates}, updated
+        """
+        label = base = MDHeader.slug(text)
+        while label in labels:
+            counts[base] = counts.get(base, 1) + 1
+            label = f"{base}-{counts[base]}"
+        labels.add(label)
+        return label
+
+    @staticmethod
+    def index(string: str, escaped: bool = True, used: Optional[Set[str]] = None):
+        r"""
+        build the heading index of a string in one pass
+        :param string: the string representation of the markdown file
+        :param escaped: see `_matches()`
+        :param used: optional. the labels of the previous parts of the document (see `shared_labels()`)
+        :return: a list of `{"level", "text", "offset", "end", "label"}`, in document order:
+                 `offset` and `end` delimit the header line in `string`, and `label` is
+                 a unique `sec:...` label generated from the text
+        """
+        headings = []
+        labels = set(used or ())
+        counts = {}
+        for match, level in MDHeader._matches(string, escaped):
+            text = match.group(2).strip()
+            headings.append({"level": level, "text": text, "offset": match.start(),
+                             "end": match.end(), "label": MDHeader._label(text, labels, counts)})
+        return headings
+
+    @staticmethod
+    def shared_labels(parts: List[List[str]]) -> List[Set[str]]:
+        r"""
+        the labels a document gives to the headers of its previous parts, for the parts
+        converted apart (`utils/split.py`, `utils/parallel.py`): a part converted with them
+        (`convert(used=...)`) numbers its duplicate headers as the whole document does.
+        only the labels a header of the part could collide with are kept.
+        :param parts: the texts of the headers of every part, in order
+        :return: the labels used before every part
+        """
+        labels = set()
+        counts = {}
+        numbered = {}  # {label without its number: the labels `label-<n>` of the document so far}
+        shared = []
+        for texts in parts:
+            bases = {MDHeader.slug(text) for text in texts}
+            shared.append((bases & labels).union(*(numbered.get(base, ()) for base in bases)))
+            for text in texts:
+                label = MDHeader._label(text, labels, counts)
+                numbered.setdefault(re.sub(r"-\d+$", "", label), []).append(label)
+        return shared
+
+    @staticmethod
+    def outline(headings):
         """
-        perform the conversion: replace markdown titles by numbered or unnumbered LaTeX titles
+        nest a heading index into an outline, serializable as json
+        :param headings: the heading index (see `index()`)
+        :return: the top level headings, each with the headings it contains in `children`
+        """
+        root = {"level": 0, "children": []}
+        stack = [root]
+        for heading in headings:
+            node = dict(heading, children=[])
+            while stack[-1]["level"] >= heading["level"]:
+                stack.pop()
+            stack[-1]["children"].append(node)
+            stack.append(node)
+        return root["children"]
+
+    @staticmethod
+    def convert(string: str, unnumbered: bool, document_class: str, used: Optional[Set[str]] = None):
+        r"""
+        perform the conversion: replace markdown titles by numbered or unnumbered LaTeX titles.
+        every sectioning command is followed by the `\label{}` of the heading index (`index()`)
         :param string: the markdown representation of the string to convert
         :param unnumbered: flag argument indicating that the LaTeX headers should be unnumbered
         :param document_class: the class to convert the document to
+        :param used: optional. the labels of the previous parts of the document (see `shared_labels()`)
         :return: processed string
         """
         if unnumbered is True:
@@ -107,9 +224,38 @@ class MDHeader:
                 substitute = MDHeader.article_numbered
             else:
                 substitute = MDHeader.book_numbered
-        for k, v in substitute.items():
-            string = re.sub(k, v, string, flags=re.M)
-        return string
+        deepest = max(substitute)
+
+        # the blank lines before a header are replaced with it. the headers used to be
+        # replaced one level after the other, and the output keeps the spacing this gave:
+        # after the header of a level replaced before this one, the blank lines and all but
+        # one of the trailing newlines of its replacement are removed.
+        parts = []
+        prev = 0
+        labels = set(used or ())
+        counts = {}
+        last = None  # (index of the replacement of the previous header in `parts`, its level, its span)
+        for match, level in MDHeader._matches(string):
+            label = MDHeader._label(match.group(2).strip(), labels, counts)
+            level = min(level, deepest)
+            pos = match.start()
+            while pos > 0 and string[pos - 1].isspace():
+                pos -= 1
+            if last is not None and last[1] < level and last[2][0] < pos <= last[2][1]:  # right after it
+                parts[last[0]] = parts[last[0]].rstrip() + "\n"
+            elif pos == 0:
+                parts.append(string[prev:0])
+            else:
+                parts.append(string[prev:string.index("\n", pos - 1) + 1])
+            replacement = match.expand(substitute[level])
+            if replacement.startswith("\\"):  # a sectioning command, not a bold paragraph
+                command, _, rest = replacement.partition("\n")
+                replacement = f"{command}\\label{{{label}}}\n{rest}"
+            parts.append(replacement)
+            last = (len(parts) - 1, level, match.span())
+            prev = match.end()
+        parts.append(string[prev:])
+        return "".join(parts)
 
 
 class MDQuote:
@@ -156,14 +302,99 @@ class MDQuote:
 
 
 class MDList:
-    """
+    r"""
     list substitution: replace markdown nested lists by LaTeX nested lists
 
+    lists are found by `blocks()`, a single pass over the lines of the document: a list
+    starts with a list item line and runs over the following non-empty lines. this is
+    what the regexes `((^[ \t]*?-(?!-{2,}).*?\n)+(.+\n)*)+` and
+    `((^[ \t]*?\d+\..*?\n?)+(.+\n?)*)+` used to match, without their nested quantifiers.
+
     contains
     --------
     unoredered_l(): create latex `itemize` envs from md unnumbered lists
     ordered_l(): create latex `enumerate` envs from md numbered lists
+    blocks(): find the spans of the lists of a document in linear time
+    join_items(): group the lines of every list item on a single line
+    replace_blocks(): replace the lists of a document by latex envs
     """
+    unordered_item = re.compile(r"[ \t]*-(?!-{2,})")  # `---` is a horizontal rule
+    ordered_item = re.compile(r"[ \t]*\d+\.")
+    unordered_marker = re.compile(r"-")
+    ordered_marker = re.compile(r"\d+\.")
+
+    @staticmethod
+    def blocks(string: str, item, terminated: bool):
+        r"""
+        find the lists of a markdown string, without backtracking: every line is read once.
+        :param string: the string representation of the markdown file
+        :param item: a compiled regex matching the beginning of a list item line
+        :param terminated: whether the lines of the list must end with a `\n` (a list
+                           item on the unterminated last line of `string` is not a list)
+        :return: an iterator over the `(start, end)` offsets of the lists in `string`
+        """
+        pos = 0
+        size = len(string)
+        while pos < size:
+            eol = string.find("\n", pos)
+            if eol == -1:
+                eol = size
+            if not item.match(string, pos) or (terminated and eol == size):
+                pos = eol + 1
+                continue
+            start = pos  # a list item: the list runs until an empty line
+            pos = eol + 1
+            while pos < size:
+                eol = string.find("\n", pos)
+                if eol == pos:
+                    break
+                if eol == -1:
+                    if not terminated:
+                        pos = size
+                    break
+                pos = eol + 1
+            yield start, min(pos, size)
+
+    @staticmethod
+    def join_items(lstext: str, item) -> str:
+        r"""
+        group every list item into a single line: a `\n` that is not followed by another
+        list item (after optional whitespace, possibly over blank lines) is replaced by a
+        space, as `re.sub(r"\n(?!\s*-)", " ", lstext)` does, in a single backward pass.
+        :param lstext: the markdown list
+        :param item: a compiled regex matching the beginning of a list item
+        :return: the list, with one item per line
+        """
+        lines = lstext.split("\n")
+        nextitem = False  # whether the next non-blank text starts a list item
+        separators = []
+        for line in reversed(lines[1:]):
+            stripped = line.lstrip()
+            if stripped:
+                nextitem = item.match(stripped) is not None
+            separators.append("\n" if nextitem else " ")
+        separators.reverse()
+        return lines[0] + "".join(sep + line for sep, line in zip(separators, lines[1:]))
+
+    @staticmethod
+    def replace_blocks(string: str, item, terminated: bool, convert) -> str:
+        r"""
+        replace every list of `string` by its LaTeX representation
+        :param string: the string representation of the markdown file
+        :param item: see `blocks()`
+        :param terminated: see `blocks()`
+        :param convert: the function building the latex environment of a list
+        :return: the updated string representation of a markdown file
+        """
+        parts = []
+        prev = 0
+        for start, end in MDList.blocks(string, item, terminated):
+            parts.append(string[prev:start])
+            parts.append(convert(string[start:end]))
+            prev = end
+        parts.append(string[prev:])
+        return "".join(parts)
+
     @staticmethod
     def unordered_l(string: str):
         """
@@ -171,41 +402,42 @@ class MDList:
         :param string:  the string representation of the markdown file
         :return: the updated string representation of a markdown file
         """
-        lists = re.finditer(r"((^[ \t]*?-(?!-{2,}).*?\n)+(.+\n)*)+", string, flags=re.MULTILINE)
-        for ls in lists:
-            # prepare list building
-            lstext = ls[0]  # extract list text
-            string = string.replace(lstext, "@@LISTTOKEN@@")  # add token to source
-            lstext = re.sub(r"\n(?!\s*-)", " ", lstext, flags=re.M)  # group list item into one line
-
-            lsitems = process_list_indentation(lstext)  # process the visual indentation
-
-            # build the `\itemize{}`
-            items = ""
-            prev = 0  # previous indentation level
-            for li in lsitems:
-                # open/close the good number of envs
-                if li[1] - prev > 0:  # if there are envs to open; shouldn't be > 1 env to open, but just in case
-                    items += "\\begin{itemize} \n \\item " * (li[1] - prev)
-                    items += li[0] + "\n"
-                elif li[1] - prev < 0:  # if there are envs to close
-                    items += "\\end{itemize}\n" * (prev - li[1])
-                    items += "\\item " + li[0] + "\n"
-                else:  # no envs to open/close
-                    items += "\\item " + li[0] + "\n"
-                prev = li[1]
-
-            items += "\\end{itemize}\n" * prev  # close the remaining nested envs
-
-            # once the list of \item and possibly nested `itemize` is built,
-            # build the final itemize, add it to the markdown string and that's it !
-            itemize = r"""
+        return MDList.replace_blocks(string, MDList.unordered_item, True, MDList.itemize_env)
+
+    @staticmethod
+    def itemize_env(lstext: str):
+        """
+        build the `itemize` environment of a markdown unnumbered list
+        :param lstext: the markdown list
+        :return: the latex representation of the list
+        """
+        lstext = MDList.join_items(lstext, MDList.unordered_marker)  # group list item into one line
+
+        lsitems = process_list_indentation(lstext)  # process the visual indentation
+
+        # build the `\itemize{}`
+        items = ""
+        prev = 0  # previous indentation level
+        for li in lsitems:
+            # open/close the good number of envs
+            if li[1] - prev > 0:  # if there are envs to open; shouldn't be > 1 env to open, but just in case
+                items += "\\begin{itemize} \n \\item " * (li[1] - prev)
+                items += li[0] + "\n"
+            elif li[1] - prev < 0:  # if there are envs to close
+                items += "\\end{itemize}\n" * (prev - li[1])
+                items += "\\item " + li[0] + "\n"
+            else:  # no envs to open/close
+                items += "\\item " + li[0] + "\n"
+            prev = li[1]
+
+        items += "\\end{itemize}\n" * prev  # close the remaining nested envs
+
+        # once the list of \item and possibly nested `itemize` is built,
+        # build the final itemize and that's it !
+        return r"""
 \begin{itemize}
 @@ITEMTOKEN@@
 \end{itemize}""".replace("@@ITEMTOKEN@@", items)
-            string = string.replace("@@LISTTOKEN@@", itemize)
-
-        return string
 
     @staticmethod
     def ordered_l(string: str):
@@ -215,41 +447,43 @@ class MDList:
         :param string: the string representation of the markdown file
         :return: the updated string representation of a markdown file
         """
-        lists = re.finditer(r"((^[ \t]*?\d+\..*?\n?)+(.+\n?)*)+", string, flags=re.MULTILINE)
-        for ls in lists:
-            # prepare list building
-            lstext = ls[0]  # extract list text
-            string = string.replace(lstext, "@@LISTTOKEN@@")  # replace source list by token
-            lstext = re.sub(r"\n(?!\s*\d+\.)", " ", lstext, flags=re.M)  # group list items into single line
-
-            lsitems = process_list_indentation(lstext)  # process the visual indentation
-
-            # build the `\enumerate{}`
-            items = ""
-            prev = 0  # previous indentation level
-            for li in lsitems:
-                # open/close the good number of envs
-                if li[1] - prev > 0:  # if there are envs to open; shouldn't be > 1 env to open, but just in case
-                    items += "\\begin{enumerate} \n \\item " * (li[1] - prev)
-                    items += li[0] + "\n"
-                elif li[1] - prev < 0:  # if there are envs to close
-                    items += "\\end{enumerate}\n" * (prev - li[1])
-                    items += "\\item " + li[0] + "\n"
-                else:  # no envs to open/close
-                    items += "\\item " + li[0] + "\n"
-                prev = li[1]
-
-            items += "\\end{itemize}\n" * prev  # close the remaining nested envs
-
-            # once the list of \item and possibly nested `enumerate` is built,
-            # build the final enumerate, add it to the markdown string and that's it !
-            enumerate = r"""
+        return MDList.replace_blocks(string, MDList.ordered_item, False, MDList.enumerate_env)
+
+    @staticmethod
+    def enumerate_env(lstext: str):
+        """
+        build the `enumerate` environment of a markdown numbered list
+        :param lstext: the markdown list
+        :return: the latex representation of the list
+        """
+        lstext = MDList.join_items(lstext, MDList.ordered_marker)  # group list items into single line
+
+        lsitems = process_list_indentation(lstext)  # process the visual indentation
+
+        # build the `\enumerate{}`
+        items = ""
+        prev = 0  # previous indentation level
+        for li in lsitems:
+            # open/close the good number of envs
+            if li[1] - prev > 0:  # if there are envs to open; shouldn't be > 1 env to open, but just in case
+                items += "\\begin{enumerate} \n \\item " * (li[1] - prev)
+                items += li[0] + "\n"
+            elif li[1] - prev < 0:  # if there are envs to close
+                items += "\\end{enumerate}\n" * (prev - li[1])
+                items += "\\item " + li[0] + "\n"
+            else:  # no envs to open/close
+                items += "\\item " + li[0] + "\n"
+            prev = li[1]
+
+        items += "\\end{enumerate}\n" * prev  # close the remaining nested envs
+
+        # once the list of \item and possibly nested `enumerate` is built,
+        # build the final enumerate and that's it !
+        return r"""
             \begin{enumerate}
             @@ITEMTOKEN@@
             \end{enumerate}""".replace("@@ITEMTOKEN@@", items)
-            string = string.replace("@@LISTTOKEN@@", enumerate)
 
-        return string
 
 class MDCode:
     """
@@ -274,10 +508,8 @@ class MDCode:
         :param string: the string representation of the markdown file
         :return: the updated string representation of a markdown file
         """
-        matches = re.finditer(r"```((.|\n)*?)```", string, flags=re.M)
-        for m in matches:
+        def convert(m):
             code = m[0]  # isolate the block of code
-            string = string.replace(code, "@@MINTEDTOKEN@@")  # to reinject code to string later
 
             # extract the code language; try...except to avoid errors if no language is matched
             try:
@@ -308,9 +540,10 @@ class MDCode:
                 """  # env to add the code to
                 code = env.replace("@@CODETOKEN@@", re.sub(r"```", "", code, flags=re.M))  # reinject code block to env
 
-            string = string.replace("@@MINTEDTOKEN@@", code)  # reinject latex code to string
+            return code
 
-        return string
+        # the blocks are replaced in a single pass over the document
+        return re.sub(r"```(.*?)```", convert, string, flags=re.M | re.S)
 
 
 class MDReference:
@@ -321,7 +554,48 @@ class MDReference:
     contains
     --------
     footnote(): replace markdown footnotes (`[\^\d+]`) into latex `\footnote{}`
+    definitions(): find the footnote definitions of a document in linear time
+    extract_notes(), replace_pointers(): the two passes of `footnote()`
+    warn_duplicates(): report the footnotes defined more than once
     """
+    pointer = re.compile(r"\[\\\^(\d+)\](?![ \t]*:)")  # `[\^1]` in the body of the text
+    definition = re.compile(r"\[\\\^(\d+)\]:")  # `[\^1]:` at the start of a footnote
+    raw_pointer = re.compile(r"\[\^(\d+)\](?![ \t]*:)")  # the same, in the markdown source
+    raw_definition = re.compile(r"\[\^(\d+)\]:")
+
+    @staticmethod
+    def definitions(string: str, escaped: bool = True):
+        r"""
+        find the footnote definitions of a markdown string in a single pass.
+
+        a definition runs from its `[\^n]:` mark over the rest of its line and the following
+        non-empty lines, until an empty line or the next definition. a definition whose
+        mark ends its line is empty. this replaces the regex `(\[\\\^\d+\]:)(.+\n?)*`,
+        which backtracked on long notes and swallowed the definitions that followed
+        without an empty line.
+
+        :param string: the string representation of a markdown file
+        :param escaped: whether the string was escaped by `MDCleaner.prepare_markdown()`
+                        (`[\^1]:`), or is the markdown source (`[^1]:`)
+        :return: a list of `(key, start, end)`: the footnote n° and the offsets of
+                 every definition in `string`, in order
+        """
+        definition = MDReference.definition if escaped else MDReference.raw_definition
+        marks = list(definition.finditer(string))
+        spans = []
+        blank = -1  # the offset of the first empty line after the current mark
+        for n, mark in enumerate(marks):
+            end = mark.end()
+            if end < len(string) and string[end] != "\n":
+                if blank < end:
+                    blank = string.find("\n\n", end)
+                    blank = len(string) if blank == -1 else blank + 1
+                end = blank
+                if n + 1 < len(marks):
+                    end = min(end, marks[n + 1].start())
+            spans.append((mark[1], mark.start(), end))
+        return spans
+
     @staticmethod
     def footnote(string: str):
         r"""
@@ -333,40 +607,66 @@ class MDReference:
         - [^1]: this is the footnote  <-- footnote
           ^^^^  <------------------------ pointer to the footnote mark
         in turn, what we need to do is remove the pointers, match the body of the
-        footnote and add it to a `\footnote{}`
+        footnote and add it to a `\footnote{}`.
+
+        the document is read twice: once to find the definitions (see `definitions()`),
+        once to replace the pointers. a pointer to a missing or empty footnote is deleted,
+        as are the pointers inside a footnote: LaTeX footnotes are not nested. a footnote
+        defined more than once keeps its first definition, with a warning.
 
         :param string: the string representation of a markdown file
         """
-        footnotes = re.finditer(r"\[\\\^\d+\](?![ \t]*:)", string, flags=re.M)
-        for match in footnotes:
-            try:
-                pointer = match[0]  # extract the footnote pointer (the pointer to the actual footnote)
-                key = re.search(r"\d+", pointer)[0]  # extract the footnote n°
-                fnote = re.search(
-                    fr"(\[\\\^%s\]:)(.+\n?)*" % key,
-                    string, flags=re.M
-                )  # match the proper footnote (with the good key)
-                texnote = re.sub(r"\s+", " ", fnote[0].replace(fnote[1], ""))  # remove the pointer + normalize space
-
-                if not re.search("^\s*$", texnote):  # if the note isn't empty; else, delete it
-                    texnote = r"\footnote{" + texnote + "}"
-                    string = string.replace(fnote[0], "")  # delete the markdown footnote
-                    string = string.replace(pointer, texnote)  # add the \footnote to string
-                else:
-                    # delete the footnote body and pointers
-                    string = string.replace(pointer, "")
-                    string = string.replace(fnote[0], "")
+        string, notes = MDReference.extract_notes(string)
+        return MDReference.replace_pointers(string, notes)
 
-            except TypeError:
-                # a footnote pointer may point to nothing; conversely, a footnote
-                # may to have a ref in the body. in that case, pass now and delete every loose
-                # footnote part right after
-                pass
-        # delete all loose footnote strings
-        string = re.sub(r"\[\\\^\d+\](?![ \t]*:)", "", string, flags=re.M)
-        string = re.sub(r"(\[\\\^\d+\]:)(.+\n?)*", "", string, flags=re.M)
+    @staticmethod
+    def extract_notes(string: str, duplicates: Optional[List[str]] = None):
+        r"""
+        remove the footnote definitions of a markdown string (see `definitions()`)
+        :param string: the string representation of a markdown file
+        :param duplicates: optional. a list receiving the n° of the footnotes defined more
+                           than once. if None, they are reported with `warn_duplicates()`
+        :return: the string without its definitions, and {footnote n°: its `\footnote{}`,
+                 or "" for an empty note}, from the first definition of every footnote
+        """
+        notes = {}  # {footnote n°: `\footnote{}`}
+        found = []
+        parts = []
+        prev = 0
+        for key, start, end in MDReference.definitions(string):
+            if key not in notes:  # only the first definition of a footnote is used
+                texnote = string[start:end].split(":", 1)[1]  # remove the pointer
+                texnote = MDReference.pointer.sub("", re.sub(r"\s+", " ", texnote))  # normalize space
+                notes[key] = r"\footnote{" + texnote + "}" if texnote.strip() else ""
+            else:
+                found.append(key)
+            parts.append(string[prev:start])  # delete the markdown footnote
+            prev = end
+        parts.append(string[prev:])
+        if duplicates is None:
+            MDReference.warn_duplicates(found)
+        else:
+            duplicates += found
+        return "".join(parts), notes
 
-        return string
+    @staticmethod
+    def warn_duplicates(keys: List[str]):
+        """
+        warn about the footnotes defined more than once: the text of their other
+        definitions is not in the output
+        :param keys: the n° of the footnotes, once per extra definition
+        """
+        if keys:
+            Warnings("footnote_duplicate", ", ".join(f"[^{key}]" for key in sorted(set(keys), key=int)))
+
+    @staticmethod
+    def replace_pointers(string: str, notes: dict):
+        r"""
+        replace the pointers by their footnotes; loose pointers are deleted
+        :param string: the string representation of a markdown file, without its definitions
+        :param notes: {footnote n°: `\footnote{}`} (see `extract_notes()`)
+        """
+        return MDReference.pointer.sub(lambda m: notes.get(m[1], ""), string)
 
 
 class MDCleaner:
@@ -380,7 +680,7 @@ class MDCleaner:
     clean_tex(): clean the tex created and reinsert blocks of code at the end of the pipeline
     """
     @staticmethod
-    def prepare_markdown(string: str):
+    def prepare_markdown(string: str, first_token: int = 0, verbatim: Callable = None):
         """
         prepare markdown for the transformation:
         - strip empty lines (matching the expression `^[ \t]*\n`) by removing inline spaces.
@@ -394,6 +694,11 @@ class MDCleaner:
         these blocks of code.
 
         :param string: the string representation of a markdown file
+        :param first_token: the number of the first code token, so that the parts of a
+                            document converted apart get distinct tokens
+        :param verbatim: optional. a function `verbatim(string, store)` run once the code
+                         blocks are stored, which stores other spans to keep verbatim (the
+                         ArXiv math): `store(tex)` returns the token replacing `tex`
         :return: the updated string representation of a markdown file
         """
         string = re.sub(r"^[ \t]*\n", r"\n\n", string, flags=re.M)
@@ -404,14 +709,17 @@ class MDCleaner:
         # for that, store all code blocks in a dict, replace them in `string`
         # with a special token. this token uses `+` because they aren't LaTeX
         # special characters
-        codematch = re.finditer(r"\\begin\{(listing|lstlisting)}(.|\n)*?\\end\{(listing|lstlisting)}", string, flags=re.M)
-        n = 0
         codedict = {}
-        for match in codematch:
-            block = match[0]  # extract text
-            string = string.replace(block, f"@@CODETOKEN{n}@@")
-            codedict[f"@@CODETOKEN{n}@@"] = block
-            n += 1
+
+        def store(code):
+            token = f"@@CODETOKEN{first_token + len(codedict)}@@"
+            codedict[token] = code
+            return token
+
+        string = re.sub(r"\\begin\{(listing|lstlisting)}(.|\n)*?\\end\{(listing|lstlisting)}",
+                        lambda m: store(m[0]), string, flags=re.M)
+        if verbatim is not None:
+            string = verbatim(string, store)
 
         string = string.replace(r"{", r"\{")
         string = string.replace(r"}", r"\}")
@@ -439,16 +747,16 @@ class MDCleaner:
         :return: the updated string representation of a markdown file
         """
         # rebuild the string by reinjecting the code blocks
-        for k, v in codedict.items():
-            string = string.replace(k, v)
+        string = re.sub(r"@@CODETOKEN\d+@@", lambda m: codedict.get(m[0], m[0]), string)
 
-        # clean spaces
+        # clean spaces. `(?<!\s)` only tries the whitespace runs from their start,
+        # instead of from every character of a long run of spaces
         string = re.sub(r"((?<!^ ) )+", " ", string, flags=re.M)
         string = re.sub(r"{\s+", r"{", string, flags=re.M)
-        string = re.sub(r"\s+}", r"}", string, flags=re.M)
+        string = re.sub(r"(?<!\s)\s+}", r"}", string, flags=re.M)
         string = re.sub(r"\n{2,}", r"\n\n", string, flags=re.M)
         string = re.sub(r"(\\begin\{.*?)\n{2,}", r"\1\n", string, flags=re.M)
-        string = re.sub(r"\n{2,}(\\end\{)", r"\n\1", string, flags=re.M)
+        string = re.sub(r"(?<!\n)\n{2,}(\\end\{)", r"\n\1", string, flags=re.M)
 
         string = string.replace("USERRESERVEDTOKEN", "@@")
 
@@ -0,0 +1,624 @@
+import bisect
+import contextlib
+import filecmp
+import io
+import os
+import re
+import zipfile
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from xml.sax.saxutils import escape, quoteattr
+
+from .arxiv_converters import ArxivTable
+from .converters import MDHeader, MDList, MDReference
+from .images import ImageOptimizer
+from .reader import MarkdownReader
+
+# ---------------------------------------------------------------
+# native DOCX output: the blocks of the markdown are recognized
+# line by line, with the patterns of the TeX conversion, and
+# their WordprocessingML is streamed into the zip of the document
+# ---------------------------------------------------------------
+
+namespaces = ('xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+              'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+              'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+              'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+              'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"')
+relationship = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+header = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+emu_per_pixel = 9525  # at 96 dpi
+max_image_width = 6 * 914400  # the text width, in EMU: 6 inches
+
+content_types = header + (
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+    '<Default Extension="jpg" ContentType="image/jpeg"/>'
+    '<Default Extension="gif" ContentType="image/gif"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '<Override PartName="/word/numbering.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>'
+    '<Override PartName="/word/footnotes.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"/>'
+    '<Override PartName="/word/settings.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.settings+xml"/>'
+    '</Types>'
+)
+package_rels = header + (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    f'<Relationship Id="rDocument" Type="{relationship}officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+)
+settings = header + (
+    f'<w:settings {namespaces}><w:footnotePr><w:footnote w:id="-1"/><w:footnote w:id="0"/></w:footnotePr>'
+    '</w:settings>'
+)
+
+
+def _heading_style(level: int) -> str:
+    size = (32, 28, 26, 24, 22, 22)[level - 1]
+    return (f'<w:style w:type="paragraph" w:styleId="Heading{level}"><w:name w:val="heading {level}"/>'
+            '<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+            f'<w:pPr><w:keepNext/><w:spacing w:before="240" w:after="120"/><w:outlineLvl w:val="{level - 1}"/>'
+            f'</w:pPr><w:rPr><w:b/><w:sz w:val="{size}"/></w:rPr></w:style>')
+
+
+styles = header + (
+    f'<w:styles {namespaces}>'
+    '<w:docDefaults><w:rPrDefault><w:rPr><w:rFonts w:ascii="Calibri" w:hAnsi="Calibri" w:eastAsia="Calibri" '
+    'w:cs="Calibri"/><w:sz w:val="22"/></w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="120"/></w:pPr></w:pPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    + "".join(_heading_style(level) for level in range(1, 7)) +
+    '<w:style w:type="paragraph" w:styleId="Quote"><w:name w:val="Quote"/><w:basedOn w:val="Normal"/>'
+    '<w:pPr><w:ind w:left="720" w:right="720"/></w:pPr><w:rPr><w:i/></w:rPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="SourceCode"><w:name w:val="Source Code"/><w:basedOn w:val="Normal"/>'
+    '<w:pPr><w:shd w:val="clear" w:color="auto" w:fill="F4F4F4"/><w:spacing w:after="0"/></w:pPr>'
+    '<w:rPr><w:rFonts w:ascii="Consolas" w:hAnsi="Consolas" w:cs="Consolas"/><w:sz w:val="20"/></w:rPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="FootnoteText"><w:name w:val="footnote text"/>'
+    '<w:basedOn w:val="Normal"/><w:pPr><w:spacing w:after="0"/></w:pPr><w:rPr><w:sz w:val="20"/></w:rPr>'
+    '</w:style>'
+    '<w:style w:type="character" w:styleId="FootnoteReference"><w:name w:val="footnote reference"/>'
+    '<w:rPr><w:vertAlign w:val="superscript"/></w:rPr></w:style>'
+    '<w:style w:type="character" w:styleId="VerbatimChar"><w:name w:val="Verbatim Char"/>'
+    '<w:rPr><w:rFonts w:ascii="Consolas" w:hAnsi="Consolas" w:cs="Consolas"/><w:sz w:val="20"/></w:rPr></w:style>'
+    '<w:style w:type="character" w:styleId="Hyperlink"><w:name w:val="Hyperlink"/>'
+    '<w:rPr><w:color w:val="0563C1"/><w:u w:val="single"/></w:rPr></w:style>'
+    '<w:style w:type="table" w:styleId="Table"><w:name w:val="Table"/><w:tblPr><w:tblBorders>'
+    + "".join(f'<w:{side} w:val="single" w:sz="4" w:space="0" w:color="808080"/>'
+              for side in ("top", "left", "bottom", "right", "insideH", "insideV")) +
+    '</w:tblBorders><w:tblCellMar><w:left w:w="108" w:type="dxa"/><w:right w:w="108" w:type="dxa"/>'
+    '</w:tblCellMar></w:tblPr></w:style>'
+    '</w:styles>'
+)
+
+
+def _numbering_levels(ordered: bool) -> str:
+    levels = []
+    for level in range(9):
+        if ordered:
+            fmt, text = "decimal", f"%{level + 1}."
+        else:
+            fmt, text = "bullet", ("•", "◦", "▪")[level % 3]
+        levels.append(f'<w:lvl w:ilvl="{level}"><w:start w:val="1"/><w:numFmt w:val="{fmt}"/>'
+                      f'<w:lvlText w:val="{text}"/><w:lvlJc w:val="left"/>'
+                      f'<w:pPr><w:ind w:left="{720 * (level + 1)}" w:hanging="360"/></w:pPr></w:lvl>')
+    return "".join(levels)
+
+
+class DocxWriter:
+    r"""
+    write a markdown document as the parts of a DOCX package.
+
+    the document is read line by line. the blocks are recognized with the patterns of the
+    TeX conversion: code blocks, headers (`MDHeader.raw`), list items (`MDList`), quotes,
+    tables (`ArxivTable`), horizontal rules and footnotes (`MDReference`). every block is
+    written to the stream of `word/document.xml` once it ends: only the current block is
+    held in memory, and the rows of a table are written one by one. the footnotes,
+    hyperlinks, images and numbered lists met on the way are written to their own parts
+    (`footnotes_xml()`, `rels_xml()`, `numbering_xml()`) once the body is done.
+    """
+    fence = re.compile(r"[ \t]*```(?!.*```)")  # a code block: ```code``` on one line is inline code
+    rule = re.compile(r"[ \t]*-{3,}[ \t]*$")
+    quote = re.compile(r">+")
+    # the inline constructs, as `MDSimple` and `MDReference` convert them
+    inline = re.compile(
+        r"(?<!`)(?P<ticks>`+)(?!`)(?P<code>.+?)(?<!`)(?P=ticks)(?!`)"
+        r"|\[\^(?P<note>\d+)\](?![ \t]*:)"
+        r"|(?P<image>!?)\[(?P<text>(?:[^\[\]\n]|\[[^\[\]\n]*\])*)\]"
+        r"\((?P<url>(?:[^()\[\]\n]|\([^()\[\]\n]*\))*)\)"
+        r"|(?<!\*)\*{2}(?!\*)(?P<bold>.+?)\*{2}(?!\*)"
+        r"|(?<!\*)\*(?!\*)(?P<italic>.+?)(?<!\*)\*(?!\*)"
+        r"|(?P<br><br/?>)"
+    )
+    invalid = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")  # not allowed in XML
+
+    def __init__(self, write, french_quote: bool = False, base_dir: str = "."):
+        """
+        :param write: a function writing a string to the stream of `word/document.xml`
+        :param french_quote: translate the quotes as french quotes, as `MDQuote.inline_quote()`
+        :param base_dir: the directory against which relative image paths are resolved
+        """
+        self.write = write
+        self.french_quote = french_quote
+        self.base_dir = base_dir
+        self.notes = {}  # the markdown of the footnote definitions, by key
+        self.duplicates = []  # the keys of the footnotes defined more than once
+        self.footnotes = []  # (id, key) of every footnote pointer, in order
+        self.rels = {"document": [], "footnotes": []}  # (id, type, target, external) of every part
+        self.images = {}  # the path of every embedded image: its name in the package
+        self.drawings = 0
+        self.ordered = []  # the first number of every numbered list
+        self._part = "document"
+        self._paragraph = []  # the lines of the current paragraph
+        self._quote = []  # the lines of the current quote, and its depth
+        self._quote_depth = 1
+        self._item = None  # (level, ordered, lines) of the current list item
+        self._indents = []  # the indentation of the open list levels
+        self._num = None  # the numbering of the numbered items of the current list
+        self._table = []  # the first line of a table, until its second line is read
+        self._columns = None  # the alignment of the columns of the table being written
+
+    # -----------------------------------------------------------
+    # inline content
+    # -----------------------------------------------------------
+
+    def _rel(self, kind: str, target: str, external: bool = False) -> str:
+        rels = self.rels[self._part]
+        rid = f"r{kind.capitalize()}{len(rels) + 1}"
+        rels.append((rid, kind, target, external))
+        return rid
+
+    def _text(self, text: str, props: Tuple[str, ...]) -> str:
+        """
+        the run of a text, with the quotes of `MDQuote.inline_quote()`
+        :param props: the run properties: `b`, `i`, `code`, `link`
+        """
+        if not text:
+            return ""
+        if "code" not in props:
+            if self.french_quote:
+                text = re.sub(r"\"(.*)\"", "« \\1 »", text)
+                text = re.sub(r"'(.*)'", "“\\1”", text)
+            else:
+                text = re.sub(r"\"(.*)\"", "“\\1”", text)
+                text = re.sub(r"'(.*)'", "‘\\1’", text)
+        return f'<w:r>{self._props(props)}<w:t xml:space="preserve">{self._escape(text)}</w:t></w:r>'
+
+    @staticmethod
+    def _props(props: Tuple[str, ...]) -> str:
+        rpr = ""
+        if "code" in props:
+            rpr += '<w:rStyle w:val="VerbatimChar"/>'
+        elif "link" in props:
+            rpr += '<w:rStyle w:val="Hyperlink"/>'
+        if "b" in props:
+            rpr += "<w:b/>"
+        if "i" in props:
+            rpr += "<w:i/>"
+        return f"<w:rPr>{rpr}</w:rPr>" if rpr else ""
+
+    @staticmethod
+    def _escape(text: str) -> str:
+        return escape(DocxWriter.invalid.sub("", text))
+
+    @staticmethod
+    def _attr(text: str) -> str:
+        return quoteattr(DocxWriter.invalid.sub("", text))
+
+    def runs(self, text: str, props: Tuple[str, ...] = ()) -> str:
+        """
+        the runs of a paragraph: bold, italics, inline code, links, images, footnote
+        pointers and line breaks
+        :param text: the markdown of the paragraph, on one line
+        :param props: the properties of the enclosing run (see `_text()`)
+        """
+        out = []
+        pos = 0
+        for match in DocxWriter.inline.finditer(text):
+            out.append(self._text(text[pos:match.start()], props))
+            pos = match.end()
+            if match["ticks"]:
+                out.append(self._text(match["code"], props + ("code",)))
+            elif match["note"]:
+                out.append(self._pointer(match["note"]))
+            elif match["image"]:
+                out.append(self._image(match["url"], match["text"], props))
+            elif match["url"] is not None:
+                out.append(self._link(match["url"], match["text"], props))
+            elif match["bold"]:
+                out.append(self.runs(match["bold"], props + ("b",)))
+            elif match["italic"]:
+                out.append(self.runs(match["italic"], props + ("i",)))
+            else:
+                out.append("<w:r><w:br/></w:r>")
+        out.append(self._text(text[pos:], props))
+        return "".join(out)
+
+    def _pointer(self, key: str) -> str:
+        """
+        a footnote reference. as in `MDReference.footnote()`, a pointer to a missing or
+        empty note is removed, and so are the pointers of the notes
+        """
+        if self._part != "document" or not self.notes.get(key):
+            return ""
+        number = len(self.footnotes) + 1  # the ids 0 and -1 are the separators
+        self.footnotes.append((number, key))
+        return (f'<w:r><w:rPr><w:rStyle w:val="FootnoteReference"/></w:rPr>'
+                f'<w:footnoteReference w:id="{number}"/></w:r>')
+
+    def _link(self, url: str, text: str, props: Tuple[str, ...]) -> str:
+        runs = self.runs(text, props + ("link",))
+        if "link" in props:  # hyperlinks do not nest
+            return runs
+        if url.startswith("#"):
+            return f"<w:hyperlink w:anchor={self._attr(url[1:])}>{runs}</w:hyperlink>"
+        return f'<w:hyperlink r:id="{self._rel("hyperlink", url, True)}">{runs}</w:hyperlink>'
+
+    def _image(self, url: str, caption: str, props: Tuple[str, ...]) -> str:
+        """
+        an image embedded in the package, with its caption on the next line. a remote,
+        missing or unreadable image is replaced by its caption
+        """
+        path = url if os.path.isabs(url) else os.path.join(self.base_dir, url)
+        ext = os.path.splitext(path)[1].lower()
+        size = None
+        if "://" not in url and ext in (".png", ".jpg", ".jpeg", ".gif") and os.path.isfile(path):
+            with open(path, mode="rb") as fh:
+                size = ImageOptimizer.size(fh.read(1 << 16), ext)
+        if not size:
+            return self.runs(caption or url, props + ("i",))
+        if path not in self.images:
+            self.images[path] = f"media/image{len(self.images) + 1}{ext}"
+        rid = self._rel("image", self.images[path])
+        width, height = size[0] * emu_per_pixel, size[1] * emu_per_pixel
+        if width > max_image_width:
+            width, height = max_image_width, height * max_image_width // width
+        self.drawings += 1
+        name = self._attr(os.path.basename(path))
+        drawing = (
+            f'<w:r><w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0">'
+            f'<wp:extent cx="{width}" cy="{height}"/>'
+            f'<wp:docPr id="{self.drawings}" name={name} descr={self._attr(caption)}/>'
+            '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture"><pic:pic>'
+            f'<pic:nvPicPr><pic:cNvPr id="{self.drawings}" name={name}/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{width}" cy="{height}"/></a:xfrm>'
+            '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr>'
+            '</pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing></w:r>'
+        )
+        if caption:
+            drawing += "<w:r><w:br/></w:r>" + self.runs(caption, props + ("i",))
+        return drawing
+
+    # -----------------------------------------------------------
+    # blocks
+    # -----------------------------------------------------------
+
+    def paragraph(self, text: str, style: Optional[str] = None, ppr: str = "", props: Tuple[str, ...] = ()):
+        """
+        write a paragraph
+        :param text: the markdown of the paragraph, on one line
+        :param style: the id of the paragraph style
+        :param ppr: other paragraph properties, in the order of the schema
+        """
+        if style:
+            ppr = f'<w:pStyle w:val="{style}"/>' + ppr
+        self.write(f"<w:p>{'<w:pPr>' + ppr + '</w:pPr>' if ppr else ''}{self.runs(text, props)}</w:p>")
+
+    def _code(self, line: str):
+        self.write(f'<w:p><w:pPr><w:pStyle w:val="SourceCode"/></w:pPr>'
+                   f'{self._text(line.replace(chr(9), "    "), ("code",))}</w:p>')
+
+    def _flush(self, lists: bool = True):
+        """
+        write the block being read: the paragraph, the quote, the table and, unless
+        `lists` is False, the list item
+        """
+        if self._paragraph:
+            self.paragraph(" ".join(self._paragraph))
+            self._paragraph = []
+        if self._quote:
+            indent = 720 * self._quote_depth
+            self.paragraph(" ".join(self._quote), "Quote", f'<w:ind w:left="{indent}" w:right="720"/>')
+            self._quote = []
+        if self._table:  # a single `|...|` line is not a table, as in `ArxivTable`
+            self.paragraph(self._table[0])
+            self._table = []
+        if self._columns is not None:
+            self.write("</w:tbl>")
+            self._columns = None
+        if lists:
+            self._flush_item()
+            self._indents = []
+            self._num = None
+
+    def _flush_item(self):
+        if self._item is None:
+            return
+        level, ordered, lines = self._item
+        if ordered and self._num is None:
+            self.ordered.append(int(re.match(r"\d+", lines[0])[0]) if lines[0][:1].isdigit() else 1)
+            self._num = len(self.ordered) + 1  # the numbering 1 is the bullets
+        num = self._num if ordered else 1
+        text = " ".join(lines)
+        text = text[re.match(r"\d+\.|-", text).end():].strip()
+        self.paragraph(text, None, f'<w:numPr><w:ilvl w:val="{level}"/><w:numId w:val="{num}"/></w:numPr>')
+        self._item = None
+
+    def _list_item(self, line: str, ordered: bool):
+        self._flush(lists=False)
+        self._flush_item()
+        indent = len(line) - len(line.lstrip(" \t"))
+        while self._indents and self._indents[-1] > indent:
+            self._indents.pop()
+        if not self._indents or self._indents[-1] < indent:
+            self._indents.append(indent)
+        self._item = (min(len(self._indents) - 1, 8), ordered, [line.strip()])
+
+    def _table_row(self, line: str):
+        cells = ArxivTable._split_row(line)
+        if self._columns is None:  # the second line: a separator row makes the first a header
+            first = ArxivTable._split_row(self._table[0])
+            spec = ArxivTable._parse_alignment(cells)
+            self._columns = spec or ["l"] * len(first)
+            self.write('<w:tbl><w:tblPr><w:tblStyle w:val="Table"/><w:tblW w:w="0" w:type="auto"/></w:tblPr>'
+                       "<w:tblGrid>" + "<w:gridCol/>" * len(self._columns) + "</w:tblGrid>")
+            self._row(first, header=spec is not None)
+            self._table = []
+            if spec is not None:
+                return
+        self._row(cells)
+
+    def _row(self, cells: List[str], header: bool = False):
+        row = ["<w:tr><w:trPr><w:tblHeader/></w:trPr>" if header else "<w:tr>"]
+        cells = (cells + [""] * len(self._columns))[:len(self._columns)]
+        for cell, align in zip(cells, self._columns):
+            jc = {"l": "left", "c": "center", "r": "right"}[align]
+            row.append(f'<w:tc><w:tcPr><w:tcW w:w="0" w:type="auto"/></w:tcPr>'
+                       f'<w:p><w:pPr><w:spacing w:after="0"/><w:jc w:val="{jc}"/></w:pPr>'
+                       f'{self.runs(cell, ("b",) if header else ())}</w:p></w:tc>')
+        row.append("</w:tr>")
+        self.write("".join(row))
+
+    def line(self, line: str):
+        """
+        read a line of the body (without its line break), writing the blocks it ends
+        """
+        stripped = line.strip()
+        if not stripped:
+            self._flush()
+        elif ArxivTable._is_table_line(line + "\n"):
+            if not self._table and self._columns is None:
+                self._flush()
+                self._table = [line]
+            else:
+                self._table_row(line)
+        elif self._table or self._columns is not None:
+            self._flush()
+            self.line(line)
+        elif MDHeader.raw.match(line):
+            self._flush()
+            match = MDHeader.raw.match(line)
+            self.paragraph(match[2].strip(), f"Heading{min(len(match[1]), 6)}")
+        elif DocxWriter.rule.match(line):
+            self._flush()
+            self.write('<w:p><w:pPr><w:pBdr><w:bottom w:val="single" w:sz="6" w:space="1" w:color="auto"/>'
+                       '</w:pBdr></w:pPr></w:p>')
+        elif MDList.unordered_item.match(line):
+            self._list_item(line, False)
+        elif MDList.ordered_item.match(line):
+            self._list_item(line, True)
+        elif self._item is not None:
+            self._item[2].append(stripped)  # the lines of an item are joined, as `MDList.join_items()`
+        elif line.startswith(">"):
+            depth = len(DocxWriter.quote.match(line)[0])
+            if self._paragraph or (self._quote and depth != self._quote_depth):
+                self._flush()
+            self._quote_depth = depth
+            self._quote.append(line[depth:].strip())
+        else:
+            if self._quote:
+                self._flush()
+            self._paragraph.append(stripped)
+
+    def read_notes(self, block: str, record: bool = True) -> List[Tuple[int, int]]:
+        """
+        find the footnote definitions of a block, out of its code blocks (the first
+        definition of a note wins, as in `MDReference.footnote()`)
+        :param block: a block of the document, cut as `MarkdownReader.blocks()` cuts it
+        :param record: record the definitions in `notes`, and the notes defined twice
+        :return: the (start, end) spans of the definitions in the block, in order
+        """
+        if "[^" not in block:
+            return []
+        fences = [m.span() for m in MDHeader.fence.finditer(block)] if "```" in block else []
+        starts = [start for start, _ in fences]
+        skip = []
+        for key, start, end in MDReference.definitions(block, escaped=False):
+            n = bisect.bisect_right(starts, start) - 1
+            if n >= 0 and fences[n][1] > start:
+                continue
+            skip.append((start, end))
+            if not record:
+                continue
+            if key in self.notes:
+                self.duplicates.append(key)
+                continue
+            note = block[start:end]
+            self.notes[key] = " ".join(note[MDReference.raw_definition.match(note).end():].split())
+        return skip
+
+    def body(self, blocks: Callable[[], Iterable[str]]):
+        """
+        write the body of a markdown document: `<w:body>` and its blocks. the document is
+        read twice: once for its footnote definitions, which a pointer can precede, then
+        to write the body
+        :param blocks: a function returning an iterator over the blocks of the document:
+                       `MarkdownReader.blocks`, or `lambda: [string]`
+        """
+        for block in blocks():
+            self.read_notes(block)
+        MDReference.warn_duplicates(self.duplicates)
+        self.write(f"{header}<w:document {namespaces}><w:body>")
+        code = False
+        for block in blocks():
+            for line in _lines(block, self.read_notes(block, record=False)):
+                if code:
+                    if "```" in line:
+                        code = False
+                    else:
+                        self._code(line)
+                elif DocxWriter.fence.match(line):
+                    self._flush()
+                    code = True
+                else:
+                    self.line(line)
+        self._flush()
+        self.write('<w:sectPr><w:pgSz w:w="12240" w:h="15840"/><w:pgMar w:top="1440" w:right="1440" '
+                   'w:bottom="1440" w:left="1440" w:header="720" w:footer="720" w:gutter="0"/></w:sectPr>'
+                   "</w:body></w:document>")
+
+    def footnotes_xml(self, write) -> None:
+        """
+        the footnotes pointed to by the body, numbered in order. a note pointed to twice
+        is written twice, as LaTeX does with `\\footnote{}`
+        :param write: a function writing a string to the stream of `word/footnotes.xml`
+        """
+        self._part = "footnotes"
+        write(f'{header}<w:footnotes {namespaces}>'
+              '<w:footnote w:type="separator" w:id="-1"><w:p><w:r><w:separator/></w:r></w:p></w:footnote>'
+              '<w:footnote w:type="continuationSeparator" w:id="0"><w:p><w:r><w:continuationSeparator/>'
+              '</w:r></w:p></w:footnote>')
+        for number, key in self.footnotes:
+            write(f'<w:footnote w:id="{number}"><w:p><w:pPr><w:pStyle w:val="FootnoteText"/></w:pPr>'
+                  '<w:r><w:rPr><w:rStyle w:val="FootnoteReference"/></w:rPr><w:footnoteRef/></w:r>'
+                  f'<w:r><w:t xml:space="preserve"> </w:t></w:r>{self.runs(self.notes[key])}</w:p>'
+                  '</w:footnote>')
+        write("</w:footnotes>")
+
+    def numbering_xml(self) -> str:
+        """
+        the bullets (numbering 1) and a numbering per numbered list, which restarts at its first number
+        """
+        nums = ['<w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num>']
+        for n, start in enumerate(self.ordered):
+            nums.append(f'<w:num w:numId="{n + 2}"><w:abstractNumId w:val="1"/>'
+                        f'<w:lvlOverride w:ilvl="0"><w:startOverride w:val="{start}"/></w:lvlOverride></w:num>')
+        return (f'{header}<w:numbering {namespaces}>'
+                f'<w:abstractNum w:abstractNumId="0">{_numbering_levels(False)}</w:abstractNum>'
+                f'<w:abstractNum w:abstractNumId="1">{_numbering_levels(True)}</w:abstractNum>'
+                + "".join(nums) + "</w:numbering>")
+
+    def rels_xml(self, part: str, write) -> None:
+        """
+        the relationships of a part: its hyperlinks and images, and for the document its other parts
+        :param write: a function writing a string to the stream of the relationships part
+        """
+        rels = self.rels[part]
+        if part == "document":
+            rels = rels + [("rStyles", "styles", "styles.xml", False),
+                           ("rNumbering", "numbering", "numbering.xml", False),
+                           ("rFootnotes", "footnotes", "footnotes.xml", False),
+                           ("rSettings", "settings", "settings.xml", False)]
+        write(f'{header}<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">')
+        for rid, kind, target, external in rels:
+            mode = ' TargetMode="External"' if external else ""
+            write(f'<Relationship Id="{rid}" Type="{relationship}{kind}" Target={self._attr(target)}{mode}/>')
+        write("</Relationships>")
+
+def _lines(string: str, skip: List[Tuple[int, int]]) -> Iterator[str]:
+    """
+    iterate over the lines of a string, without their line breaks, leaving out the
+    `(start, end)` spans of `skip` (sorted). the string is never split as a whole
+    """
+    pending = ""  # the start of a line cut by a span
+    pos = 0
+    for start, end in skip + [(len(string), len(string))]:
+        while pos < start:
+            eol = string.find("\n", pos, start)
+            if eol == -1:
+                pending += string[pos:start]
+                break
+            yield pending + string[pos:eol]
+            pending = ""
+            pos = eol + 1
+        pos = max(pos, end)
+    if pending:
+        yield pending
+
+
+def _entry(name: str) -> zipfile.ZipInfo:
+    """
+    a deflated zip entry with a fixed date: the same document gives the same file
+    """
+    info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+@contextlib.contextmanager
+def _text_entry(archive: zipfile.ZipFile, name: str, large: bool) -> Iterator[io.TextIOWrapper]:
+    """
+    a text stream to a deflated zip entry: the part is compressed as it is written
+    :param large: the entry may exceed 2 GiB (zip64)
+    """
+    with archive.open(_entry(name), mode="w", force_zip64=large) as raw:
+        stream = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        yield stream
+        stream.flush()
+        stream.detach()
+
+
+def write_docx(source: Union[str, MarkdownReader], path: str, french_quote: bool = False,
+               base_dir: str = ".") -> bool:
+    """
+    write a markdown document to a DOCX file, in process. the body, the footnotes and the
+    relationships are streamed into their deflated entries as they are converted (see
+    `DocxWriter`); the file is replaced atomically, and only if its content changed.
+    :param source: the string representation of the markdown file, or a `MarkdownReader`:
+                   the file is then read block by block, and never held in memory whole
+    :param path: the path of the DOCX file
+    :param french_quote: see `DocxWriter`
+    :param base_dir: the directory against which relative image paths are resolved
+    :return: True if the file was written, False if it was already up to date
+    """
+    if isinstance(source, str):
+        blocks, size = (lambda: [source]), len(source)
+    else:
+        blocks, size = source.blocks, os.path.getsize(source.path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with zipfile.ZipFile(tmp, mode="w") as archive:
+            archive.writestr(_entry("[Content_Types].xml"), content_types)
+            archive.writestr(_entry("_rels/.rels"), package_rels)
+            with _text_entry(archive, "word/document.xml", size > 1 << 28) as stream:
+                writer = DocxWriter(stream.write, french_quote, base_dir)
+                writer.body(blocks)
+            with _text_entry(archive, "word/footnotes.xml", size > 1 << 28) as stream:
+                writer.footnotes_xml(stream.write)
+            for part in ("document", "footnotes"):
+                with _text_entry(archive, f"word/_rels/{part}.xml.rels", False) as stream:
+                    writer.rels_xml(part, stream.write)
+            archive.writestr(_entry("word/numbering.xml"), writer.numbering_xml())
+            archive.writestr(_entry("word/styles.xml"), styles)
+            archive.writestr(_entry("word/settings.xml"), settings)
+            for image, name in writer.images.items():
+                with open(image, mode="rb") as src, archive.open(_entry(f"word/{name}"), mode="w") as dst:
+                    while True:
+                        chunk = src.read(1 << 20)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+        if os.path.isfile(path) and filecmp.cmp(tmp, path, shallow=False):
+            return False
+        os.replace(tmp, path)  # atomic: a failed conversion never leaves a partial document
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
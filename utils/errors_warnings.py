@@ -1,14 +1,46 @@
 import click
-import sys
 
 
 # -------------------------------------------------------
 # custom error and warnings classes to display custom
-# messages
+# messages. errors never print or exit: they carry their
+# data, and the command line layers (`md2tex`, `md2x`)
+# display them and set the exit code
 # ------------------------------------------------------
 
 
-class ParsingException(Exception):
+class ConversionError(Exception):
+    """
+    base class for all errors of a conversion. the subclasses define `logs`, the message
+    of every error key; `@@TOKEN@@` in a message is replaced by the value of the error.
+    the exception is picklable, so that worker processes can send it back.
+    """
+    logs = {}
+
+    def __init__(self, key, val=None):
+        """
+        :param key: the error key, which selects the message
+        :param val: the value which caused the error
+        """
+        super().__init__(key, val)
+        self.key = key
+        self.value = val
+
+    @property
+    def message(self) -> str:
+        return self.logs[self.key].replace("@@TOKEN@@", str(self.value))
+
+    def __str__(self):
+        return self.message
+
+    def to_dict(self) -> dict:
+        """
+        :return: the error as json-serializable data: {"error", "key", "value", "message"}
+        """
+        return {"error": type(self).__name__, "key": self.key, "value": self.value, "message": self.message}
+
+
+class ParsingException(ConversionError):
     """
     base class for all parsing exceptions
     """
@@ -30,14 +62,13 @@ class IndentationException(ParsingException):
 
     def __init__(self, key, lstext):
         """
-        launch an IndentationException: return an error log and exit
-        :param msg: the error key to print the proper log
+        :param key: the error key
         :param lstext: the text representation of the markdown list on which this error happened
         """
-        click.echo(IndentationException.logs[key].replace("@@TOKEN@@", lstext))
+        super().__init__(key, lstext)
 
 
-class InputException(Exception):
+class InputException(ConversionError):
     """
     base class for all errors caused by user input: files not found, invalid files...
     """
@@ -46,6 +77,7 @@ class InputException(Exception):
                   + "and doesn't seem to be a markdown file. exiting...",
         "not_inpath": "ERROR - input file `@@TOKEN@@` not found. exiting...",
         "not_template": "ERROR - custom tex template `@@TOKEN@@` not found. exiting...",
+        "not_table_include": "ERROR - table file `@@TOKEN@@` included with `!table[...](...)` not found. exiting...",
         "template_no_token": "ERROR - custom tex template `@@TOKEN@@` does not contain a "
                         + "@@BODYTOKEN@@ key. cannot perform replacement.",
         "not_outpath": "ERROR - output directory or directories for path `@@TOKEN@@` don't "
@@ -53,19 +85,18 @@ class InputException(Exception):
         "outpath_slashes": "ERROR - output file path `@@TOKEN@@` contains '/' and '\\'. "
                            + "please remove slashes or backslashes to continue."
                            + "exiting...",
+        "project_manifest": "ERROR - project manifest `@@TOKEN@@` is not a json object with a "
+                            + "non-empty `chapters` list. exiting...",
+        "project_chapter": "ERROR - chapter `@@TOKEN@@` is not part of the project. exiting...",
+        "build_project": "ERROR - `@@TOKEN@@` is not a valid build project: expected a json object with "
+                         + "an `outputs` list of objects that have an `input`. exiting...",
+        "build_format": "ERROR - unsupported output format `@@TOKEN@@` in build project. exiting...",
+        "split_stdout": "ERROR - `--split` writes section files next to the output file: it can't be used "
+                        + "with the standard output (`-o -`). exiting...",
         "document_class": "ERROR - invalid value provided for argument `--document-class`: `@@TOKEN@@`. "
                           + "allowed values are `article` or `book`. exiting..."
     }  # all possible error logs
 
-    def __init__(self, key, val=None):
-        """
-        launch an OSInpytException: return an error log and exit
-        :param key: the error key to print the proper log
-        :param val: the user inputted value which caused the error
-        """
-        click.echo(InputException.logs[key].replace("@@TOKEN@@", val))
-        sys.exit(1)
-
 
 class Warnings:
     """
@@ -73,6 +104,14 @@ class Warnings:
     """
     logs = {
         "outpath_extension": "WARNING - file extension of output file `@@TOKEN@@` changed to `.tex`",
+        "input_encoding": "WARNING - input file `@@TOKEN@@` is not valid utf-8 and was read as latin-1",
+        "preamble_format": "WARNING - the preamble of `@@TOKEN@@` could not be dumped to a format file "
+                           + "(is `mylatexformat` installed?). compiling without it",
+        "split_arxiv": "WARNING - `--split @@TOKEN@@` is ignored in ArXiv mode: ArXiv packages have a single .tex file",
+        "image_no_pillow": "WARNING - image `@@TOKEN@@` is wider than its print resolution, but Pillow is "
+                           + "not installed: images are not downscaled (`pip install Pillow`)",
+        "footnote_duplicate": "WARNING - footnotes defined more than once: @@TOKEN@@. the first definition "
+                              + "of a footnote is used, the text of the others is removed",
         "list_deep_nesting": "WARNING - deep list nesting. you may need to change base tex options in the header."
     }
 
@@ -82,4 +121,4 @@ class Warnings:
         :param key: the key pointing to the message from Warnings.log to print
         :param val: a possible value for a custom warning message.
         """
-        click.echo(Warnings.logs[key].replace("@@TOKEN@@", val))
+        click.echo(Warnings.logs[key].replace("@@TOKEN@@", val), err=True)  # stdout may hold the output
@@ -1,4 +1,7 @@
+import filecmp
+import os
 import re
+import shutil
 
 from .errors_warnings import IndentationException
 
@@ -46,7 +49,7 @@ def process_list_indentation(lstext):
     for item in re.split(r"\n", lstext):
         indent = len(re.search(r"^\s*", item)[0]) - firstindent
         if indent < 0:
-            raise IndentationException(key="firstindent", lstext=lstext)  # raise an error, print error msg, exit
+            raise IndentationException(key="firstindent", lstext=lstext)  # raise an error, displayed by the command line
         else:
             lsitems.append([
                 re.sub(r"^\s*-\s*", "", item),  # item content
@@ -66,7 +69,7 @@ def process_list_indentation(lstext):
             if int(li[1] / mult) == li[1] / mult:
                 li[1] = int(li[1] / mult)  # replace number of spaces by indentation level;
             else:
-                raise IndentationException(key="multiplier", lstext=lstext)  # raise an error, print error msg, exit
+                raise IndentationException(key="multiplier", lstext=lstext)  # raise an error, displayed by the command line
 
         prev = 0  # previous indentation level
         for li in lsitems:
@@ -75,3 +78,38 @@ def process_list_indentation(lstext):
             prev = li[1]
 
     return lsitems
+
+
+def write_if_changed(path, data, encoding="utf-8"):
+    """
+    write a string to a file, unless the file already contains exactly that string.
+    leaving unchanged outputs untouched keeps their mtime, so that make, CI caches
+    and file watchers don't see a change.
+
+    :param path: the path of the file to write
+    :param data: the string to write
+    :param encoding: the encoding of the file
+    :return: True if the file was written, False if it was already up to date
+    """
+    try:
+        with open(path, mode="r", encoding=encoding) as fh:
+            if fh.read() == data:
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    with open(path, mode="w", encoding=encoding) as fh:
+        fh.write(data)
+    return True
+
+
+def copy_if_changed(source, target):
+    """
+    copy a file, unless the target already has the same contents (see `write_if_changed()`)
+    :param source: the path of the file to copy
+    :param target: the path of the copy
+    :return: True if the file was copied, False if the target was already up to date
+    """
+    if os.path.isfile(target) and filecmp.cmp(source, target, shallow=False):
+        return False
+    shutil.copy(source, target)
+    return True
@@ -0,0 +1,314 @@
+import io
+import os
+import re
+import shutil
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from .cache import cache_dir, file_digest, text_digest
+from .converters import MDHeader
+from .errors_warnings import Warnings
+from .metrics import Metrics
+
+try:  # optional: without Pillow, images are only stripped of their metadata
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ---------------------------------------------------------------
+# figure preprocessing: images are downscaled to their print
+# resolution, converted to a format pdflatex reads efficiently
+# and stripped of their metadata. results are cached by content
+# ---------------------------------------------------------------
+
+
+class ImageOptimizer:
+    r"""
+    optimize the images of a document before LaTeX includes them.
+
+    images are included at `\linewidth`: their width at `dpi` pixels per inch over
+    `print_width` inches is all the printed page can show. wider images are downscaled
+    (with Pillow, if installed). formats pdflatex can't read (gif, bmp, tiff, webp) are
+    converted to png, and large photographic pngs to jpeg when that halves their size.
+    metadata (exif, xmp, text chunks, comments) is removed. vector figures (pdf, eps)
+    are left unchanged.
+
+    every result is stored in the `images` cache directory, keyed by the content of the
+    image and the settings: an image is only processed once.
+    """
+    version = 1  # bump to invalidate the cache when the processing changes
+    include_dir = "md2x-images"  # directory of the optimized images, relative to the .tex file
+    image = re.compile(r"(?<!\\)!\[((?:[^\[\]\n]|\[[^\[\]\n]*\])*)\]\(([^()\s]+)\)")  # `![caption](path)`
+    raster = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp")
+    converted = (".gif", ".bmp", ".tif", ".tiff", ".webp")  # not supported by pdflatex
+    png_kept = {b"IHDR", b"PLTE", b"IDAT", b"IEND", b"tRNS", b"gAMA", b"cHRM", b"sRGB", b"iCCP",
+                b"sBIT", b"pHYs", b"acTL", b"fcTL", b"fdAT"}  # chunks that affect the rendering
+    warned = []  # the warning about Pillow is displayed once
+
+    @staticmethod
+    def max_pixels(dpi: int, print_width: float) -> int:
+        return max(1, int(dpi * print_width))
+
+    @staticmethod
+    def cached(path: str, dpi: int, print_width: float) -> Tuple[str, Optional[str]]:
+        """
+        find the optimized version of an image in the cache
+        :return: the cache key of the image and the path of its optimized version,
+                 or None if it was not processed yet
+        """
+        key = text_digest(file_digest(path), str(dpi), str(print_width), str(ImageOptimizer.version),
+                          "pil" if Image else "raw")[:24]
+        directory = cache_dir("images")
+        ext = os.path.splitext(path)[1].lower()
+        for candidate in dict.fromkeys((ext, ".png", ".jpg")):
+            target = os.path.join(directory, key + candidate)
+            if os.path.exists(target):
+                return key, target
+        return key, None
+
+    @staticmethod
+    def optimize(path: str, dpi: int = 300, print_width: float = 6.5) -> str:
+        """
+        optimize an image, or get it from the cache
+        :param path: the path to the image
+        :param dpi: the print resolution, in pixels per inch
+        :param print_width: the width the image is printed at, in inches
+        :return: the path of the optimized image in the cache
+        """
+        key, target = ImageOptimizer.cached(path, dpi, print_width)
+        if target:
+            return target
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in ImageOptimizer.raster:
+            return ImageOptimizer._store(path, key, ext)
+        with open(path, mode="rb") as fh:
+            data = fh.read()
+        if Image is not None:
+            try:
+                data, ext = ImageOptimizer._resample(data, ext, ImageOptimizer.max_pixels(dpi, print_width))
+            except (OSError, ValueError):  # not an image Pillow can read: keep it
+                pass
+        else:
+            width = ImageOptimizer.width(data, ext)
+            if width and width > ImageOptimizer.max_pixels(dpi, print_width) and not ImageOptimizer.warned:
+                ImageOptimizer.warned.append(True)
+                Warnings("image_no_pillow", path)
+        if ext == ".png":
+            data = ImageOptimizer.strip_png(data)
+        elif ext in (".jpg", ".jpeg"):
+            data = ImageOptimizer.strip_jpeg(data)
+        return ImageOptimizer._write(data, key, ext)
+
+    @staticmethod
+    def _resample(data: bytes, ext: str, max_pixels: int) -> Tuple[bytes, str]:
+        """
+        downscale an image to `max_pixels` wide and pick its output format, with Pillow
+        :return: the encoded image and its extension
+        """
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            resized = image.width > max_pixels
+            if resized:
+                height = max(1, round(image.height * max_pixels / image.width))
+                image = image.resize((max_pixels, height), Image.LANCZOS)
+            icc = image.info.get("icc_profile")
+            if ext in ImageOptimizer.converted:
+                if image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+                    image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+                ext = ".png"
+            elif not resized and ext != ".png":
+                return data, ext  # a jpeg small enough: don't encode it again
+
+            out = io.BytesIO()
+            if ext == ".png":
+                image.save(out, format="PNG", optimize=True, icc_profile=icc)
+                # photographs compress better as jpeg: convert them if it halves their size
+                if image.mode in ("RGB", "L") and out.tell() > 1 << 20:
+                    jpeg = io.BytesIO()
+                    image.save(jpeg, format="JPEG", quality=90, optimize=True, icc_profile=icc)
+                    if jpeg.tell() * 2 < out.tell():
+                        return jpeg.getvalue(), ".jpg"
+            else:
+                if image.mode not in ("RGB", "L", "CMYK"):
+                    image = image.convert("RGB")
+                image.save(out, format="JPEG", quality=90, optimize=True, icc_profile=icc)
+            result = out.getvalue()
+        if not resized and ext == ".png" and len(result) >= len(data):
+            return data, ext  # the original png was better compressed
+        return result, ext
+
+    @staticmethod
+    def width(data: bytes, ext: str) -> Optional[int]:
+        """
+        read the width of a png or jpeg image from its header
+        :return: the width in pixels, or None if it can't be read
+        """
+        size = ImageOptimizer.size(data, ext)
+        return size[0] if size else None
+
+    @staticmethod
+    def size(data: bytes, ext: str) -> Optional[Tuple[int, int]]:
+        """
+        read the size of a png, jpeg or gif image from its header
+        :return: (width, height) in pixels, or None if it can't be read
+        """
+        if ext == ".png" and data[12:16] == b"IHDR":
+            return struct.unpack(">II", data[16:24])
+        if ext == ".gif" and data[:3] == b"GIF" and len(data) >= 10:
+            return struct.unpack("<HH", data[6:10])
+        if ext in (".jpg", ".jpeg"):
+            pos = 2
+            while pos + 9 < len(data) and data[pos] == 0xFF:
+                marker = data[pos + 1]
+                length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):  # start of frame
+                    height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+                    return width, height
+                pos += 2 + length
+        return None
+
+    @staticmethod
+    def strip_png(data: bytes) -> bytes:
+        """
+        remove the chunks of a png that don't affect its rendering (text, time, exif...)
+        :param data: the png file
+        :return: the png without metadata, or `data` if it is not a valid png
+        """
+        if data[:8] != b"\x89PNG\r\n\x1a\n":
+            return data
+        parts = [data[:8]]
+        pos = 8
+        while pos + 8 <= len(data):
+            length = struct.unpack(">I", data[pos:pos + 4])[0]
+            kind = data[pos + 4:pos + 8]
+            end = pos + 12 + length
+            if end > len(data):
+                return data  # truncated: leave it to LaTeX
+            if kind in ImageOptimizer.png_kept:
+                parts.append(data[pos:end])
+            pos = end
+            if kind == b"IEND":
+                break
+        return b"".join(parts)
+
+    @staticmethod
+    def strip_jpeg(data: bytes) -> bytes:
+        """
+        remove the metadata segments of a jpeg: exif and xmp (APP1), other application
+        segments and comments. JFIF (APP0), ICC profiles (APP2) and Adobe color
+        information (APP14) are kept.
+        :param data: the jpeg file
+        :return: the jpeg without metadata, or `data` if it is not a valid jpeg
+        """
+        if data[:2] != b"\xff\xd8":
+            return data
+        parts = [data[:2]]
+        pos = 2
+        while pos + 4 <= len(data):
+            if data[pos] != 0xFF:
+                return data
+            marker = data[pos + 1]
+            if marker == 0xDA:  # start of scan: the compressed data follows
+                parts.append(data[pos:])
+                return b"".join(parts)
+            length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+            end = pos + 2 + length
+            if end > len(data):
+                return data
+            if not (0xE1 <= marker <= 0xEF and marker not in (0xE2, 0xEE)) and marker != 0xFE:
+                parts.append(data[pos:end])
+            pos = end
+        return data
+
+    @staticmethod
+    def _store(path: str, key: str, ext: str) -> str:
+        target = os.path.join(cache_dir("images"), key + ext)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+        return target
+
+    @staticmethod
+    def _write(data: bytes, key: str, ext: str) -> str:
+        target = os.path.join(cache_dir("images"), key + ext)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, mode="wb") as fh:
+            fh.write(data)
+        os.replace(tmp, target)  # atomic: concurrent builds never read a partial image
+        return target
+
+    @staticmethod
+    def optimize_all(paths, dpi: int = 300, print_width: float = 6.5,
+                     jobs: Optional[int] = None) -> Dict[str, str]:
+        """
+        optimize several images in parallel; cached images are not processed again
+        :param paths: the paths to the images
+        :return: {path of an image: path of its optimized version}
+        """
+        results = {}
+        stale = []
+        for path in dict.fromkeys(paths):
+            _, target = ImageOptimizer.cached(path, dpi, print_width)
+            Metrics.cache("images", target is not None)
+            if target:
+                results[path] = target
+            else:
+                stale.append(path)
+        if len(stale) == 1 or jobs == 1:
+            for path in stale:
+                results[path] = ImageOptimizer.optimize(path, dpi, print_width)
+        elif stale:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                for path, target in zip(stale, pool.map(_optimize, stale, [dpi] * len(stale),
+                                                        [print_width] * len(stale))):
+                    results[path] = target
+        return results
+
+    @staticmethod
+    def rewrite(string: str, base_dir: str = ".", dpi: int = 300, print_width: float = 6.5,
+                jobs: Optional[int] = None) -> Tuple[str, Dict[str, str]]:
+        """
+        optimize the local images of a markdown document and point it at the optimized files.
+        images in code blocks, remote images and missing files are left unchanged.
+        :param string: the markdown document
+        :param base_dir: the directory against which relative image paths are resolved
+        :return: the updated string and {path of an optimized image relative to the .tex
+                 file: its path in the cache}
+        """
+        if "![" not in string:
+            return string, {}
+        matches = []
+        fences = MDHeader.fence.finditer(string)
+        fence = next(fences, None)
+        for match in ImageOptimizer.image.finditer(string):
+            while fence is not None and fence.end() <= match.start():
+                fence = next(fences, None)
+            if fence is not None and fence.start() <= match.start():
+                continue
+            path = match.group(2)
+            if not os.path.isabs(path):
+                path = os.path.join(base_dir, path)
+            if "://" not in match.group(2) and os.path.isfile(path):
+                matches.append((match, path))
+        optimized = ImageOptimizer.optimize_all([path for _, path in matches], dpi, print_width, jobs)
+
+        files = {}
+        parts = []
+        prev = 0
+        for match, path in matches:
+            target = optimized[path]
+            relpath = f"{ImageOptimizer.include_dir}/{os.path.basename(target)}"
+            files[relpath] = target
+            parts.append(string[prev:match.start(2)])
+            parts.append(relpath)
+            prev = match.end(2)
+        parts.append(string[prev:])
+        return "".join(parts), files
+
+
+def _optimize(path: str, dpi: int, print_width: float) -> str:
+    """
+    `ImageOptimizer.optimize()`, module-level so that it can be sent to worker processes
+    """
+    return ImageOptimizer.optimize(path, dpi, print_width)
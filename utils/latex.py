@@ -0,0 +1,341 @@
+import asyncio
+import functools
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .cache import cache_dir, text_digest
+from .errors_warnings import Warnings
+from .latexlog import BibtexLog, LatexLog
+from .texcheck import check_tex
+from .metrics import Metrics, run_process
+
+# ---------------------------------------------------------------
+# LaTeX compilation helpers: precompiled preamble formats and
+# the plan of the passes compiling a document
+# ---------------------------------------------------------------
+
+
+class PreambleFormat:
+    r"""
+    dump the preamble of a TeX document into a format file, mylatexformat-style, so that
+    the compilations of a document start from the loaded preamble instead of parsing the
+    document class and every package again.
+
+    formats are cached in the `formats` cache directory, keyed by the preamble, the engine
+    and its version, and the base format of the engine (rebuilt by `fmtutil` when the TeX
+    distribution is updated): a changed template gets a new format. a document compiled
+    with `-fmt=` skips its own preamble up to `\begin{document}`, so it is left unchanged.
+    """
+    versions = {}  # {engine: version key}, computed once per process
+
+    @staticmethod
+    def preamble(tex: str) -> Optional[str]:
+        r"""
+        :param tex: the string representation of a TeX document
+        :return: the text of the document before `\begin{document}`, or None if there is none
+        """
+        end = tex.find("\\begin{document}")
+        if end == -1 or "\\documentclass" not in tex[:end]:
+            return None
+        return tex[:end]
+
+    @staticmethod
+    def version(engine: str) -> Optional[str]:
+        """
+        identify an engine and its base format
+        :param engine: the LaTeX engine (`pdflatex`...)
+        :return: the version of the engine and the size and date of its base format,
+                 or None if the engine is not installed
+        """
+        if engine not in PreambleFormat.versions:
+            try:
+                result = subprocess.run([engine, "--version"], capture_output=True, text=True)
+                version = result.stdout.split("\n", 1)[0]
+            except OSError:
+                version = None
+            try:
+                base = subprocess.run(["kpsewhich", f"{engine}.fmt"], capture_output=True,
+                                      text=True).stdout.strip()
+                if version and base:
+                    stat = os.stat(base)
+                    version += f"|{base}|{stat.st_size}|{stat.st_mtime_ns}"
+            except OSError:
+                pass
+            PreambleFormat.versions[engine] = version
+        return PreambleFormat.versions[engine]
+
+    @staticmethod
+    def ensure(tex: str, engine: str = "pdflatex", name: str = "document") -> Optional[str]:
+        """
+        find the format of a document's preamble in the cache, or build it
+        :param tex: the string representation of the TeX document
+        :param engine: the LaTeX engine
+        :param name: the name of the document, for the warning displayed if the preamble
+                     can't be dumped
+        :return: the path to the `.fmt` file, or None if there is no usable format
+        """
+        preamble = PreambleFormat.preamble(tex)
+        version = PreambleFormat.version(engine)
+        if preamble is None or version is None:
+            return None
+        key = text_digest(engine, version, preamble)[:24]
+        fmt = os.path.join(cache_dir("formats"), f"{key}.fmt")
+        if os.path.exists(fmt):
+            Metrics.cache("formats", True)
+            return fmt
+        if os.path.exists(fmt + ".failed"):  # don't retry a preamble that can't be dumped
+            Metrics.cache("formats", True)
+            return None
+        Metrics.cache("formats", False)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "preamble.tex"), mode="w", encoding="utf-8") as fh:
+                fh.write(preamble + "\\begin{document}\n\\end{document}\n")
+            run_process(
+                [engine, "-ini", "-interaction=nonstopmode", f"-jobname={key}",
+                 f"&{engine}", "mylatexformat.ltx", "preamble.tex"],
+                cwd=tmpdir, capture_output=True
+            )
+            dumped = os.path.join(tmpdir, f"{key}.fmt")
+            if not os.path.exists(dumped):
+                open(fmt + ".failed", mode="w").close()
+                Warnings("preamble_format", name)
+                return None
+            tmp = f"{fmt}.{os.getpid()}.tmp"
+            shutil.copyfile(dumped, tmp)
+            os.replace(tmp, fmt)  # atomic: concurrent builds never read a partial format
+        return fmt
+
+    @staticmethod
+    def stage(fmt: str, workdir: str) -> List[str]:
+        """
+        make a format available to a compilation
+        :param fmt: the path to the `.fmt` file
+        :param workdir: the directory the engine runs in
+        :return: the arguments to add to the engine's command line
+        """
+        target = os.path.join(workdir, os.path.basename(fmt))
+        try:
+            os.link(fmt, target)
+        except OSError:
+            shutil.copyfile(fmt, target)
+        return [f"-fmt={os.path.splitext(os.path.basename(fmt))[0]}"]
+
+
+draft_flags = {"pdflatex": "-draftmode", "lualatex": "--draftmode", "xelatex": "-no-pdf"}
+unicode_fonts = re.compile(r"^[^%\n]*\\usepackage(?:\[[^\]]*\])?\{[^}]*\b(?:fontspec|unicode-math)\b", re.M)
+unicode_engines = ("xelatex", "lualatex")  # the engines that load `fontspec`, by preference
+draft_images = r"\makeatletter\@ifpackageloaded{graphicx}{\setkeys{Gin}{draft}}{}\makeatother"
+
+
+def latex_engine(tex: str, engine: Optional[str] = None) -> str:
+    """
+    choose the engine compiling a document: pdflatex can't load `fontspec` or `unicode-math`,
+    so a preamble loading them (as `utils/template.tex` does) is compiled with xelatex, or
+    with lualatex if xelatex is not installed
+    :param tex: the string representation of the TeX document
+    :param engine: optional. the engine asked for, used as is
+    :return: the LaTeX engine
+    """
+    if engine:
+        return engine
+    preamble = tex.split("\\begin{document}", 1)[0]
+    if not unicode_fonts.search(preamble):
+        return "pdflatex"
+    return next((e for e in unicode_engines if shutil.which(e)), unicode_engines[0])
+
+
+def latex_steps(tex: str, preview: bool = False) -> List[str]:
+    r"""
+    plan the compilation of a document. only the last LaTeX pass writes the PDF: the
+    passes before it (which only update the `.aux`, `.toc` and `.bbl` data) run in
+    draft mode, without PDF output, font embedding or image inclusion.
+    :param tex: the string representation of the TeX document
+    :param preview: the preview profile: a single pass, with draft images (frames)
+    :return: the steps: `draft` (LaTeX pass without PDF), `bibtex` and `final` (LaTeX pass
+             writing the PDF), in order
+    """
+    if preview:
+        return ["final"]
+    steps = ["draft", "draft"]
+    if "\\bibliography" in tex or "\\addbibresource" in tex:
+        steps += ["draft", "bibtex", "draft"]
+    return steps + ["final"]
+
+
+def preview_source(tex: str) -> str:
+    r"""
+    the source of a preview build, whose images are drawn as frames: the graphicx `draft`
+    option is set right after `\begin{document}`. the preamble is left as is, so that the
+    precompiled format of the document still matches it; and nothing is run before it, as
+    a mylatexformat format skips the input up to `\begin{document}`
+    :param tex: the string representation of the TeX document
+    :return: the document to write and compile
+    """
+    return tex.replace("\\begin{document}", "\\begin{document}" + draft_images, 1)
+
+
+def latex_target(name: str, step: str, engine: str = "pdflatex") -> List[str]:
+    """
+    the end of the command line of a LaTeX pass, after `latex_command()`
+    :param name: the name of the document, without extension
+    :param step: `draft` or `final` (see `latex_steps()`)
+    :param engine: the LaTeX engine
+    :return: the arguments selecting the mode of the pass and the document
+    """
+    args = [draft_flags[engine]] if step == "draft" and engine in draft_flags else []
+    return args + [f"{name}.tex"]
+
+
+def latex_command(tex: str, workdir: str, options: Dict, engine: Optional[str] = None) -> List[str]:
+    """
+    build the command line compiling a document
+    :param tex: the string representation of the TeX document
+    :param workdir: the directory the engine runs in
+    :param options: the conversion options; `preamble_cache` enables precompiled preambles
+    :param engine: optional. the LaTeX engine (see `latex_engine()`)
+    :return: the command, without the name of the document
+    """
+    engine = latex_engine(tex, engine)
+    command = [engine, "-interaction=nonstopmode", "-file-line-error"]
+    if options.get("preamble_cache"):
+        fmt = PreambleFormat.ensure(tex, engine)
+        if fmt:
+            command += PreambleFormat.stage(fmt, workdir)
+    return command
+
+
+def compile_plan(tex: str, workdir: str, options: Dict, name: str = "document",
+                 engine: Optional[str] = None) -> List[Tuple[str, List[str], object]]:
+    """
+    the commands compiling a document written to `{workdir}/{name}.tex`, with the passes
+    of `latex_steps()`. shared by the synchronous and the asyncio runners.
+    :param tex: the string representation of the TeX document
+    :param workdir: the directory the engine runs in
+    :param options: the conversion options (`preamble_cache`, `preview`: a single pass over
+                    the `preview_source()` of the document)
+    :param name: the name of the document, without extension
+    :param engine: optional. the LaTeX engine (see `latex_engine()`)
+    :return: (step, command, parser of its output) for every step, in order
+    """
+    engine = latex_engine(tex, engine)
+    latex = latex_command(tex, workdir, options, engine)
+    plan = []
+    for step in latex_steps(tex, options.get("preview", False)):
+        if step == "bibtex":
+            plan.append((step, ["bibtex", name], BibtexLog()))
+        else:
+            plan.append((step, latex + latex_target(name, step, engine), LatexLog()))
+    return plan
+
+
+def keep_diagnostics(step: str, log, diagnostics: List[Dict]) -> bool:
+    """
+    collect the diagnostics of a step that ran: those of BibTeX, of the last LaTeX pass
+    and of a failed pass. the draft passes report references that the next passes resolve.
+    :return: whether the next steps should run
+    """
+    if log.fatal or step in ("bibtex", "final"):
+        diagnostics += log.diagnostics
+    return log.fatal is None
+
+
+def discard_output(workdir: str, name: str):
+    """
+    remove the PDF of a failed build: an engine killed in its last pass leaves it truncated
+    """
+    pdf = os.path.join(workdir, f"{name}.pdf")
+    if os.path.exists(pdf):
+        os.remove(pdf)
+
+
+def run_pass(command: List[str], workdir: str, log) -> int:
+    """
+    run a step, parsing its output while it runs. the engine is killed as soon as the
+    log reports a fatal error (see `LatexLog`): other errors are recovered from in
+    nonstopmode, and the document is still typeset.
+    :param command: the command line of the step
+    :param workdir: the directory the engine runs in
+    :param log: the parser of the output (`LatexLog` or `BibtexLog`)
+    :return: the exit code of the engine
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        for line in process.stdout:
+            log.feed(line.decode("utf-8", errors="replace"))
+            if log.fatal:
+                process.kill()
+                break
+    finally:
+        process.stdout.close()
+        code = process.wait()
+    log.close()
+    Metrics.process(command[0], time.perf_counter() - start, code)
+    return code
+
+
+async def run_pass_async(command: List[str], workdir: str, log) -> int:
+    """
+    `run_pass()` for asyncio: the event loop runs other compilations while this one waits
+    """
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(*command, cwd=workdir, stdin=subprocess.DEVNULL,
+                                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            log.feed(line.decode("utf-8", errors="replace"))
+            if log.fatal:
+                process.kill()
+                break
+    finally:
+        code = await process.wait()
+    log.close()
+    Metrics.process(command[0], time.perf_counter() - start, code)
+    return code
+
+
+def compile_latex(tex: str, workdir: str, options: Dict, name: str = "document",
+                  engine: Optional[str] = None) -> List[Dict]:
+    """
+    compile a document written to `{workdir}/{name}.tex` (see `compile_plan()`). the
+    build stops at the first fatal error reported by LaTeX or BibTeX, without a PDF; a
+    document failing `check_tex()` is not compiled.
+    :return: the diagnostics of the compilation (see `LatexLog` and `keep_diagnostics()`)
+    """
+    diagnostics = check_tex(tex, name)
+    if diagnostics:  # LaTeX would only fail after several passes
+        return diagnostics
+    for step, command, log in compile_plan(tex, workdir, options, name, engine):
+        run_pass(command, workdir, log)
+        if not keep_diagnostics(step, log, diagnostics):
+            discard_output(workdir, name)
+            break
+    return diagnostics
+
+
+async def compile_latex_async(tex: str, workdir: str, options: Dict, name: str = "document",
+                              engine: Optional[str] = None) -> List[Dict]:
+    """
+    `compile_latex()` for asyncio. the preamble format, if any, is built in a thread
+    """
+    diagnostics = check_tex(tex, name)
+    if diagnostics:
+        return diagnostics
+    loop = asyncio.get_running_loop()  # no `asyncio.to_thread()` before python 3.9
+    plan = await loop.run_in_executor(None, functools.partial(compile_plan, tex, workdir, options, name, engine))
+    for step, command, log in plan:
+        await run_pass_async(command, workdir, log)
+        if not keep_diagnostics(step, log, diagnostics):
+            discard_output(workdir, name)
+            break
+    return diagnostics
@@ -0,0 +1,200 @@
+import json
+import re
+from typing import Dict, List, Optional
+
+# ---------------------------------------------------------------
+# structured parsing of the output of LaTeX and BibTeX, line by
+# line while they run, to fail fast and report diagnostics
+# ---------------------------------------------------------------
+
+
+class LatexLog:
+    r"""
+    an incremental parser of the terminal output (or `.log`) of a LaTeX run.
+
+    the output is fed in chunks with `feed()` as the engine writes it. every complete line
+    is classified and turned into a diagnostic `{"level", "file", "line", "message"}`:
+    - `error`: a TeX or LaTeX error (`! ...`, or `file:line: ...` with `-file-line-error`).
+      most errors are recovered from in nonstopmode and the PDF is still written; the first
+      error that ends the run (emergency stop, missing file, `==> Fatal error occurred`...)
+      is kept in `fatal`, so that the caller can stop the build
+    - `rerun`: a request to run LaTeX again (`Rerun to get cross-references right`...)
+    - `warning`: LaTeX, package, class and font warnings, and over/underfull boxes
+    the current file is tracked with the `(file ... )` groups that TeX prints when it
+    opens and closes files.
+    """
+    max_print_line = 79  # TeX wraps its output at this width
+    error = re.compile(r"^(?:(?P<file>[^\s:][^:]*):(?P<line>\d+): |! )(?P<message>.*)$")
+    warning = re.compile(r"^(?:LaTeX|LaTeX Font|pdfTeX|(?:Package|Class) (?P<package>\S+)) [Ww]arning: (?P<message>.*)$")
+    box = re.compile(r"^(?:Over|Under)full \\[hv]box .*?(?:lines? (?P<line>\d+)|$)")
+    input_line = re.compile(r"on input line (\d+)")
+    context_line = re.compile(r"^l\.(\d+)")
+    rerun = re.compile(r"Rerun to get|Label\(s\) may have changed|Please \(?re\)?run LaTeX|Rerun LaTeX"
+                       + r"|has changed\. Rerun|Please rerun LaTeX", re.I)
+    continuation = re.compile(r"^\(\S+\)\s+")
+    fatal_error = re.compile(r"Emergency stop|==> Fatal error|job aborted|File `[^']*' not found|I can't find file"
+                             + r"|I can't write on file|TeX capacity exceeded|Interruption", re.I)
+    files = re.compile(r"\((?P<file>[^\s()]*)|\)")
+
+    def __init__(self):
+        self.diagnostics = []  # every diagnostic, in order
+        self.fatal = None  # the first error that ends the run
+        self.rerun_requested = False
+        self._stack = []  # the files opened by TeX; None for a parenthesis that is not a file
+        self._pending = ""  # the start of a wrapped line, or of an incomplete line
+        self._continued = None  # a multi-line warning, or an error waiting for its `l.<n>` line
+
+    @property
+    def file(self) -> Optional[str]:
+        """
+        the file TeX is reading
+        """
+        for path in reversed(self._stack):
+            if path:
+                return path
+        return None
+
+    def feed(self, chunk: str):
+        """
+        parse a chunk of output. the last line of the chunk is kept until it is complete.
+        :param chunk: the output of the engine, in any size
+        """
+        lines = (self._pending + chunk).split("\n")
+        self._pending = lines.pop()
+        wrapped = ""
+        for line in lines:
+            line = line.rstrip("\r")
+            if wrapped and line.startswith("! "):  # errors start on a new line: not a wrapped line
+                self._line(wrapped)
+                wrapped = ""
+            if len(line) == LatexLog.max_print_line:  # wrapped by TeX: continued on the next line
+                wrapped += line
+                continue
+            self._line(wrapped + line)
+            wrapped = ""
+        self._pending = wrapped + self._pending
+
+    def close(self):
+        """
+        parse the rest of the output, once the engine has exited
+        """
+        if self._pending:
+            self._line(self._pending)
+        self._pending = ""
+        self._continued = None
+
+    def _add(self, level: str, message: str, file: Optional[str] = None, line: Optional[int] = None) -> Dict:
+        file = file or self.file
+        if file and file.startswith("./"):
+            file = file[2:]
+        diagnostic = {"level": level, "file": file, "line": line, "message": message.strip()}
+        self.diagnostics.append(diagnostic)
+        if level == "error" and self.fatal is None and LatexLog.fatal_error.search(diagnostic["message"]):
+            self.fatal = diagnostic
+        return diagnostic
+
+    def _line(self, line: str):
+        """
+        classify a line of output
+        """
+        continued, self._continued = self._continued, None
+        if continued is not None:
+            if continued["level"] == "error":
+                match = LatexLog.context_line.match(line)
+                if match:  # `l.12 \foo`: the line of a `! ...` error
+                    continued["line"] = int(match[1])
+                    return
+                if line.strip():
+                    self._continued = continued
+                    return
+            elif LatexLog.continuation.match(line) or (line.strip() and not line.startswith(("(", ")"))):
+                # continuation of a warning: `(hyperref)   ...` for packages, until a blank line
+                continued["message"] += " " + LatexLog.continuation.sub("", line.strip())
+                self._set_line(continued)
+                self._continued = continued
+                return
+
+        match = LatexLog.error.match(line)
+        if match and (match["file"] is None or not match["file"].startswith("(")):
+            diagnostic = self._add("error", match["message"], match["file"],
+                                   int(match["line"]) if match["line"] else None)
+            if diagnostic["line"] is None:
+                self._continued = diagnostic
+            return
+
+        match = LatexLog.warning.match(line)
+        if match:
+            level = "rerun" if LatexLog.rerun.search(line) else "warning"
+            message = match["message"] if not match["package"] else f"{match['package']}: {match['message']}"
+            diagnostic = self._add(level, message)
+            self._set_line(diagnostic)
+            self.rerun_requested |= level == "rerun"
+            self._continued = diagnostic
+            return
+
+        if LatexLog.rerun.search(line):
+            self._add("rerun", line)
+            self.rerun_requested = True
+            return
+
+        match = LatexLog.box.match(line)
+        if match:
+            self._add("warning", line, line=int(match["line"]) if match["line"] else None)
+            return
+
+        for match in LatexLog.files.finditer(line):
+            if match[0] == ")":
+                if self._stack:
+                    self._stack.pop()
+            else:
+                path = match["file"]
+                looks_like_file = path.startswith(("./", "/", "../")) or re.search(r"\.\w+$", path)
+                self._stack.append(path if looks_like_file else None)
+
+    def _set_line(self, diagnostic: Dict):
+        match = LatexLog.input_line.search(diagnostic["message"])
+        if match:
+            diagnostic["line"] = int(match[1])
+
+    @property
+    def errors(self) -> List[Dict]:
+        return [d for d in self.diagnostics if d["level"] == "error"]
+
+    def to_json(self) -> str:
+        """
+        :return: the diagnostics as a json array
+        """
+        return json.dumps(self.diagnostics, indent=2)
+
+
+class BibtexLog:
+    """
+    a parser of the output of BibTeX: `Warning--...` lines are warnings, and the
+    `...---line <n> of file <file>` lines end the messages of errors.
+    """
+    location = re.compile(r"^(?P<message>.*)---line (?P<line>\d+) of file (?P<file>.+)$")
+
+    def __init__(self):
+        self.diagnostics = []
+        self.fatal = None  # the first error
+        self._previous = ""
+
+    def feed(self, chunk: str):
+        """
+        parse a chunk of output made of complete lines
+        """
+        for line in chunk.splitlines():
+            if line.startswith("Warning--"):
+                self.diagnostics.append({"level": "warning", "file": None, "line": None,
+                                         "message": line[len("Warning--"):].strip()})
+            else:
+                match = BibtexLog.location.match(line)
+                if match:
+                    message = match["message"].strip() or self._previous.strip()
+                    self.diagnostics.append({"level": "error", "file": match["file"].strip(),
+                                             "line": int(match["line"]), "message": message})
+                    self.fatal = self.fatal or self.diagnostics[-1]
+            self._previous = line
+
+    def close(self):
+        pass
@@ -0,0 +1,344 @@
+import json
+import multiprocessing.util
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from .cache import cache_dir, text_digest
+
+# ---------------------------------------------------------------
+# metrics export: the conversions, stages, engine runs and cache
+# lookups of every md2x process are counted, and the totals are
+# written in the OpenMetrics text format to a file refreshed
+# periodically, for the node-exporter textfile collector
+# ---------------------------------------------------------------
+
+stage_buckets = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+process_buckets = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Metrics:
+    """
+    the metrics of the md2x processes. recording is enabled by the `MD2X_METRICS`
+    environment variable (the path of the textfile), which the worker and build
+    processes inherit; without it, every call is a no-op.
+
+    every process counts in its own registry and writes it to a spool file in the
+    `metrics` cache directory: after `flush_interval` seconds of recording, and when it
+    exits. the process that called `start()` merges the spool files into the textfile
+    every `MD2X_METRICS_INTERVAL` seconds (default 15) and when it exits. the counters
+    start at 0 with every `start()`: a run of md2x is a process for Prometheus.
+    """
+    # {name: (type, unit, help, buckets)}, in the order of the textfile
+    families = {
+        "md2x_documents": ("counter", "", "Documents converted, by output format and status", None),
+        "md2x_input_bytes": ("counter", "bytes", "Bytes of markdown converted", None),
+        "md2x_output_bytes": ("counter", "bytes", "Bytes of output written", None),
+        "md2x_stage_duration_seconds": ("histogram", "seconds", "Duration of the conversion stages",
+                                        stage_buckets),
+        "md2x_stages_skipped": ("counter", "", "Stages skipped because the document lacks their constructs",
+                                None),
+        "md2x_subprocess_duration_seconds": ("histogram", "seconds",
+                                             "Duration of the pdflatex, bibtex and pandoc runs",
+                                             process_buckets),
+        "md2x_subprocess_exits": ("counter", "", "Exit codes of the pdflatex, bibtex and pandoc runs", None),
+        "md2x_cache_requests": ("counter", "", "Cache lookups, by cache and result (hit|miss)", None),
+    }
+    flush_interval = 1.0  # the spool file of a process is at most this old while it records
+    values = {}  # {(name, ((label, value), ...)): counter value, or [bucket counts..., count, sum]}
+    lock = threading.Lock()
+    state = {"spool": None, "flushed": 0.0, "registered": False, "exporting": None}
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(os.environ.get("MD2X_METRICS"))
+
+    @staticmethod
+    def inc(name: str, value: float = 1, **labels):
+        """
+        add `value` to a counter
+        :param name: the name of the counter family (see `families`)
+        :param labels: the labels of the counter
+        """
+        if not Metrics.enabled():
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with Metrics.lock:
+            Metrics.values[key] = Metrics.values.get(key, 0) + value
+        Metrics._recorded()
+
+    @staticmethod
+    def observe(name: str, value: float, **labels):
+        """
+        record a value in a histogram
+        :param name: the name of the histogram family (see `families`)
+        :param labels: the labels of the histogram
+        """
+        if not Metrics.enabled():
+            return
+        buckets = Metrics.families[name][3]
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with Metrics.lock:
+            counts = Metrics.values.get(key)
+            if counts is None:
+                counts = Metrics.values[key] = [0] * len(buckets) + [0, 0.0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += 1
+            counts[-1] += value
+        Metrics._recorded()
+
+    @staticmethod
+    def document(output_format: str, ok: bool, bytes_in: int, bytes_out: int = 0):
+        """
+        record a conversion
+        :param output_format: the output format (`tex`, `pdf`...)
+        :param ok: whether the conversion succeeded
+        :param bytes_in: the size of the markdown, in bytes
+        :param bytes_out: the size of the output, in bytes
+        """
+        Metrics.inc("md2x_documents", format=output_format, status="ok" if ok else "error")
+        Metrics.inc("md2x_input_bytes", bytes_in, format=output_format)
+        Metrics.inc("md2x_output_bytes", bytes_out, format=output_format)
+
+    @staticmethod
+    def process(command: str, seconds: float, code: int):
+        """
+        record a run of an engine
+        :param command: the engine (`pdflatex`, `bibtex`, `pandoc`...), or a path to it
+        :param code: its exit code
+        """
+        command = os.path.basename(command)
+        Metrics.observe("md2x_subprocess_duration_seconds", seconds, command=command)
+        Metrics.inc("md2x_subprocess_exits", command=command, code=code)
+
+    @staticmethod
+    def cache(namespace: str, hit: bool):
+        """
+        record a lookup in a cache directory
+        :param namespace: the cache (`images`, `sections`...), see `cache_dir()`
+        """
+        Metrics.inc("md2x_cache_requests", cache=namespace, result="hit" if hit else "miss")
+
+    @staticmethod
+    def _spool_dir() -> str:
+        return os.path.join(cache_dir("metrics"), text_digest(os.environ["MD2X_METRICS"])[:24])
+
+    @staticmethod
+    def _recorded():
+        """
+        after a record: write the spool file if it is older than `flush_interval`, and
+        make sure it is written when the process exits (also for worker processes,
+        which exit through `multiprocessing`)
+        """
+        if not Metrics.state["registered"]:
+            Metrics.state["registered"] = True
+            Metrics.state["flushed"] = time.monotonic()
+            multiprocessing.util.Finalize(None, Metrics.flush, exitpriority=10)
+        if time.monotonic() - Metrics.state["flushed"] >= Metrics.flush_interval:
+            Metrics.flush()
+
+    @staticmethod
+    def flush():
+        """
+        write the registry of this process to its spool file
+        """
+        if not Metrics.enabled():
+            return
+        with Metrics.lock:
+            snapshot = [[name, dict(labels), list(value) if isinstance(value, list) else value]
+                        for (name, labels), value in Metrics.values.items()]
+            Metrics.state["flushed"] = time.monotonic()
+        if Metrics.state["spool"] is None:  # unique per process: pids are reused
+            Metrics.state["spool"] = f"{os.getpid()}-{os.urandom(4).hex()}.json"
+        try:
+            spool = Metrics._spool_dir()
+            os.makedirs(spool, exist_ok=True)
+            target = os.path.join(spool, Metrics.state["spool"])
+            tmp = f"{target}.tmp"
+            with open(tmp, mode="w", encoding="utf-8") as fh:
+                json.dump(snapshot, fh)
+            os.replace(tmp, target)  # atomic: the exporter never reads a partial file
+        except OSError:  # the metrics never fail a conversion
+            pass
+
+    @staticmethod
+    def _reset():
+        """
+        a forked child starts with an empty registry: its parent reports its own values
+        """
+        Metrics.values = {}
+        Metrics.lock = threading.Lock()
+        Metrics.state = {"spool": None, "flushed": 0.0, "registered": False, "exporting": None}
+
+    @staticmethod
+    def merge(snapshots) -> Dict:
+        """
+        add up the registries of several processes
+        :param snapshots: lists of [name, labels, value] (see `flush()`)
+        :return: {(name, labels): value}
+        """
+        total = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot:
+                key = (name, tuple(sorted(labels.items())))
+                if key not in total:
+                    total[key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    total[key] = [a + b for a, b in zip(total[key], value)]
+                else:
+                    total[key] += value
+        return total
+
+    @staticmethod
+    def _collect(spool: str) -> List:
+        """
+        read the spool files. those of the processes that exited are folded into
+        `finished.json`, so that long watch sessions don't accumulate files
+        """
+        finished_path = os.path.join(spool, "finished.json")
+        snapshots = {}
+        for name in os.listdir(spool):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(spool, name), mode="r", encoding="utf-8") as fh:
+                    snapshots[name] = json.load(fh)
+            except (OSError, ValueError):
+                pass
+        dead = []
+        for name in snapshots:
+            pid = name.split("-", 1)[0]
+            if name != "finished.json" and pid.isdigit() and int(pid) != os.getpid():
+                try:
+                    os.kill(int(pid), 0)
+                except ProcessLookupError:
+                    dead.append(name)
+                except OSError:
+                    pass
+        if dead:
+            finished = Metrics.merge(snapshots.get(n, []) for n in ["finished.json"] + dead)
+            snapshots["finished.json"] = [[name, dict(labels), value] for (name, labels), value in finished.items()]
+            tmp = f"{finished_path}.tmp"
+            with open(tmp, mode="w", encoding="utf-8") as fh:
+                json.dump(snapshots["finished.json"], fh)
+            os.replace(tmp, finished_path)
+            for name in dead:
+                del snapshots[name]
+                os.remove(os.path.join(spool, name))
+        return list(snapshots.values())
+
+    @staticmethod
+    def _number(value: float) -> str:
+        if isinstance(value, float) and not value.is_integer():
+            return repr(value)
+        return str(int(value))
+
+    @staticmethod
+    def _labels(labels: Tuple, extra: str = "") -> str:
+        parts = [f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+                 for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    @staticmethod
+    def render(values: Dict) -> str:
+        """
+        render metrics in the OpenMetrics text format
+        :param values: {(name, labels): value} (see `merge()`)
+        :return: the exposition, ending with `# EOF`
+        """
+        lines = []
+        for family, (kind, unit, description, buckets) in Metrics.families.items():
+            samples = sorted((labels, value) for (name, labels), value in values.items() if name == family)
+            lines.append(f"# TYPE {family} {kind}")
+            if unit:
+                lines.append(f"# UNIT {family} {unit}")
+            lines.append(f"# HELP {family} {description}.")
+            for labels, value in samples:
+                if kind == "counter":
+                    lines.append(f"{family}_total{Metrics._labels(labels)} {Metrics._number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value[:-2]):
+                    cumulative += count
+                    le = f'le="{bound!r}"'
+                    lines.append(f"{family}_bucket{Metrics._labels(labels, le)} {cumulative}")
+                # the values above the last bound are in no finite bucket: +Inf is the count
+                le = 'le="+Inf"'
+                lines.append(f"{family}_bucket{Metrics._labels(labels, le)} {value[-2]}")
+                lines.append(f"{family}_count{Metrics._labels(labels)} {value[-2]}")
+                lines.append(f"{family}_sum{Metrics._labels(labels)} {Metrics._number(value[-1])}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def export(path: str):
+        """
+        merge the spool files of every process and write the textfile
+        :param path: the path of the textfile
+        """
+        Metrics.flush()
+        try:
+            text = Metrics.render(Metrics.merge(Metrics._collect(Metrics._spool_dir())))
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, mode="w", encoding="utf-8") as fh:
+                fh.write(text)
+            os.replace(tmp, path)  # atomic: the collector never reads a partial file
+        except OSError:
+            pass
+
+    @staticmethod
+    def start(path: str, interval: float = None):
+        """
+        enable the metrics for this process and its children, and export them to
+        `path` every `interval` seconds and at exit. calling it again does nothing
+        :param path: the path of the textfile (a `.prom` file in the collector's directory)
+        :param interval: the refresh interval, in seconds (default: `MD2X_METRICS_INTERVAL`, or 15)
+        """
+        if Metrics.state["exporting"]:
+            return
+        path = os.path.abspath(path)
+        if interval is None:
+            interval = float(os.environ.get("MD2X_METRICS_INTERVAL") or 15)
+        os.environ["MD2X_METRICS"] = path
+        Metrics.state["exporting"] = path
+        spool = Metrics._spool_dir()
+        os.makedirs(spool, exist_ok=True)
+        for name in os.listdir(spool):  # the totals of a previous run
+            os.remove(os.path.join(spool, name))
+        Metrics.export(path)
+        thread = threading.Thread(target=Metrics._export_loop, args=(path, interval),
+                                  name="md2x-metrics", daemon=True)
+        thread.start()
+        multiprocessing.util.Finalize(None, Metrics.export, args=(path,), exitpriority=5)
+
+    @staticmethod
+    def _export_loop(path: str, interval: float):
+        while True:
+            time.sleep(interval)
+            Metrics.export(path)
+
+
+def run_process(command: List[str], **kwargs) -> subprocess.CompletedProcess:
+    """
+    `subprocess.run()`, recording the duration and the exit code of the command (see
+    `Metrics.process()`). a `CalledProcessError` is recorded before being raised
+    """
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(command, **kwargs)
+    except subprocess.CalledProcessError as e:
+        Metrics.process(command[0], time.perf_counter() - start, e.returncode)
+        raise
+    Metrics.process(command[0], time.perf_counter() - start, result.returncode)
+    return result
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=Metrics._reset)
@@ -0,0 +1,182 @@
+import bisect
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from .converters import MDHeader, MDList, MDReference
+from .pipeline import Features, Stages, block_stages, convert_markdown, tex_stages
+
+# ---------------------------------------------------------------
+# intra-document parallelism: a large document is cut between
+# independent top-level blocks, which are converted concurrently
+# and joined in order. only the footnotes are global: their
+# definitions are gathered into one index between two passes
+# ---------------------------------------------------------------
+
+parallel_threshold = 1 << 20  # smaller documents are converted sequentially: a pool costs more
+block_size = 1 << 18  # the smallest block: a block is at least this many characters
+fence = re.compile(r"```(.*?)```", flags=re.S)  # the code blocks, paired as `MDCode.block_code()` does
+listing = re.compile(r"\\(begin|end)\{(?:listing|lstlisting)}")  # escaped as code by `prepare_markdown()`
+token = re.compile(r"@@CODETOKEN\d+@@")
+
+
+def _protected(string: str) -> List[Tuple[int, int]]:
+    """
+    the spans of a document that a cut would change: the code blocks, and the text from
+    the first `\\begin{listing}` or `\\begin{lstlisting}` written in the markdown to the end
+    of the environment that `prepare_markdown()` pairs with the last one
+    :return: (start, end) spans, sorted by start
+    """
+    spans = [m.span() for m in fence.finditer(string)] if "```" in string else []
+    if "\\begin{l" in string:
+        marks = list(listing.finditer(string))
+        begins = [m.start() for m in marks if m[1] == "begin"]
+        if begins:
+            end = max([m.end() for m in marks if m[1] == "end" and m.start() > begins[-1]] or [begins[-1]])
+            after = [e for _, e in spans if e > begins[-1]]  # a code block ends with `\end{...}`
+            spans.append((begins[0], max(end, after[0] if after else end)))
+            spans.sort()
+    return spans
+
+
+def cut_points(string: str, size: int = block_size) -> List[int]:
+    r"""
+    find where a document can be cut into blocks converted apart, with the same output
+    as the whole document. a block starts on a line that starts with a letter or a digit
+    (not a list item), after an empty line, outside the code blocks: no replacement of
+    `block_stages()` or `tex_stages()` spans the cut, no list, footnote definition,
+    quote, table or ArXiv math runs over it, and its output does not start with a line break that
+    `clean_tex()` would merge with the end of the previous block.
+    :param string: the string representation of the markdown file
+    :param size: the smallest block, in characters
+    :return: the offsets of the cuts, in order
+    """
+    spans = _protected(string)
+    starts = [start for start, _ in spans]
+    reach = []  # the end of the spans up to every span: the spans can nest
+    for _, end in spans:
+        reach.append(max(end, reach[-1]) if reach else end)
+    cuts = []
+    pos = size
+    while pos < len(string):
+        blank = string.find("\n\n", pos - 1)
+        if blank == -1:
+            break
+        cut = blank + 2
+        while cut < len(string) and string[cut] == "\n":
+            cut += 1
+        pos = cut + 1
+        if cut >= len(string) or not string[cut].isalnum() or MDList.ordered_item.match(string, cut):
+            continue
+        n = bisect.bisect_right(starts, cut) - 1
+        if n >= 0 and reach[n] > cut:
+            continue
+        cuts.append(cut)
+        pos = cut + size
+    return cuts
+
+
+def _convert_block(block: str, index: int, french_quote: bool, arxiv: bool,
+                   longtable_threshold: Optional[int]) -> Tuple[str, Dict, Dict, List[str], List[str], int]:
+    """
+    the first pass over a block: the stages before the footnotes, whose definitions are
+    removed. module-level so that it can be sent to worker processes
+    :return: the converted block, its code blocks, its footnotes, the footnotes it points to,
+             the footnotes it defines more than once and its feature bitmap
+    """
+    features = Features.scan(block)
+    data, codedict = block_stages(block, french_quote, Stages(features), index << 32, arxiv, longtable_threshold)
+    notes = {}
+    pointers = []
+    duplicates = []
+    if features & Features.FOOTNOTE:
+        data, notes = MDReference.extract_notes(data, duplicates)
+        pointers = list(dict.fromkeys(MDReference.pointer.findall(data)))
+    return data, codedict, notes, pointers, duplicates, features
+
+
+def _finish_block(data: str, codedict: Dict, notes: Dict, features: int, unnumbered: bool,
+                  document_class: str, arxiv: bool, labels: Set[str]) -> str:
+    """
+    the second pass over a block: its footnotes, from the index of the whole document,
+    and the TeX stages, with the header labels of the previous blocks. module-level so
+    that it can be sent to worker processes
+    """
+    if features & Features.FOOTNOTE:
+        data = MDReference.replace_pointers(data, notes)
+    return tex_stages(data, codedict, unnumbered, document_class, Stages(features), arxiv, labels)
+
+
+def free_threaded() -> bool:
+    """
+    whether threads run in parallel: on a free-threaded CPython without the GIL
+    """
+    return hasattr(sys, "_is_gil_enabled") and not sys._is_gil_enabled()
+
+
+def convert_parallel(string: str, french_quote: bool = False, unnumbered: bool = False,
+                     document_class: str = "article", jobs: Optional[int] = None,
+                     size: Optional[int] = None, arxiv: bool = False,
+                     longtable_threshold: Optional[int] = None) -> str:
+    """
+    convert a markdown string like `convert_markdown()`, its blocks (see `cut_points()`)
+    in parallel: on a process pool, or on threads on a free-threaded CPython. the
+    footnotes are gathered from every block (the first definition of a note wins), then
+    the pointers of every block are replaced. the output is the output of
+    `convert_markdown()`, byte for byte.
+    :param string: the string representation of the markdown file
+    :param french_quote: see `convert_markdown()`
+    :param unnumbered: see `convert_markdown()`
+    :param document_class: see `convert_markdown()`
+    :param jobs: the number of workers. defaults to the number of CPUs
+    :param size: the smallest block. defaults to `block_size`, and documents smaller than
+                 `parallel_threshold` are converted sequentially
+    :param arxiv: see `convert_markdown()`
+    :param longtable_threshold: see `convert_markdown()`
+    :return: the TeX representation of the markdown string
+    """
+    cuts = [] if jobs == 1 or (size is None and len(string) < parallel_threshold) else cut_points(
+        string, size or block_size)
+    if not cuts:
+        return convert_markdown(string, french_quote, unnumbered, document_class, arxiv=arxiv,
+                                longtable_threshold=longtable_threshold)
+    bounds = [0] + cuts + [len(string)]
+    blocks = [string[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    executor = ThreadPoolExecutor if free_threaded() else ProcessPoolExecutor
+    with executor(max_workers=jobs) as pool:
+        n = len(blocks)
+        converted = list(pool.map(_convert_block, blocks, range(n), [french_quote] * n, [arxiv] * n,
+                                  [longtable_threshold] * n))
+
+        # the index of the footnotes, and the code blocks they contain
+        notes = {}
+        duplicates = []
+        for _, codedict, block_notes, _, block_duplicates, _ in converted:
+            duplicates += block_duplicates
+            for key, note in block_notes.items():
+                if key in notes:
+                    duplicates.append(key)
+                else:
+                    notes[key] = note
+        MDReference.warn_duplicates(duplicates)
+        codes = {}
+        for _, codedict, block_notes, *_ in converted:
+            for note in block_notes.values():
+                codes.update((t, codedict[t]) for t in token.findall(note) if t in codedict)
+        everything = 0
+        for *_, features in converted:
+            everything |= features
+
+        # the labels of the headers are numbered across the blocks
+        labels = MDHeader.shared_labels([[h["text"] for h in MDHeader.index(data)] for data, *_ in converted])
+
+        args = []
+        for (data, codedict, _, pointers, _, features), used in zip(converted, labels):
+            if pointers:  # the notes can bring the constructs of other blocks
+                features |= everything
+                codedict = dict(codedict, **codes)
+            args.append((data, codedict, {k: notes[k] for k in pointers if k in notes}, features,
+                         unnumbered, document_class, arxiv, used))
+        return "".join(pool.map(_finish_block, *zip(*args)))
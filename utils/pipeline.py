@@ -0,0 +1,194 @@
+import re
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .arxiv_converters import ArxivCitation, ArxivMath, ArxivTable
+from .converters import MDSimple, MDQuote, MDList, MDCode, MDCleaner, MDReference, MDHeader
+from .metrics import Metrics
+
+# ---------------------------------------------------------------
+# the markdown -> TeX conversion pipeline shared by `md2tex`,
+# `md2x` and the project/worker code: the order of the steps
+# matters, see the comments below
+# ---------------------------------------------------------------
+
+
+class Features:
+    r"""
+    a bitmap of the markdown constructs a document uses, built by a cheap pre-scan of the
+    markdown source. the conversion skips the stages whose constructs are absent: a plain
+    prose document doesn't pay for the list, footnote, code or quote passes.
+
+    a bit is set whenever the construct *may* be present (a `$` sets `MATH`, even
+    escaped): the bitmap only skips stages that would leave their input unchanged.
+    """
+    FENCE = 1  # ``` code blocks
+    QUOTE = 2  # `"` and `'` inline quotes
+    BLOCKQUOTE = 4  # `>` quotes
+    LIST = 8  # `-` and `1.` list items
+    FOOTNOTE = 16  # `[^1]` footnotes
+    HEADER = 32  # `#` headers
+    TABLE = 64  # `|` tables
+    MATH = 128  # `$` math
+    CITATION = 256  # `[1]` and `[Author2023]` citations
+    ALL = 511
+
+    names = {FENCE: "fence", QUOTE: "quote", BLOCKQUOTE: "blockquote", LIST: "list", FOOTNOTE: "footnote",
+             HEADER: "header", TABLE: "table", MATH: "math", CITATION: "citation"}
+    characters = ((FENCE, "```"), (QUOTE, '"'), (QUOTE, "'"), (BLOCKQUOTE, ">"), (FOOTNOTE, "[^"),
+                  (HEADER, "#"), (TABLE, "|"), (MATH, "$"))
+    # the patterns start with a literal, which the regex engine searches for quickly
+    list_item = re.compile(r"\n[ \t]*(?:-|\d+\.)")
+    list_after_code = re.compile(r"```[ \t]*(?:-|\d+\.)")  # a code block ends with a line break
+    citation = re.compile(r"\[(?:\d|[A-Za-z@]+\d{4})")  # `@@` is escaped as letters
+
+    @staticmethod
+    def scan(string: str) -> int:
+        """
+        build the feature bitmap of a markdown string. every test is a substring search
+        or a regex search that stops at the first match
+        :param string: the string representation of the markdown file
+        :return: the bitmap, an `or` of the `Features` bits
+        """
+        features = 0
+        for bit, token in Features.characters:
+            if not features & bit and token in string:
+                features |= bit
+        if (MDList.unordered_item.match(string) or MDList.ordered_item.match(string)
+                or Features.list_item.search(string)
+                or features & Features.FENCE and Features.list_after_code.search(string)):
+            features |= Features.LIST
+        if features & Features.FOOTNOTE:  # the pointers to missing notes are removed
+            string = MDReference.raw_pointer.sub("", string)
+        if Features.citation.search(string):
+            features |= Features.CITATION
+        return features
+
+    @staticmethod
+    def describe(features: int) -> str:
+        """
+        :return: the names of the features of a bitmap, for profiling output
+        """
+        return ", ".join(name for bit, name in Features.names.items() if features & bit) or "none"
+
+
+class Stages:
+    """
+    run the stages of a conversion: a stage needing a feature absent from the bitmap is
+    skipped. when `profile` is a list, every stage appends
+    `{"stage", "seconds", "skipped"}` to it, with `skipped` the name of the missing
+    feature (or None). the timings also go to the metrics, when they are enabled
+    """
+
+    def __init__(self, features: int, profile: Optional[List[Dict]] = None):
+        self.features = features
+        self.profile = profile
+        self.metrics = Metrics.enabled()
+
+    def __call__(self, name: str, needs: int, function: Callable, data, *args):
+        """
+        :param name: the name of the stage, for the profile
+        :param needs: the features the stage converts (0 if it always runs)
+        :param function: the stage, called as `function(data, *args)`
+        :return: the output of the stage, or `data` if it was skipped
+        """
+        if needs and not self.features & needs:
+            if self.profile is not None:
+                self.profile.append({"stage": name, "seconds": 0.0, "skipped": Features.describe(needs)})
+            if self.metrics:
+                Metrics.inc("md2x_stages_skipped", stage=name)
+            return data
+        if self.profile is None and not self.metrics:
+            return function(data, *args)
+        start = time.perf_counter()
+        data = function(data, *args)
+        seconds = time.perf_counter() - start
+        if self.profile is not None:
+            self.profile.append({"stage": name, "seconds": seconds, "skipped": None})
+        if self.metrics:
+            Metrics.observe("md2x_stage_duration_seconds", seconds, stage=name)
+        return data
+
+
+def convert_markdown(string: str, french_quote: bool = False, unnumbered: bool = False,
+                     document_class: str = "article", features: Optional[int] = None,
+                     profile: Optional[List[Dict]] = None, arxiv: bool = False,
+                     longtable_threshold: Optional[int] = None, labels: Optional[Set[str]] = None) -> str:
+    """
+    convert a markdown string to a TeX body (without preamble or template)
+    :param string: the string representation of the markdown file
+    :param french_quote: translate the quotes as french quotes (\\enquote{})
+                         or anglo-saxon quotes (``'')
+    :param unnumbered: convert headers to unnumbered sections
+    :param document_class: the class of the TeX document (`article`|`book`)
+    :param features: the feature bitmap of `string` (see `Features`). scanned if None;
+                     `Features.ALL` runs every stage
+    :param profile: optional. a list receiving the timing of every stage (see `Stages`)
+    :param arxiv: also convert the ArXiv constructs in the same pass: the math is kept
+                  verbatim, the tables and the citations are converted
+    :param longtable_threshold: see `ArxivTable.convert_tables()`
+    :param labels: optional. the labels of the headers of the previous parts of a document
+                   converted apart (see `MDHeader.shared_labels()`)
+    :return: the TeX representation of the markdown string
+    """
+    if features is None:
+        start = time.perf_counter()
+        features = Features.scan(string)
+        if profile is not None:
+            profile.append({"stage": "Features.scan", "seconds": time.perf_counter() - start, "skipped": None})
+    stage = Stages(features, profile)
+    data, codedict = block_stages(string, french_quote, stage, 0, arxiv, longtable_threshold)
+    data = stage("MDReference.footnote", Features.FOOTNOTE, MDReference.footnote, data)
+    return tex_stages(data, codedict, unnumbered, document_class, stage, arxiv, labels)
+
+
+def block_stages(string: str, french_quote: bool, stage: Stages, first_token: int = 0, arxiv: bool = False,
+                 longtable_threshold: Optional[int] = None) -> Tuple[str, Dict]:
+    """
+    the stages before the footnotes. their replacements are local to the top-level blocks
+    of the document, which can be converted apart (see `utils/parallel.py`)
+    :param stage: the runner of the stages
+    :param first_token: see `MDCleaner.prepare_markdown()`
+    :param arxiv: see `convert_markdown()`
+    :param longtable_threshold: see `ArxivTable.convert_tables()`
+    :return: the converted string and the dict of its code blocks
+    """
+    # complex replacements. the contents of code blocks must be interpreted verbatim;
+    # `block_code()` comes first so that they won't be changed by `prepare_markdown()`,
+    # which escapes special chars and removes the code envs from the pipeline.
+    # in ArXiv mode, the math is stored with the code blocks
+    verbatim = ArxivMath.protect_math if arxiv and stage.features & Features.MATH else None
+    data = stage("MDCode.block_code", Features.FENCE, MDCode.block_code, string)
+    data, codedict = stage("MDCleaner.prepare_markdown", 0, MDCleaner.prepare_markdown, data, first_token,
+                           verbatim)
+    data = stage("MDQuote.inline_quote", Features.QUOTE, MDQuote.inline_quote, data, french_quote)
+    data = stage("MDQuote.block_quote", Features.BLOCKQUOTE, MDQuote.block_quote, data)
+    data = stage("MDList.unordered_l", Features.LIST, MDList.unordered_l, data)
+    data = stage("MDList.ordered_l", Features.LIST, MDList.ordered_l, data)
+    if arxiv:  # before `MDSimple.convert()`, which turns the `|---|` rows into rules
+        data = stage("ArxivTable.convert_tables", Features.TABLE, ArxivTable.convert_tables, data,
+                     longtable_threshold)
+    return data, codedict
+
+
+def tex_stages(data: str, codedict: Dict, unnumbered: bool, document_class: str, stage: Stages,
+               arxiv: bool = False, labels: Optional[Set[str]] = None) -> str:
+    """
+    the stages after the footnotes, also local to the blocks of the document
+    :param data: the output of `block_stages()`, with its footnotes replaced
+    :param codedict: the dict of the code blocks of `data`
+    :param stage: the runner of the stages
+    :param arxiv: see `convert_markdown()`
+    :param labels: see `convert_markdown()`
+    :return: the TeX representation of the markdown string
+    """
+    data = stage("MDHeader.convert", Features.HEADER, MDHeader.convert, data, unnumbered, document_class, labels)
+
+    # "simple" replacements. simple_sub contains regexes as keys
+    # and values, facilitating the regex replacement
+    data = stage("MDSimple.convert", 0, MDSimple.convert, data)
+    if arxiv:  # after `MDSimple.convert()`: `[1](url)` is a link
+        data = stage("ArxivCitation.convert_citations", Features.CITATION, ArxivCitation.convert_citations, data)
+    # clean the tex file + reinject the escaped code blocks
+    data = stage("MDCleaner.clean_tex", 0, MDCleaner.clean_tex, data, codedict)
+    return data
@@ -0,0 +1,69 @@
+import os
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from .cache import cache_dir, text_digest
+from .split import split_markdown
+
+# ---------------------------------------------------------------
+# live preview for watch mode: the sections edited since the last
+# preview are compiled alone, with the preamble of the template,
+# while the full build of the document runs in the background
+# ---------------------------------------------------------------
+
+preview_level = 6  # every header starts a section: the preview shows the smallest edited part
+
+
+def preview_path(output_path: str) -> str:
+    """
+    the path of the preview PDF of an output: `paper.pdf` is previewed in `paper.preview.pdf`
+    """
+    return os.path.splitext(output_path)[0] + ".preview.pdf"
+
+
+def _snapshot(input_file: str) -> str:
+    return os.path.join(cache_dir("preview"), text_digest(os.path.abspath(input_file))[:24] + ".md")
+
+
+def load_snapshot(input_file: str) -> Optional[str]:
+    """
+    :return: the markdown of the last preview of a file, or None if it was never previewed
+    """
+    try:
+        with open(_snapshot(input_file), mode="r", encoding="utf-8") as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def save_snapshot(input_file: str, string: str):
+    """
+    record the markdown of a file once its preview is built: the next preview shows the
+    sections changed since then
+    """
+    target = _snapshot(input_file)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, mode="w", encoding="utf-8") as fh:
+        fh.write(string)
+    os.replace(tmp, target)  # atomic: a cancelled build never leaves a partial snapshot
+
+
+def changed_sections(previous: str, current: str, level: int = preview_level) -> List[Tuple[str, str]]:
+    """
+    find the sections of a document that changed (see `split_markdown()`). a section is
+    unchanged if the previous revision had a section with the same markdown: moving a
+    section, or adding and deleting sections elsewhere, doesn't make it changed; neither do
+    the blank lines around it.
+    :param previous: the previous revision of the markdown document
+    :param current: the current revision
+    :param level: the deepest header level that starts a section
+    :return: (name, markdown) for every changed section of `current`, in order
+    """
+    unchanged = Counter(markdown.strip() for _, markdown in split_markdown(previous, level))
+    changed = []
+    for name, markdown in split_markdown(current, level):
+        if unchanged[markdown.strip()]:
+            unchanged[markdown.strip()] -= 1
+        else:
+            changed.append((name, markdown))
+    return changed
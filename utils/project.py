@@ -0,0 +1,209 @@
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from .cache import file_digest, text_digest
+from .errors_warnings import InputException
+from .helpers import write_if_changed
+from .latex import latex_engine, latex_target
+from .metrics import run_process
+from .pipeline import convert_markdown
+from .reader import read_markdown
+
+# ---------------------------------------------------------------
+# multi-file (book) projects: a json manifest lists the chapters,
+# each chapter is converted to its own .tex file and a master file
+# `\include`s them
+# ---------------------------------------------------------------
+
+
+def _convert_chapter(source: str, target: str, french_quote: bool, unnumbered: bool,
+                     document_class: str) -> str:
+    """
+    convert a chapter and write it to its .tex file. module-level so that it can be
+    sent to worker processes.
+    :return: the path of the written .tex file
+    """
+    data = convert_markdown(read_markdown(source), french_quote, unnumbered, document_class)
+    write_if_changed(target, data)
+    return target
+
+
+class BookProject:
+    """
+    a book made of several markdown chapters, described by a json manifest:
+
+        {
+            "chapters": ["intro.md", "methods.md", "results.md"],
+            "document_class": "book",       # optional, defaults to `book`
+            "template": "book.tex",         # optional, defaults to `utils/template.tex`
+            "unnumbered": false,            # optional
+            "french_quote": false,          # optional
+            "output_dir": "build",          # optional, defaults to `{manifest name}_build`
+            "engine": "pdflatex"            # optional, the LaTeX engine used for PDF output (defaults
+                                            # to xelatex if the template loads fontspec, see `latex_engine()`)
+        }
+
+    paths are relative to the manifest. chapters are converted in parallel to
+    `{output_dir}/chapters/{name}.tex`, and only the chapters whose source (or the
+    conversion options) changed since the last build are reconverted. `master.tex`
+    is built from the template and `\\include`s every chapter.
+    """
+    state_file = ".md2x-project.json"  # hashes of the chapters converted by the last build
+    default_template = os.path.join(os.path.dirname(os.path.abspath(__file__)), "template.tex")
+
+    def __init__(self, manifest: str, output_dir: Optional[str] = None):
+        """
+        :param manifest: the path to the json manifest
+        :param output_dir: optional. overrides the `output_dir` of the manifest
+        """
+        if not os.path.isfile(manifest):
+            raise InputException("not_inpath", manifest)
+        with open(manifest, mode="r", encoding="utf-8") as fh:
+            try:
+                config = json.load(fh)
+            except ValueError:
+                raise InputException("project_manifest", manifest)
+        if not isinstance(config, dict) or not config.get("chapters"):
+            raise InputException("project_manifest", manifest)
+
+        root = os.path.dirname(os.path.abspath(manifest))
+        self.manifest = manifest
+        self.document_class = config.get("document_class", "book")
+        self.unnumbered = bool(config.get("unnumbered", False))
+        self.french_quote = bool(config.get("french_quote", False))
+        self.engine = config.get("engine")  # None: chosen from the template by `latex_engine()`
+        template = config.get("template")
+        self.template = os.path.join(root, template) if template else BookProject.default_template
+        self.output_dir = output_dir or os.path.join(
+            root, config.get("output_dir") or os.path.splitext(os.path.basename(manifest))[0] + "_build"
+        )
+
+        self.chapters = {}  # {chapter name: path to the markdown source}, in book order
+        for n, chapter in enumerate(config["chapters"], start=1):
+            source = os.path.join(root, chapter)
+            if not os.path.isfile(source):
+                raise InputException("not_inpath", source)
+            name = f"{n:02d}-" + re.sub(r"[^A-Za-z0-9_-]+", "-", os.path.splitext(os.path.basename(chapter))[0])
+            self.chapters[name] = source
+
+    def chapter_names(self, selection: List[str]) -> List[str]:
+        """
+        resolve a user selection of chapters to chapter names. a chapter can be
+        designated by its name (`02-methods`), its markdown file (`methods.md`)
+        or the stem of that file (`methods`).
+        """
+        names = []
+        for selected in selection:
+            for name, source in self.chapters.items():
+                if selected in (name, os.path.basename(source), os.path.splitext(os.path.basename(source))[0]):
+                    names.append(name)
+                    break
+            else:
+                raise InputException("project_chapter", selected)
+        return names
+
+    def _options_digest(self) -> str:
+        return text_digest(self.document_class, str(self.unnumbered), str(self.french_quote))
+
+    def build(self, jobs: Optional[int] = None, force: bool = False) -> List[str]:
+        """
+        convert the chapters that changed since the last build and write the master file
+        :param jobs: the number of worker processes. defaults to the number of CPUs
+        :param force: reconvert all chapters
+        :return: the names of the reconverted chapters
+        """
+        chapter_dir = os.path.join(self.output_dir, "chapters")
+        os.makedirs(chapter_dir, exist_ok=True)
+        state_path = os.path.join(self.output_dir, BookProject.state_file)
+        try:
+            with open(state_path, mode="r", encoding="utf-8") as fh:
+                state = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            state = {}
+
+        options = self._options_digest()
+        digests = {}
+        stale = []
+        for name, source in self.chapters.items():
+            digests[name] = text_digest(file_digest(source), options)
+            target = os.path.join(chapter_dir, f"{name}.tex")
+            if force or state.get(name) != digests[name] or not os.path.exists(target):
+                stale.append(name)
+
+        if len(stale) == 1 or jobs == 1:
+            for name in stale:
+                _convert_chapter(self.chapters[name], os.path.join(chapter_dir, f"{name}.tex"),
+                                 self.french_quote, self.unnumbered, self.document_class)
+        elif stale:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = [
+                    pool.submit(_convert_chapter, self.chapters[name], os.path.join(chapter_dir, f"{name}.tex"),
+                                self.french_quote, self.unnumbered, self.document_class)
+                    for name in stale
+                ]
+                for future in futures:
+                    future.result()  # propagate conversion errors
+
+        with open(state_path, mode="w", encoding="utf-8") as fh:
+            json.dump(digests, fh, indent=2)
+        self.write_master()
+        return stale
+
+    def master(self, include_only: Optional[List[str]] = None) -> str:
+        """
+        build the master file from the template: the body `\\include`s every chapter.
+        :param include_only: optional. the names of the chapters to typeset (`\\includeonly`);
+                             the other chapters keep their page and counter values from the
+                             last full compilation
+        :return: the string representation of the master file
+        """
+        try:
+            with open(self.template, mode="r", encoding="utf-8") as fh:
+                template = fh.read()
+        except FileNotFoundError:
+            raise InputException("not_template", self.template)
+        if "@@BODYTOKEN@@" not in template:
+            raise InputException("template_no_token", self.template)
+
+        body = "".join(f"\\include{{chapters/{name}}}\n" for name in self.chapters)
+        master = template.replace("@@BODYTOKEN@@", body).replace("@@DOCUMENTCLASSTOKEN@@", self.document_class)
+        if include_only:
+            master = master.replace(
+                "\\begin{document}",
+                "\\includeonly{" + ",".join(f"chapters/{name}" for name in include_only) + "}\n\\begin{document}",
+                1,
+            )
+        return master
+
+    def write_master(self, include_only: Optional[List[str]] = None, name: str = "master") -> str:
+        """
+        write the master file to the output directory, only if its contents changed
+        :return: the path of the master file
+        """
+        path = os.path.join(self.output_dir, f"{name}.tex")
+        write_if_changed(path, self.master(include_only))
+        return path
+
+    def compile(self, include_only: Optional[List[str]] = None, passes: int = 2) -> Optional[str]:
+        """
+        compile the master file to PDF in the output directory. the auxiliary files are
+        kept between builds, so that `\\includeonly` previews keep the numbering of the
+        chapters that are not typeset.
+        :param include_only: optional. the names of the chapters to typeset
+        :param passes: the number of LaTeX passes
+        :return: the path to the PDF, or None if it was not produced
+        """
+        name = "preview" if include_only else "master"
+        self.write_master(include_only, name)
+        engine = latex_engine(self.master(include_only), self.engine)
+        for n in range(passes):
+            step = "final" if n == passes - 1 else "draft"  # only the last pass writes the PDF
+            run_process(
+                [engine, "-interaction=nonstopmode"] + latex_target(name, step, engine),
+                cwd=self.output_dir, capture_output=True
+            )
+        pdf = os.path.join(self.output_dir, f"{name}.pdf")
+        return pdf if os.path.exists(pdf) else None
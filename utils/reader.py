@@ -0,0 +1,186 @@
+import bisect
+import codecs
+import mmap
+import os
+import re
+import sys
+from typing import Iterator, Tuple
+
+from .errors_warnings import Warnings
+
+# -----------------------------------------------
+# input layer: read markdown files through a
+# memory map instead of `open().read()`
+# -----------------------------------------------
+
+
+class MarkdownReader:
+    r"""
+    read a markdown file through a memory map.
+
+    the encoding is detected once, from the byte order mark (utf-8 if there is none).
+    `read()` decodes the whole file straight from the mapping, without the intermediate
+    `bytes` copy made by `open().read()`. `slices()` decodes the file incrementally
+    into line-aligned slices for the stages that can work on parts of a document; the
+    pages already decoded are released, so only about one slice of the file is resident
+    at a time. `blocks()` regroups the slices at blank lines outside the code blocks, for
+    the block-level consumers (the DOCX writer). in every case, line breaks are
+    normalized to `\n` as in text mode.
+    """
+    slice_size = 1 << 22  # number of bytes decoded at once by `slices()`
+    boms = (
+        (codecs.BOM_UTF32_LE, "utf-32-le"),
+        (codecs.BOM_UTF32_BE, "utf-32-be"),
+        (codecs.BOM_UTF8, "utf-8"),
+        (codecs.BOM_UTF16_LE, "utf-16-le"),
+        (codecs.BOM_UTF16_BE, "utf-16-be"),
+    )  # longest first: the utf-32-le BOM starts with the utf-16-le one
+
+    def __init__(self, path: str):
+        """
+        :param path: the path to the markdown file
+        """
+        self.path = path
+        with open(path, mode="rb") as fh:
+            self.encoding, self.bom_length = MarkdownReader.detect(fh.read(4))
+
+    @staticmethod
+    def detect(head: bytes) -> Tuple[str, int]:
+        """
+        detect the encoding of a file from its first bytes
+        :param head: the first 4 bytes of the file
+        :return: the encoding and the length of the byte order mark to skip
+        """
+        for bom, encoding in MarkdownReader.boms:
+            if head.startswith(bom):
+                return encoding, len(bom)
+        return "utf-8", 0
+
+    @staticmethod
+    def decode(data: bytes, name: str = "<stdin>") -> str:
+        """
+        decode markdown read from a stream, as `read()` decodes a file
+        :param data: the bytes of the document
+        :param name: the name of the stream, for the encoding warning
+        :return: the string representation of the markdown document
+        """
+        encoding, bom_length = MarkdownReader.detect(data[:4])
+        try:
+            string = str(data[bom_length:], encoding)
+        except UnicodeDecodeError:
+            Warnings("input_encoding", name)
+            string = str(data[bom_length:], "latin-1")
+        return MarkdownReader._newlines(string)
+
+    def read(self) -> str:
+        """
+        decode the whole file. if the file is not valid utf-8 and has no byte
+        order mark, it is decoded as latin-1 and a warning is displayed.
+        :return: the string representation of the markdown file
+        """
+        with open(self.path, mode="rb") as fh:
+            if os.fstat(fh.fileno()).st_size <= self.bom_length:
+                return ""
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)[self.bom_length:]
+                try:
+                    try:
+                        string = str(view, self.encoding)
+                    except UnicodeDecodeError:
+                        Warnings("input_encoding", self.path)
+                        self.encoding = "latin-1"
+                        string = str(view, self.encoding)
+                finally:
+                    view.release()
+                    MarkdownReader._release(mm, 0, len(mm))
+        return MarkdownReader._newlines(string)
+
+    def slices(self) -> Iterator[str]:
+        """
+        decode the file incrementally.
+        :return: an iterator over line-aligned slices of the file: every slice but the
+                 last ends with a line break, and joining the slices gives `read()`.
+        """
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        with open(self.path, mode="rb") as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if size <= self.bom_length:
+                return
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                carry = ""
+                for start in range(self.bom_length, size, MarkdownReader.slice_size):
+                    end = min(start + MarkdownReader.slice_size, size)
+                    carry += decoder.decode(mm[start:end], end == size)
+                    MarkdownReader._release(mm, start, end)
+                    cut = carry.rfind("\n") + 1
+                    if cut:
+                        yield MarkdownReader._newlines(carry[:cut])
+                        carry = carry[cut:]
+                if carry:
+                    yield MarkdownReader._newlines(carry)
+
+    def blocks(self) -> Iterator[str]:
+        """
+        decode the file incrementally, as `slices()`, in blocks cut after an empty line
+        outside the code blocks (paired as `MDHeader.fence` pairs them: the n-th ``` opens
+        a block when n is odd). a list, quote, table, paragraph or footnote definition
+        never runs over an empty line, so every block can be converted on its own. a
+        code block is never cut: an unclosed ``` makes the rest of the file one block.
+        :return: an iterator over the blocks: joining them gives `read()`
+        """
+        pending = ""  # the text after the last cut, which starts outside the code blocks
+        for piece in self.slices():
+            pending += piece
+            cut = MarkdownReader._last_cut(pending)
+            if cut:
+                yield pending[:cut]
+                pending = pending[cut:]
+        if pending:
+            yield pending
+
+    @staticmethod
+    def _last_cut(string: str) -> int:
+        """
+        the end of the last empty line of a string that starts outside the code blocks,
+        with an even number of ``` before it; 0 if there is none
+        """
+        fences = [m.start() for m in re.finditer("```", string)] if "```" in string else []
+        blank = string.rfind("\n\n")
+        while blank != -1:
+            n = bisect.bisect_left(fences, blank)  # ``` never spans a line break
+            if n % 2 == 0:
+                return blank + 2
+            blank = string.rfind("\n\n", 0, fences[n - 1])  # before the ``` that opens the block
+        return 0
+
+    @staticmethod
+    def _release(mm: mmap.mmap, start: int, end: int):
+        """
+        tell the kernel that the pages of `mm` between `start` and `end` won't be read
+        again, so that they stop counting in the resident memory of the process
+        """
+        if not hasattr(mm, "madvise") or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        start -= start % mmap.PAGESIZE  # madvise needs a page-aligned start
+        if end > start:
+            mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+    @staticmethod
+    def _newlines(string: str) -> str:
+        r"""
+        normalize `\r\n` and `\r` line breaks to `\n`, as files opened in text mode do
+        """
+        if "\r" in string:
+            string = string.replace("\r\n", "\n").replace("\r", "\n")
+        return string
+
+
+def read_markdown(path: str) -> str:
+    """
+    read a markdown file with `MarkdownReader`
+    :param path: the path to the markdown file, or `-` for the standard input
+    :return: the string representation of the markdown file
+    """
+    if path == "-":
+        return MarkdownReader.decode(sys.stdin.buffer.read())
+    return MarkdownReader(path).read()
@@ -0,0 +1,182 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .cache import cache_dir, file_digest, text_digest
+from .converters import MDHeader, MDReference
+from .helpers import copy_if_changed, write_if_changed
+from .metrics import Metrics
+from .pipeline import convert_markdown
+
+# ---------------------------------------------------------------
+# split output: a document is cut at a header level, its sections
+# are converted in parallel to their own .tex files and the body
+# of the master file `\input`s them in order
+# ---------------------------------------------------------------
+
+section_dir = "md2x-sections"  # the directory of the section files, next to the master file
+section_manifest = ".manifest"  # the names of the section files written there, one per line
+code_modules = ("converters.py", "pipeline.py", "helpers.py", "minted.py")  # the conversion code
+code_digests = {}  # {"": digest of `code_modules`}, computed once per process
+
+
+def _code_digest() -> str:
+    """
+    the digest of the conversion code: cached sections are converted again after an update
+    """
+    if "" not in code_digests:
+        root = os.path.dirname(os.path.abspath(__file__))
+        code_digests[""] = text_digest(*(file_digest(os.path.join(root, m)) for m in code_modules))
+    return code_digests[""]
+
+
+def split_markdown(string: str, level: int, duplicates: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    r"""
+    cut a markdown document before every header of `level` or above (`#` is level 1).
+
+    footnotes are pointers to definitions that can be anywhere in the document, often at
+    its end. the definitions are moved to the sections that point to them (the first
+    definition of a note wins, as in `MDReference.footnote()`), so that every section is
+    converted on its own and LaTeX numbers the `\footnote{}`s across the sections.
+    :param string: the string representation of the markdown file
+    :param level: the deepest header level that starts a section
+    :param duplicates: optional. a list receiving the n° of the footnotes defined more than
+                       once, whose other definitions are removed
+    :return: (name, markdown) for every section, in order. the text before the first
+             section, if any, is named `00-front`
+    """
+    headings = [h for h in MDHeader.index(string, escaped=False) if h["level"] <= level]
+    fences = MDHeader.fence.finditer(string)  # the definitions in code blocks are code
+    fence = next(fences, None)
+    notes = {}  # {footnote n°: its first definition}
+    definitions = []
+    for key, start, end in MDReference.definitions(string, escaped=False):
+        while fence is not None and fence.end() <= start:
+            fence = next(fences, None)
+        if fence is None or start < fence.start():
+            definitions.append((start, end))
+            if key in notes:
+                if duplicates is not None:
+                    duplicates.append(key)
+            else:
+                notes[key] = string[start:end].rstrip("\n")
+
+    bounds = [0] + [h["offset"] for h in headings] + [len(string)]
+    names = ["00-front"] + [f"{n:02d}-" + h["label"][len("sec:"):][:40] for n, h in enumerate(headings, start=1)]
+    sections = []
+    d = 0
+    for name, start, end in zip(names, bounds, bounds[1:]):
+        parts = []
+        prev = start
+        while d < len(definitions) and definitions[d][0] < end:  # remove the definitions
+            parts.append(string[prev:definitions[d][0]])
+            prev = min(max(prev, definitions[d][1]), end)
+            d += 1
+        parts.append(string[prev:end])
+        markdown = "".join(parts)
+        if name == "00-front" and not markdown.strip():
+            continue
+        keys = dict.fromkeys(m[1] for m in MDReference.raw_pointer.finditer(markdown) if m[1] in notes)
+        if keys:
+            markdown = markdown.rstrip("\n") + "\n\n" + "\n\n".join(notes[k] for k in keys) + "\n"
+        sections.append((name, markdown))
+    return sections
+
+
+def _convert_section(markdown: str, target: str, french_quote: bool, unnumbered: bool,
+                     document_class: str, labels: List[str]) -> str:
+    """
+    convert a section to its cache file. module-level so that it can be sent to worker processes.
+    :param labels: the labels of the headers of the previous sections (see `MDHeader.shared_labels()`)
+    :return: the path of the written .tex file
+    """
+    data = convert_markdown(markdown, french_quote, unnumbered, document_class, labels=set(labels))
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, mode="w", encoding="utf-8") as fh:
+        fh.write(data)
+    os.replace(tmp, target)  # atomic: a concurrent build never reads a partial section
+    return target
+
+
+def convert_split(string: str, level: int, french_quote: bool = False, unnumbered: bool = False,
+                  document_class: str = "article", jobs: Optional[int] = None) -> Tuple[str, Dict[str, str]]:
+    r"""
+    convert a markdown document section by section (see `split_markdown()`). the sections
+    are converted in parallel, and cached by content in the `sections` cache directory:
+    only the sections that changed are converted again.
+    :param string: the string representation of the markdown file
+    :param level: the deepest header level that starts a section
+    :param french_quote: see `convert_markdown()`
+    :param unnumbered: see `convert_markdown()`
+    :param document_class: see `convert_markdown()`
+    :param jobs: the number of worker processes. defaults to the number of CPUs
+    :return: the body of the master file, which `\input`s the sections, and
+             {path of a section file relative to the master file: its cache file}
+    """
+    cache = cache_dir("sections")
+    options = (str(french_quote), str(unnumbered), document_class, _code_digest())
+    files = {}
+    stale = {}  # {cache file: arguments of `_convert_section()`}
+    body = []
+    duplicates = []
+    sections = split_markdown(string, level, duplicates)
+    MDReference.warn_duplicates(duplicates)
+    shared = MDHeader.shared_labels([[h["text"] for h in MDHeader.index(markdown, escaped=False)]
+                                     for _, markdown in sections])  # numbered across the sections
+    for (name, markdown), labels in zip(sections, shared):
+        labels = sorted(labels)
+        target = os.path.join(cache, text_digest(markdown, *options, *labels)[:24] + ".tex")
+        files[f"{section_dir}/{name}.tex"] = target
+        body.append(f"\\input{{{section_dir}/{name}}}\n")
+        hit = os.path.exists(target)
+        Metrics.cache("sections", hit)
+        if not hit:
+            stale[target] = (markdown, target, french_quote, unnumbered, document_class, labels)
+    stale = list(stale.values())
+
+    if len(stale) == 1 or jobs == 1:
+        for args in stale:
+            _convert_section(*args)
+    elif stale:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for future in [pool.submit(_convert_section, *args) for args in stale]:
+                future.result()  # propagate conversion errors
+    return "".join(body), files
+
+
+def remove_stale_sections(dest_dir: str, files: Dict[str, str]):
+    """
+    delete the section files of a previous split that are not part of the current one, and
+    record the current ones. only the files listed in the manifest of the directory, which
+    md2x wrote itself, are deleted: the other files of the directory are left untouched
+    :param dest_dir: the directory of the master file
+    :param files: the section files of the current split (see `convert_split()`)
+    """
+    directory = os.path.join(dest_dir, section_dir)
+    if not os.path.isdir(directory):
+        return
+    manifest = os.path.join(directory, section_manifest)
+    current = [os.path.basename(relpath) for relpath in files]
+    try:
+        with open(manifest, mode="r", encoding="utf-8") as fh:
+            previous = fh.read().split("\n")
+    except FileNotFoundError:
+        previous = []
+    for name in previous:
+        path = os.path.join(directory, name)
+        if name.endswith(".tex") and name not in current and os.path.basename(name) == name \
+                and os.path.isfile(path):
+            os.remove(path)
+    write_if_changed(manifest, "".join(f"{name}\n" for name in current))
+
+
+def stage_sections(dest_dir: str, files: Dict[str, str]):
+    """
+    copy the section files from the cache next to the master file, only if they changed,
+    and delete the section files of a previous split
+    """
+    for relpath, source in files.items():
+        target = os.path.join(dest_dir, relpath)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        copy_if_changed(source, target)
+    remove_stale_sections(dest_dir, files)
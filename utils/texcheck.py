@@ -0,0 +1,121 @@
+import bisect
+import re
+from typing import Dict, List
+
+# ---------------------------------------------------------------
+# structural validation of a generated TeX document, in a single
+# pass and without LaTeX: PDF builds fail on unbalanced braces,
+# mismatched environments and leftover tokens before pdflatex runs
+# ---------------------------------------------------------------
+
+verbatim_envs = {"verbatim", "verbatim*", "Verbatim", "lstlisting", "minted", "comment"}  # read raw by LaTeX
+# the constructs of the scan: environments, `\verb`, commands and control symbols, braces,
+# comments, and the tokens of the pipeline that a conversion must have replaced
+scanner = re.compile(r"\\(?P<env>begin|end)[ \t]*\{(?P<name>[^{}\n]*)\}|\\(?P<verb>verb\*?|lstinline)(?![A-Za-z])"
+                     r"|\\(?:[A-Za-z@]+|.)|[{}%]|(?P<token>@@(?:CODETOKEN|TABLEINCLUDE)\d+@@|USERRESERVEDTOKEN)",
+                     flags=re.S)
+
+
+def _diagnostic(tex: str, lines: List[int], pos: int, message: str, name: str) -> Dict:
+    """
+    an error at an offset of the document, in the format of `LatexLog`, with its column
+    :param lines: the offsets of the line breaks of `tex`
+    """
+    line = bisect.bisect_right(lines, pos - 1)  # the number of line breaks before `pos`
+    column = pos - (lines[line - 1] + 1 if line else 0)
+    return {"level": "error", "file": f"{name}.tex", "line": line + 1, "column": column + 1, "message": message}
+
+
+def check_tex(tex: str, name: str = "document") -> List[Dict]:
+    r"""
+    check the structure of a TeX document in one linear scan:
+    - every `{` is closed by a `}`, and no `}` closes a group that was not opened
+    - every `\begin{env}` is closed by the matching `\end{env}`. in a full document, only the
+      body (from `\begin{document}`) is checked: the preamble defines environments with
+      unbalanced `\begin`s, as in `\newenvironment{box}{\begin{center}}{\end{center}}`
+    - no `@@CODETOKEN@@`, `@@TABLEINCLUDE@@` or `USERRESERVEDTOKEN` is left by the conversion.
+      the arguments of `\texttt{}` and `\lstinline{}` are inline code, where the user may
+      have written these tokens: they are not reported there
+    comments, escaped characters (`\{`, `\%`), `\verb` and verbatim environments
+    (`lstlisting`, `minted`...) are skipped.
+    :param tex: the string representation of the TeX document
+    :param name: the name of the document, without extension, for the diagnostics
+    :return: the errors, as `{"level", "file", "line", "column", "message"}` (see `LatexLog`)
+    """
+    lines = [m.start() for m in re.finditer("\n", tex)]
+    errors = []
+    groups = []  # the offsets of the open braces
+    code = []  # for each open brace, whether it is in inline code (`\texttt{}`, `\lstinline{}`)
+    code_next = False  # whether the next brace opens inline code
+    envs = []  # (name, offset) of the open environments
+    checked = "\\begin{document}" not in tex  # whether the environments are checked
+    pos = 0
+    while True:
+        match = scanner.search(tex, pos)
+        if match is None:
+            break
+        pos = match.end()
+        text = match[0]
+        if text == "{":
+            groups.append(match.start())
+            code.append(code_next or bool(code and code[-1]))
+            code_next = False
+        elif text == "}":
+            if groups:
+                groups.pop()
+                code.pop()
+            else:
+                errors.append(_diagnostic(tex, lines, match.start(), "`}` closes no group", name))
+        elif text == "%":
+            end = tex.find("\n", pos)
+            pos = len(tex) if end == -1 else end
+        elif match["verb"]:  # the text up to the next delimiter is raw
+            if pos < len(tex) and tex[pos] not in "{ \n":
+                end = tex.find(tex[pos], pos + 1)
+                if end == -1:
+                    errors.append(_diagnostic(tex, lines, match.start(), f"unclosed `\\{match['verb']}`", name))
+                    break
+                pos = end + 1
+            else:  # `\lstinline{...}`
+                code_next = tex.startswith("{", pos)
+        elif text == "\\texttt":
+            code_next = tex.startswith("{", pos)
+        elif match["token"]:
+            if code and code[-1]:
+                continue
+            errors.append(_diagnostic(tex, lines, match.start(), f"leftover `{match['token']}`", name))
+        elif match["env"] == "begin":
+            env = match["name"].strip()
+            if env in verbatim_envs:
+                end = tex.find(f"\\end{{{env}}}", pos)
+                if end == -1:
+                    errors.append(_diagnostic(tex, lines, match.start(), f"`\\begin{{{env}}}` is never closed",
+                                              name))
+                    break
+                pos = end + len(env) + 6
+            elif env == "document":
+                checked = True
+                envs.append((env, match.start()))
+            elif checked:
+                envs.append((env, match.start()))
+        elif match["env"] == "end" and checked:
+            env = match["name"].strip()
+            if not envs:
+                errors.append(_diagnostic(tex, lines, match.start(), f"`\\end{{{env}}}` closes no environment",
+                                          name))
+            elif envs[-1][0] != env:
+                opened, start = envs[-1]
+                line = _diagnostic(tex, lines, start, "", name)["line"]
+                errors.append(_diagnostic(tex, lines, match.start(),
+                                          f"`\\end{{{env}}}` closes `\\begin{{{opened}}}` of line {line}", name))
+                if any(e == env for e, _ in envs):  # the inner environments were left open
+                    while envs.pop()[0] != env:
+                        pass
+            else:
+                envs.pop()
+    for start in groups:
+        errors.append(_diagnostic(tex, lines, start, "`{` is never closed", name))
+    for env, start in envs:
+        errors.append(_diagnostic(tex, lines, start, f"`\\begin{{{env}}}` is never closed", name))
+    errors.sort(key=lambda d: (d["line"], d["column"]))
+    return errors
@@ -0,0 +1,134 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Callable, Optional
+
+# ---------------------------------------------------------------
+# watch mode: file events are coalesced by a scheduler, which
+# runs every build in a child process so that a newer change can
+# kill a build in flight, with its pdflatex or pandoc runs
+# ---------------------------------------------------------------
+
+
+def _run_build(build: Callable[[], object], niceness: int = 0):
+    """
+    the body of a build process: it leads its own process group, so that the engines
+    it starts are killed with it
+    """
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+    build()
+
+
+class RebuildScheduler:
+    """
+    run builds after bursts of file events.
+
+    `notify()` is called from the file observer for every event. once no event arrived
+    for `delay` seconds, the scheduler's worker thread runs `build` in a child process.
+    an event arriving while a build runs kills that build (its whole process group) and
+    starts the debounce again: only the latest revision of the file is built.
+    """
+
+    def __init__(self, build: Callable[[], object], delay: float = 0.3,
+                 on_cancel: Optional[Callable[[], object]] = None, niceness: int = 0):
+        """
+        :param build: a picklable callable running one build
+        :param delay: the quiet time after the last event before a build starts, in seconds
+        :param on_cancel: optional. called when a build is killed by a newer change
+        :param niceness: the increment of the niceness of the build processes
+        """
+        self.build = build
+        self.delay = delay
+        self.on_cancel = on_cancel
+        self.niceness = niceness
+        self.builds = 0  # the number of builds started
+        self.cancelled = 0  # the number of builds killed by a newer change
+        self._condition = threading.Condition()
+        self._pending = False
+        self._last_event = 0.0
+        self._stopped = False
+        self._process = None
+        self._thread = threading.Thread(target=self._run, name="md2x-rebuild", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def notify(self):
+        """
+        record a change. safe to call from any thread
+        """
+        with self._condition:
+            self._pending = True
+            self._last_event = time.monotonic()
+            self._condition.notify_all()
+
+    def stop(self):
+        """
+        stop the scheduler, killing the build in flight
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def idle(self) -> bool:
+        """
+        whether no build is running or waiting to run
+        """
+        with self._condition:
+            return not self._pending and self._process is None
+
+    def _wait_for_quiet(self) -> bool:
+        """
+        wait for a change, then for `delay` seconds without events
+        :return: False if the scheduler was stopped
+        """
+        with self._condition:
+            while not self._pending and not self._stopped:
+                self._condition.wait()
+            while not self._stopped:
+                remaining = self._last_event + self.delay - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            self._pending = False
+            return not self._stopped
+
+    def _kill(self, process: multiprocessing.Process):
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except (ProcessLookupError, PermissionError):
+            process.kill()  # the group is not set yet: kill the process alone
+        process.join()
+
+    def _run(self):
+        while self._wait_for_quiet():
+            # not a daemon: a build may start process pools (`--split`, `--parallel`, images);
+            # `stop()` kills and joins it
+            process = multiprocessing.Process(target=_run_build, args=(self.build, self.niceness))
+            with self._condition:
+                self._process = process
+            process.start()
+            self.builds += 1
+            while True:
+                process.join(0.05)
+                if not process.is_alive():
+                    break
+                with self._condition:
+                    interrupted = self._pending or self._stopped
+                if interrupted:  # a newer revision: this build is obsolete
+                    self._kill(process)
+                    self.cancelled += 1
+                    if self.on_cancel and not self._stopped:
+                        self.on_cancel()
+                    break
+            with self._condition:
+                self._process = None